@@ -0,0 +1,66 @@
+"""Benchmark DynamicCodeManager.add_function as the registry grows.
+
+Works on a temporary copy of wordpress_api.py and reports how long adding
+the 1st, 10th, 100th, ... function takes, so any growth with registry size
+is easy to spot.
+
+    python benchmarks/bench_add_function.py --functions 500
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from code_manager import DynamicCodeManager  # noqa: E402
+
+FUNCTION_TEMPLATE = '''def get_widget_{i}(self, widget_id: int) -> Dict[str, Any]:
+    """Get widget {i} by its ID"""
+    response = self.get(f'wp/v2/sidebars/sidebar-{i}/widgets/{{widget_id}}')
+    response.raise_for_status()
+    return response.json()
+'''
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='bench_add_function_')
+    try:
+        filename = os.path.join(workdir, 'wordpress_api_bench.py')
+        shutil.copy(os.path.join(ROOT, 'wordpress_api.py'), filename)
+        sys.path.insert(0, workdir)
+        manager = DynamicCodeManager(filename=filename)
+
+        timings = []
+        for i in range(1, args.functions + 1):
+            start = time.perf_counter()
+            _, created = manager.add_function(FUNCTION_TEMPLATE.format(i=i))
+            if not created:
+                raise RuntimeError(f'add_function did not add function {i}')
+            timings.append((time.perf_counter() - start) * 1000)
+
+        checkpoints = sorted({1, 10, 100, args.functions} & set(range(1, args.functions + 1)))
+        return {
+            'functions': args.functions,
+            'add_ms': {str(n): timings[n - 1] for n in checkpoints},
+            'first_10_mean_ms': sum(timings[:10]) / len(timings[:10]),
+            'last_10_mean_ms': sum(timings[-10:]) / len(timings[-10:]),
+            'file_bytes': os.path.getsize(filename),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--functions', type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""Benchmark /api/chat end to end against the stub WordPress and a fake Anthropic client.
+
+Runs each scenario at several concurrency levels and reports throughput
+and p50/p95/p99 latency as JSON:
+
+    match     "list my pages" resolves locally to a page listing function and lists the stub's pages
+    generate  a request no function covers: scripted MATCH: none, scripted code,
+              add_function, then executing the new function
+    fail      resolves to a pre-registered function whose route 404s
+
+The service runs in-process over ASGI, but on a scratch copy of
+wordpress_api.py and a scratch generation cache, so runs do not modify the
+tree and do not depend on each other. Each response is checked against the
+path its scenario should take; any that took another path are counted as
+"unexpected".
+
+    python benchmarks/bench_chat.py --concurrency 1 8 32 --requests 200 --output results.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+
+from bench_matcher import percentile  # noqa: E402
+from fake_anthropic import FakeAnthropic, ScriptedResponder  # noqa: E402
+from stub_wordpress import start_server  # noqa: E402
+
+SCENARIOS = ['match', 'generate', 'fail']
+
+# Reply prefix main.chat produces on each scenario's intended path
+EXPECTED_REPLY = {
+    'match': "I found an existing function (",
+    'generate': "I've created and executed a new function",
+    'fail': "I found a matching function but encountered an error",
+}
+
+BROKEN_FUNCTION = '''def fetch_broken_route(self) -> Dict[str, Any]:
+    """Fetch the broken route, which does not exist on the site"""
+    response = self.get('wp/v2/broken-route/missing')
+    response.raise_for_status()
+    return response.json()'''
+
+# Bodies differ per word, so add_function registers each one instead of reusing the first
+GENERATED_TEMPLATE = '''def report_{word}(self, fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Report posts about {word}"""
+    return self.iter_collection('wp/v2/posts', params={{'search': '{word}'}}, fields=fields)'''
+
+# Letters for unique request words; no 's' so the matcher's stemming leaves them alone
+_LETTERS = 'bcdfghjklmnpqrtvwxz'
+
+
+def unique_word(n: int) -> str:
+    """A word the function index has never seen, so matching falls through to Claude"""
+    word = ''
+    while True:
+        n, digit = divmod(n, len(_LETTERS))
+        word = _LETTERS[digit] + word
+        if n == 0:
+            return 'zq' + word
+
+
+def responder() -> ScriptedResponder:
+    return ScriptedResponder([
+        (r'Your task is to create a Python function.*?please (?P<word>zq[a-z]+)', GENERATED_TEMPLATE),
+        (r'Given this user request: "[^"]*broken route', "MATCH: fetch_broken_route\nREASON: scripted"),
+    ])
+
+
+class RequestFactory:
+    """Chat messages per scenario; generate requests never repeat across levels"""
+
+    def __init__(self):
+        self.generated = 0
+
+    def message(self, scenario: str) -> str:
+        if scenario == 'match':
+            return 'list my pages'
+        if scenario == 'fail':
+            return 'fetch the broken route'
+        self.generated += 1
+        return f'please {unique_word(self.generated)}'
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_workdir() -> str:
+    """Scratch directory holding the files the service writes to"""
+    workdir = tempfile.mkdtemp(prefix='bench_chat_')
+    shutil.copy(os.path.join(ROOT, 'wordpress_api.py'), workdir)
+    os.symlink(os.path.join(ROOT, 'static'), os.path.join(workdir, 'static'))
+    return workdir
+
+
+async def run_level(client, factory, scenario, concurrency, requests):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors, unexpected = [], 0, 0
+
+    async def one():
+        nonlocal errors, unexpected
+        payload = {'messages': [{'role': 'user', 'content': factory.message(scenario)}]}
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post('/api/chat', json=payload)
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            errors += 1
+        elif not response.json().get('content', '').startswith(EXPECTED_REPLY[scenario]):
+            unexpected += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall = time.perf_counter() - start
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': errors,
+        'unexpected': unexpected,
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(requests / wall, 2) if wall else None,
+        'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+    }
+
+
+async def run(args):
+    started_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    server, url = start_server(latency=args.wp_latency, items=args.items, content_bytes=args.content_bytes)
+    workdir = prepare_workdir()
+    os.environ.update({'WP_URL': url, 'WP_USERNAME': 'bench', 'WP_APP_PASSWORD': 'bench',
+                       'ANTHROPIC_API_KEY': 'unused',
+                       'GENERATION_CACHE_PATH': os.path.join(workdir, 'generation_cache.jsonl')})
+    os.environ.pop('WP_MIRROR_PATH', None)
+    os.chdir(workdir)
+    sys.path[:0] = [workdir, ROOT]
+    try:
+        import main
+        logging.getLogger().setLevel(args.log_level)
+
+        fake = FakeAnthropic(responder(), delay=args.llm_delay, chunk_delay=args.llm_chunk_delay)
+        main.llm_scheduler.client = fake
+        name, _ = main.code_manager.add_function(BROKEN_FUNCTION)
+        if not name:
+            raise RuntimeError('Could not register the failing function')
+
+        factory = RequestFactory()
+        results = []
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+            for scenario in args.scenarios:
+                # One untimed request per scenario warms caches and connection pools
+                await run_level(client, factory, scenario, 1, 1)
+                for concurrency in args.concurrency:
+                    results.append(await run_level(client, factory, scenario, concurrency, args.requests))
+        await main.wp_api.aclose()
+        if main.sandbox is not None:
+            await main.sandbox.shutdown()
+        main.executor.shutdown(wait=False)
+        return {
+            'started_at': started_at,
+            'revision': git_revision(),
+            'settings': {
+                'wp_latency_s': args.wp_latency,
+                'items': args.items,
+                'content_bytes': args.content_bytes,
+                'llm_delay_s': args.llm_delay,
+                'llm_chunk_delay_s': args.llm_chunk_delay,
+                'executor_threads': main.executor.max_workers,
+                'sandbox_workers': main.sandbox.workers if main.sandbox is not None else 0,
+            },
+            'results': results,
+            'llm_calls': fake.stats(),
+            'wordpress_requests': server.stats['requests'],
+            'match_stats': main.code_manager.match_stats,
+            'llm_scheduler': main.llm_scheduler.stats(),
+            'validation': main.code_manager.validator.stats(),
+        }
+    finally:
+        server.shutdown()
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--requests', type=int, default=100, help='requests per scenario and concurrency level')
+    parser.add_argument('--wp-latency', type=float, default=0.02, help='stub WordPress delay in seconds')
+    parser.add_argument('--items', type=int, default=250, help='items per stub collection')
+    parser.add_argument('--content-bytes', type=int, default=2000, help='size of each rendered item body')
+    parser.add_argument('--llm-delay', type=float, default=0.2, help='fake Claude time to first token')
+    parser.add_argument('--llm-chunk-delay', type=float, default=0.0, help='fake Claude delay between chunks')
+    parser.add_argument('--log-level', default='CRITICAL', help='the failing scenario logs an error per request')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark the Claude call scheduler under a burst that exceeds the rate limit.
+
+Fires a burst of match calls, with a generation for every few of them,
+at a fake Anthropic client that allows `--limit` requests per
+`--window` seconds and overloads now and then. It runs the burst once
+straight against the client and once through LLMScheduler, and reports
+successes, failures, drops, latency per purpose and the deepest the
+queue got.
+
+    python benchmarks/bench_llm_scheduler.py --calls 200 --limit 20 --window 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_matcher import percentile  # noqa: E402
+from fake_anthropic import FakeAnthropic  # noqa: E402
+from llm_scheduler import LLMScheduler  # noqa: E402
+
+
+def call_kwargs(purpose: str) -> dict:
+    if purpose == 'match':
+        return {'model': 'match', 'max_tokens': 1024,
+                'messages': [{'role': 'user', 'content': 'Which function lists pages? ' * 40}]}
+    return {'model': 'generate', 'max_tokens': 4096,
+            'messages': [{'role': 'user', 'content': 'Write a function that lists widgets. ' * 80}]}
+
+
+async def burst(clients: dict, args) -> dict:
+    outcomes = {purpose: {'ok': 0, 'failed': 0, 'latencies': []} for purpose in clients}
+    peak_depth = 0
+
+    async def one(purpose: str):
+        start = time.perf_counter()
+        try:
+            await clients[purpose].messages.create(**call_kwargs(purpose))
+            outcomes[purpose]['ok'] += 1
+            outcomes[purpose]['latencies'].append(time.perf_counter() - start)
+        except Exception:
+            outcomes[purpose]['failed'] += 1
+
+    tasks = []
+    for i in range(args.calls):
+        purpose = 'generate' if i % args.generate_every == args.generate_every - 1 else 'match'
+        tasks.append(asyncio.ensure_future(one(purpose)))
+    while not all(task.done() for task in tasks):
+        scheduler = getattr(clients['match'].messages, 'scheduler', None)
+        if scheduler is not None:
+            peak_depth = max(peak_depth, sum(scheduler.stats()['queue_depth'].values()))
+        await asyncio.sleep(0.01)
+
+    report = {}
+    for purpose, outcome in outcomes.items():
+        latencies = outcome['latencies']
+        report[purpose] = {
+            'ok': outcome['ok'],
+            'failed': outcome['failed'],
+            'p50_s': round(percentile(latencies, 50), 3) if latencies else None,
+            'p99_s': round(percentile(latencies, 99), 3) if latencies else None,
+        }
+    report['peak_queue_depth'] = peak_depth
+    return report
+
+
+async def run(args):
+    def fake():
+        return FakeAnthropic(lambda text: 'MATCH: none', delay=args.llm_delay,
+                             rate_limit=(args.limit, args.window), overload_rate=args.overload_rate)
+
+    direct = fake()
+    direct_report = await burst({'match': direct, 'generate': direct}, args)
+    direct_report['client'] = direct.stats()
+
+    scheduled = fake()
+    # Leave a little headroom under the client's limit, as one would in production
+    scheduler = LLMScheduler(scheduled, requests_per_minute=args.limit * 60 / args.window * 0.9,
+                             max_concurrency=args.concurrency, burst_seconds=args.window, backoff_base=0.05,
+                             max_wait={'match': args.max_wait, 'generate': args.max_wait * 4})
+    scheduled_report = await burst({'match': scheduler.scheduled_client('match'),
+                                    'generate': scheduler.scheduled_client('generate')}, args)
+    scheduled_report['client'] = scheduled.stats()
+    scheduled_report['scheduler'] = scheduler.stats()
+    return {'direct': direct_report, 'scheduled': scheduled_report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--generate-every', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=20, help='requests the fake client allows per window')
+    parser.add_argument('--window', type=float, default=1.0)
+    parser.add_argument('--overload-rate', type=float, default=0.02)
+    parser.add_argument('--llm-delay', type=float, default=0.05)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--max-wait', type=float, default=30.0, help='seconds a match call may wait')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark the Claude matching prompt as the registry grows.
+
+Forces every request down the remote matching path against a stub
+Anthropic client whose latency grows with prompt size, and reports prompt
+bytes, estimated tokens and latency for each registry size. The
+full_registry_bytes column shows what describing every function would cost.
+
+    python benchmarks/bench_match_prompt.py --sizes 10 100 1000 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_matcher import SAMPLE_REQUESTS, percentile, synthetic_registry  # noqa: E402
+from code_manager import DynamicCodeManager  # noqa: E402
+
+
+class SizedStubMessages:
+    """Fake messages API: latency = base + per_kb * prompt size, usage ~ 4 chars per token"""
+
+    def __init__(self, base_delay, per_kb_delay):
+        self.base_delay = base_delay
+        self.per_kb_delay = per_kb_delay
+        self.prompt_bytes = []
+
+    async def create(self, **kwargs):
+        text = ''.join(block['text'] for block in kwargs.get('system') or [])
+        text += ''.join(message['content'] for message in kwargs['messages'])
+        size = len(text.encode())
+        self.prompt_bytes.append(size)
+        await asyncio.sleep(self.base_delay + self.per_kb_delay * size / 1024)
+        return SimpleNamespace(content=[SimpleNamespace(text="MATCH: none\nREASON: stub")],
+                               usage=SimpleNamespace(input_tokens=max(1, len(text) // 4)))
+
+
+async def measure(size, args):
+    stub = SizedStubMessages(args.base_delay, args.per_kb_delay)
+    manager = DynamicCodeManager(filename=args.filename, claude_client=SimpleNamespace(messages=stub),
+                                 match_threshold=float('inf'))
+    for name, details in synthetic_registry(size).items():
+        manager.function_registry.setdefault(name, details)
+        manager.function_index.add(name, details)
+    manager.function_index.renormalize()
+
+    latencies = []
+    for i in range(args.requests):
+        start = time.perf_counter()
+        await manager.find_matching_function(SAMPLE_REQUESTS[i % len(SAMPLE_REQUESTS)])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    full = sum(len(manager.prompt_builder.describe(name, details))
+               for name, details in manager.function_registry.items())
+    return {
+        'functions': len(manager.function_registry),
+        'prompt_bytes_mean': statistics.mean(stub.prompt_bytes) if stub.prompt_bytes else 0,
+        'prompt_bytes_max': max(stub.prompt_bytes) if stub.prompt_bytes else 0,
+        'full_registry_bytes': full,
+        'chars_per_token': round(manager.prompt_builder.chars_per_token, 3),
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+    }
+
+
+async def run(args):
+    return [await measure(size, args) for size in args.sizes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filename', default='wordpress_api.py')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--base-delay', type=float, default=0.01, help='stub seconds per call')
+    parser.add_argument('--per-kb-delay', type=float, default=0.002, help='stub seconds per prompt KiB')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Benchmark local function matching in DynamicCodeManager.
+
+Reports the share of requests answered by the local index and the p50/p99
+latency of find_matching_function. Claude is replaced by a stub that sleeps
+for --remote-delay seconds so the cost of a fallback is visible.
+
+    python benchmarks/bench_matcher.py --functions 500 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code_manager import DynamicCodeManager  # noqa: E402
+
+RESOURCES = ['post', 'page', 'comment', 'user', 'category', 'tag', 'media', 'plugin', 'theme', 'menu']
+ACTIONS = ['get', 'create', 'update', 'delete', 'count', 'search']
+
+SAMPLE_REQUESTS = [
+    'list my pages', 'get all pages', 'get post 42', 'test the connection',
+    'show me the pages on the site', 'fetch post number 7', 'delete comment 12',
+    'create a new category called News', 'how many users are there', 'search media for logo',
+    'update tag 3 to be called Featured', 'get plugins', 'is the site up', 'count draft posts',
+]
+
+
+class StubMessages:
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(content=[SimpleNamespace(text="MATCH: none\nREASON: stub")])
+
+
+def synthetic_registry(count):
+    """Build `count` plausible function descriptions"""
+    registry = {}
+    for i in range(count):
+        action = ACTIONS[i % len(ACTIONS)]
+        resource = RESOURCES[(i // len(ACTIONS)) % len(RESOURCES)]
+        suffix = '' if i < len(ACTIONS) * len(RESOURCES) else f'_v{i}'
+        name = f'{action}_{resource}s{suffix}'
+        registry[name] = {
+            'name': name,
+            'docstring': f'{action.capitalize()} {resource}s on the WordPress site',
+            'parameters': [f'{resource}_id'] if action in ('get', 'update', 'delete') else [],
+            'returns': 'List[Dict[str, Any]]',
+            'code': '',
+        }
+    return registry
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(args):
+    stub = StubMessages(args.remote_delay)
+    manager = DynamicCodeManager(filename=args.filename, claude_client=SimpleNamespace(messages=stub),
+                                 match_threshold=args.threshold)
+    for name, details in synthetic_registry(args.functions).items():
+        manager.function_registry.setdefault(name, details)
+        manager.function_index.add(name, details)
+
+    rng = random.Random(args.seed)
+    latencies = []
+    local_hits = 0
+    for _ in range(args.requests):
+        request = rng.choice(SAMPLE_REQUESTS)
+        remote_before = stub.calls
+        start = time.perf_counter()
+        await manager.find_matching_function(request)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if stub.calls == remote_before:
+            local_hits += 1
+
+    return {
+        'functions': len(manager.function_registry),
+        'requests': args.requests,
+        'threshold': manager.match_threshold,
+        'local_hit_ratio': local_hits / args.requests,
+        'remote_calls': stub.calls,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'mean_ms': statistics.mean(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filename', default='wordpress_api.py')
+    parser.add_argument('--functions', type=int, default=200, help='synthetic functions to add to the registry')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--threshold', type=float, default=None)
+    parser.add_argument('--remote-delay', type=float, default=0.05, help='seconds per stubbed Claude call')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Benchmark media uploads and downloads against the stub's /wp/v2/media.
+
+Uploads files of each size once the way generated functions used to
+(read the whole file, then post the bytes) and once with
+WordPressClient.upload_media, then uploads several files concurrently with
+upload_media_many and downloads one back with download_media. Reports
+wall time and how far the process's resident memory rose above where it
+started, sampled every few milliseconds, and checks that the stub received
+every byte intact.
+
+    python benchmarks/bench_media.py --sizes-mb 16 64 256 --files 6 --concurrency 3
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_wordpress import start_server  # noqa: E402
+from wordpress_client import WordPressClient  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def rss_bytes() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class PeakRSS:
+    """Track how far resident memory rises above its level on entry"""
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.peak = 0
+
+    def _sample(self):
+        while not self._done.is_set():
+            self.peak = max(self.peak, rss_bytes())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.peak = rss_bytes()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        self.rise_mb = round((self.peak - self.baseline) / MB, 1)
+
+
+def make_file(path: str, size_mb: int) -> str:
+    """Write a file of incompressible data and return its sha256"""
+    block = os.urandom(MB)
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(block)
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(MB), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def buffered_upload(client: WordPressClient, path: str) -> dict:
+    with open(path, 'rb') as f:
+        data = f.read()
+    response = client.post('wp/v2/media', data=data, timeout=client.media_timeout,
+                           headers={'Content-Disposition': f'attachment; filename="{os.path.basename(path)}"',
+                                    'Content-Type': 'video/mp4'})
+    response.raise_for_status()
+    return response.json()
+
+
+def timed(func, *args, **kwargs) -> tuple:
+    with PeakRSS() as memory:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        wall = time.perf_counter() - start
+    return result, {'wall_s': round(wall, 3), 'rss_rise_mb': memory.rise_mb}
+
+
+def run(args):
+    server, url = start_server()
+    workdir = tempfile.mkdtemp(prefix='bench_media_')
+    client = WordPressClient(url, 'bench', 'bench')
+    client.cache = None
+    try:
+        report = {'chunk_kb': client.media_chunk_size // 1024, 'uploads': []}
+        for size_mb in args.sizes_mb:
+            path = os.path.join(workdir, f'video-{size_mb}mb.mp4')
+            digest = make_file(path, size_mb)
+            row = {'size_mb': size_mb}
+            for mode, upload in (('buffered', functools.partial(buffered_upload, client)),
+                                 ('streamed', client.upload_media)):
+                media, row[mode] = timed(upload, path)
+                row[mode]['intact'] = media['media_details']['sha256'] == digest
+            report['uploads'].append(row)
+            os.remove(path)
+
+        paths = [os.path.join(workdir, f'clip-{i}.mp4') for i in range(args.files)]
+        for path in paths:
+            make_file(path, args.many_size_mb)
+        calls = []
+        media, many = timed(client.upload_media_many, paths, concurrency=args.concurrency,
+                            progress=lambda path, sent, total: calls.append(sent))
+        many.update(files=args.files, size_mb=args.many_size_mb, concurrency=args.concurrency,
+                    progress_calls=len(calls),
+                    throughput_mb_s=round(args.files * args.many_size_mb / many['wall_s'], 1))
+        report['upload_many'] = many
+
+        destination = os.path.join(workdir, 'download.mp4')
+        _, download = timed(client.download_media, media[0]['id'], destination)
+        download['intact'] = sha256_file(destination) == sha256_file(paths[0])
+        report['download'] = download
+        report['stub'] = server.stats
+        return report
+    finally:
+        client.close()
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes-mb', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--files', type=int, default=6, help='files for the concurrent upload')
+    parser.add_argument('--many-size-mb', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark field projection and streaming JSON decoding on a large site.
+
+Starts the stub with 10k pages and lists them in several ways, each in a
+fresh child process so peak RSS is comparable:
+
+    json-list       fetch every page and parse it with response.json() (the old path)
+    stream-list     list(get_pages()) with bodies decoded item by item
+    stream-walk     iterate iter_pages() without keeping the items
+    projected-list  list(get_pages(fields=[id, title, link])), as the chat formatter asks
+
+Reports bytes sent by the stub and the child's peak RSS. The response
+cache is disabled unless --cache is given, since it deliberately keeps
+bodies in memory.
+
+    python benchmarks/bench_projection.py --items 10000 --content-bytes 4000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_wordpress import start_server  # noqa: E402
+
+MODES = ['json-list', 'stream-list', 'stream-walk', 'projected-list']
+SUMMARY_FIELDS = ['id', 'title', 'link']
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode):
+    """Run one mode against WP_URL and print its measurements as JSON"""
+    from wordpress_api import WordPressAPI
+    api = WordPressAPI()
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == 'json-list':
+        items, page, total_pages = [], 1, 1
+        while page <= total_pages:
+            response = api.get('wp/v2/pages', params={'per_page': 100, 'page': page})
+            items.extend(response.json())
+            total_pages = int(response.headers['X-WP-TotalPages'])
+            page += 1
+        count = len(items)
+    elif mode == 'stream-list':
+        count = len(api.get_pages())
+    elif mode == 'stream-walk':
+        count = sum(1 for _ in api.iter_pages())
+    else:
+        count = len(api.get_pages(fields=SUMMARY_FIELDS))
+    print(json.dumps({
+        'items': count,
+        'elapsed_s': round(time.perf_counter() - start, 3),
+        'baseline_rss_mb': round(baseline, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }))
+
+
+def run(args):
+    server, url = start_server(items=args.items, content_bytes=args.content_bytes)
+    env = {**os.environ, 'WP_URL': url, 'WP_USERNAME': 'bench', 'WP_APP_PASSWORD': 'bench'}
+    if not args.cache:
+        env['WP_CACHE_ENTRIES'] = '0'
+    results = []
+    try:
+        for mode in args.modes:
+            sent = server.stats['bytes_sent']
+            output = subprocess.run([sys.executable, __file__, '--child', mode], env=env, cwd=ROOT,
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result.update(mode=mode, bytes_transferred=server.stats['bytes_sent'] - sent)
+            results.append(result)
+    finally:
+        server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--content-bytes', type=int, default=4000, help='size of each rendered page body')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--cache', action='store_true', help='keep the response cache enabled')
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == '__main__':
+    main()
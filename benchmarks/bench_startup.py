@@ -0,0 +1,93 @@
+"""Benchmark DynamicCodeManager startup as the registry grows.
+
+Builds temporary copies of wordpress_api.py with N extra functions and
+reports how long constructing the code manager takes without a registry
+snapshot (the file is parsed and the snapshot written) and with one, how
+long the match index then takes to build in the background, and how long
+another process takes to pick up a newly added function.
+
+    python benchmarks/bench_startup.py --sizes 100 1000 3000
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import textwrap
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from code_manager import DynamicCodeManager  # noqa: E402
+
+FUNCTION_TEMPLATE = '''def get_widget_{i}(self, widget_id: int) -> Dict[str, Any]:
+    """Get widget {i} by its ID"""
+    response = self.get(f'wp/v2/sidebars/sidebar-{i}/widgets/{{widget_id}}')
+    response.raise_for_status()
+    return response.json()
+'''
+
+
+def timed_ms(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def measure(size: int, args) -> dict:
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    try:
+        filename = os.path.join(workdir, 'wordpress_api_bench.py')
+        shutil.copy(os.path.join(ROOT, 'wordpress_api.py'), filename)
+        with open(filename, 'a') as f:
+            for i in range(size):
+                f.write('\n\n' + textwrap.indent(FUNCTION_TEMPLATE.format(i=i), '    '))
+        snapshot = os.path.splitext(filename)[0] + '.registry.jsonl'
+        sys.path.insert(0, workdir)
+
+        def cold():
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+            DynamicCodeManager(filename=filename)
+
+        cold_ms = timed_ms(cold, args.repeat)
+        warm_ms = timed_ms(lambda: DynamicCodeManager(filename=filename), args.repeat)
+        index_ms = timed_ms(lambda: DynamicCodeManager(filename=filename).warm(), args.repeat) - warm_ms
+
+        # A second "process" picks up a function the first one adds
+        writer = DynamicCodeManager(filename=filename)
+        reader = DynamicCodeManager(filename=filename)
+        writer.add_function(FUNCTION_TEMPLATE.format(i=size))
+        start = time.perf_counter()
+        picked_up = reader.refresh()
+        refresh_ms = (time.perf_counter() - start) * 1000
+        return {
+            'functions': len(reader.function_registry),
+            'cold_start_ms': round(cold_ms, 2),
+            'snapshot_start_ms': round(warm_ms, 2),
+            'index_build_ms': round(index_ms, 2),
+            'refresh_ms': round(refresh_ms, 3),
+            'picked_up': picked_up,
+            'file_bytes': os.path.getsize(filename),
+            'snapshot_bytes': os.path.getsize(snapshot),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 3000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps([measure(size, args) for size in args.sizes], indent=2))
+
+
+if __name__ == '__main__':
+    main()
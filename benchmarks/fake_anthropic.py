@@ -0,0 +1,164 @@
+"""Scripted stand-in for anthropic.AsyncAnthropic used by the benchmarks.
+
+Implements the two calls this service makes, messages.create() and
+messages.stream(), with a configurable delay. Replies come from a
+responder: a callable that receives the prompt text and returns the reply.
+ScriptedResponder picks the first regex rule that matches the prompt, which
+is enough to script MATCH: answers for matching prompts and code for
+generation prompts.
+
+It can also play an account at its limits: `rate_limit=(requests, seconds)`
+rejects calls beyond that many per window with a 429 and a Retry-After
+header, and `overload_rate` fails that fraction of calls with a 529.
+"""
+import asyncio
+import collections
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import Callable, List, Optional, Tuple
+
+
+class FakeAPIStatusError(Exception):
+    """Shaped like anthropic.APIStatusError: a status_code and a response with headers"""
+
+    def __init__(self, status_code: int, message: str, headers=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+def prompt_text(kwargs) -> str:
+    """Concatenate the system blocks and messages of a messages API call"""
+    system = kwargs.get('system') or []
+    if isinstance(system, str):
+        text = system
+    else:
+        text = ''.join(block.get('text', '') for block in system)
+    for message in kwargs.get('messages', []):
+        content = message['content']
+        text += content if isinstance(content, str) else ''.join(part.get('text', '') for part in content)
+    return text
+
+
+class ScriptedResponder:
+    """Return the reply of the first (pattern, reply) rule found in the prompt
+
+    A reply may be a string, formatted with the match's named groups, or a
+    callable taking the match.
+    """
+
+    def __init__(self, rules: List[Tuple[str, object]], default: str = "MATCH: none\nREASON: no rule matched"):
+        self.rules = [(re.compile(pattern, re.S), reply) for pattern, reply in rules]
+        self.default = default
+
+    def __call__(self, text: str) -> str:
+        for pattern, reply in self.rules:
+            match = pattern.search(text)
+            if match:
+                return reply(match) if callable(reply) else reply.format(**match.groupdict())
+        return self.default
+
+
+def _usage(prompt: str, reply: str) -> SimpleNamespace:
+    # Roughly four characters per token, like English text
+    return SimpleNamespace(input_tokens=max(1, len(prompt) // 4), output_tokens=max(1, len(reply) // 4),
+                           cache_read_input_tokens=0, cache_creation_input_tokens=0)
+
+
+class _FakeStream:
+    def __init__(self, prompt: str, reply: str, delay: float, chunk_chars: int, chunk_delay: float):
+        self.prompt = prompt
+        self.reply = reply
+        self.delay = delay
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_delay
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def get_final_message(self):
+        return SimpleNamespace(content=[SimpleNamespace(type='text', text=self.reply)],
+                               usage=_usage(self.prompt, self.reply), stop_reason='end_turn')
+
+    @property
+    async def text_stream(self):
+        for start in range(0, len(self.reply), self.chunk_chars):
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            yield self.reply[start:start + self.chunk_chars]
+
+
+class FakeMessages:
+    def __init__(self, responder: Callable[[str], str], delay: float, chunk_chars: int, chunk_delay: float,
+                 rate_limit: Optional[Tuple[int, float]] = None, overload_rate: float = 0.0, seed: int = 0):
+        self.responder = responder
+        self.delay = delay
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_delay
+        self.rate_limit = rate_limit
+        self.overload_rate = overload_rate
+        self.random = random.Random(seed)
+        self.calls = {'create': 0, 'stream': 0}
+        self.rejected = {'rate_limited': 0, 'overloaded': 0}
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._accepted = collections.deque()
+
+    def _check_limits(self):
+        if self.overload_rate and self.random.random() < self.overload_rate:
+            self.rejected['overloaded'] += 1
+            raise FakeAPIStatusError(529, 'Overloaded')
+        if self.rate_limit is None:
+            return
+        limit, window = self.rate_limit
+        now = time.monotonic()
+        while self._accepted and self._accepted[0] <= now - window:
+            self._accepted.popleft()
+        if len(self._accepted) >= limit:
+            self.rejected['rate_limited'] += 1
+            retry_after = self._accepted[0] + window - now
+            raise FakeAPIStatusError(429, 'Rate limited', {'retry-after': f'{retry_after:.3f}'})
+        self._accepted.append(now)
+
+    def _reply(self, kind: str, kwargs) -> Tuple[str, str]:
+        self._check_limits()
+        text = prompt_text(kwargs)
+        reply = self.responder(text)
+        self.calls[kind] += 1
+        usage = _usage(text, reply)
+        self.input_tokens += usage.input_tokens
+        self.output_tokens += usage.output_tokens
+        return text, reply
+
+    async def create(self, **kwargs):
+        text, reply = self._reply('create', kwargs)
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(content=[SimpleNamespace(type='text', text=reply)], usage=_usage(text, reply),
+                               stop_reason='end_turn')
+
+    def stream(self, **kwargs):
+        text, reply = self._reply('stream', kwargs)
+        return _FakeStream(text, reply, self.delay, self.chunk_chars, self.chunk_delay)
+
+
+class FakeAnthropic:
+    """Drop-in for anthropic.AsyncAnthropic with scripted replies
+
+    `delay` is the time to the first token; streamed replies then arrive in
+    `chunk_chars` pieces, `chunk_delay` seconds apart.
+    """
+
+    def __init__(self, responder: Callable[[str], str], delay: float = 0.0,
+                 chunk_chars: int = 40, chunk_delay: float = 0.0,
+                 rate_limit: Optional[Tuple[int, float]] = None, overload_rate: float = 0.0, seed: int = 0):
+        self.messages = FakeMessages(responder, delay, chunk_chars, chunk_delay, rate_limit, overload_rate, seed)
+
+    def stats(self):
+        return {**self.messages.calls, **self.messages.rejected, 'input_tokens': self.messages.input_tokens,
+                'output_tokens': self.messages.output_tokens}
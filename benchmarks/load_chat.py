@@ -0,0 +1,70 @@
+"""Load test: many simultaneous /api/chat requests against a slow stub WordPress.
+
+Each chat resolves to an existing function through the local matcher and
+then waits --latency seconds on the stub server. If the endpoint blocked the
+event loop the wall time would be close to requests * latency; with the
+async path the requests overlap and the wall time approaches
+ceil(requests / EXECUTOR_THREADS) * latency.
+
+    python benchmarks/load_chat.py --requests 50 --latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+
+from stub_wordpress import start_server  # noqa: E402
+
+
+async def run(args):
+    server, url = start_server(latency=args.latency)
+    os.environ.update({'WP_URL': url, 'WP_USERNAME': 'bench', 'WP_APP_PASSWORD': 'bench',
+                       'ANTHROPIC_API_KEY': os.getenv('ANTHROPIC_API_KEY', 'unused')})
+    os.chdir(ROOT)
+    import main
+
+    payload = {'messages': [{'role': 'user', 'content': args.message}]}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        async def one():
+            start = time.perf_counter()
+            response = await client.post('/api/chat', json=payload)
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one() for _ in range(args.requests)))
+        wall = time.perf_counter() - start
+
+    server.shutdown()
+    serial = args.requests * args.latency
+    return {
+        'requests': args.requests,
+        'stub_latency_s': args.latency,
+        'executor_threads': main.executor.max_workers,
+        'wall_s': wall,
+        'serial_estimate_s': serial,
+        'overlap_factor': serial / wall if wall else None,
+        'max_request_s': max(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.5, help='stub WordPress delay in seconds')
+    parser.add_argument('--message', default='list my pages')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
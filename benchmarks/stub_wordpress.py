@@ -0,0 +1,308 @@
+"""Minimal stand-in for the WordPress REST API used by the benchmarks.
+
+Serves /wp-json/wp/v2/<collection> and /wp-json/wp/v2/<collection>/<id>
+from generated data after an artificial delay, so client behaviour can be
+measured without a real site. Responses carry ETags and honour
+If-None-Match; POSTs to an item change its title and therefore its ETag,
+and bump its modification date so collection queries with modified_after
+return only the items changed since. Items carry _links and meta like
+real ones, rendered content can be padded to a given size, and _fields
+projects responses down to the requested top-level fields. ETags and the
+X-WP-Total/X-WP-TotalPages headers can be switched off.
+/wp-json/batch/v1 applies up to 25 such updates in one request.
+POSTing a raw file body to /wp-json/wp/v2/media stores it on disk as a
+new attachment, reading it in chunks as WordPress does, and its
+source_url serves it back.
+
+    python benchmarks/stub_wordpress.py --port 8081 --latency 0.2
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+ROUTE_RE = re.compile(r'^/wp-json/wp/v2/(?P<collection>[a-z_-]+)(?:/(?P<id>\d+))?/?$')
+UPLOAD_RE = re.compile(r'^/wp-content/uploads/(?P<id>\d+)/')
+# filename* takes precedence over filename, as in WordPress
+ENCODED_FILENAME_RE = re.compile(r"filename\*=UTF-8''(?P<name>[^;]+)")
+FILENAME_RE = re.compile(r'filename="(?P<name>[^"]*)"')
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def make_item(collection, item_id, overrides=None, content_bytes=0):
+    body = f'<p>Body of {collection} {item_id}</p>'
+    item = {
+        'id': item_id,
+        'slug': f'{collection}-{item_id}',
+        'status': 'publish',
+        'type': collection.rstrip('s'),
+        'link': f'https://stub.local/{collection}/{item_id}',
+        'modified': '2024-01-01T00:00:00',
+        'modified_gmt': '2024-01-01T00:00:00',
+        'title': {'rendered': f'{collection.capitalize()} {item_id}'},
+        'content': {'rendered': body + 'x' * max(0, content_bytes - len(body)), 'protected': False},
+        'excerpt': {'rendered': body, 'protected': False},
+        'author': 1,
+        'meta': {'footnotes': ''},
+        '_links': {
+            'self': [{'href': f'https://stub.local/wp-json/wp/v2/{collection}/{item_id}'}],
+            'collection': [{'href': f'https://stub.local/wp-json/wp/v2/{collection}'}],
+            'author': [{'embeddable': True, 'href': 'https://stub.local/wp-json/wp/v2/users/1'}],
+        },
+    }
+    item.update((overrides or {}).get((collection, item_id), {}))
+    return item
+
+
+def project(item, fields):
+    """Apply a _fields query value to an item"""
+    if not fields:
+        return item
+    wanted = fields.split(',')
+    return {key: value for key, value in item.items() if key in wanted}
+
+
+class StubWordPressServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The socketserver default of 5 drops connections under concurrent load,
+    # which shows up as one-second SYN retransmits in the latency tail
+    request_queue_size = 256
+
+    def shutdown(self):
+        super().shutdown()
+        shutil.rmtree(self.config['media_dir'], ignore_errors=True)
+
+
+class StubWordPressHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        stats = self.server.stats
+        body = json.dumps(payload).encode()
+        etag = '"%s"' % hashlib.md5(body).hexdigest() if self.server.config['etags'] else None
+        stats['requests'] += 1
+        if status == 200 and etag and self.headers.get('If-None-Match') == etag:
+            stats['not_modified'] += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        stats['bytes_sent'] += len(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _read_body_chunks(self):
+        """Yield the request body in chunks, whether sent with Content-Length or chunked encoding"""
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return
+                remaining = size
+                while remaining:
+                    chunk = self.rfile.read(min(remaining, UPLOAD_CHUNK_SIZE))
+                    remaining -= len(chunk)
+                    yield chunk
+                self.rfile.readline()
+        remaining = int(self.headers.get('Content-Length') or 0)
+        while remaining:
+            chunk = self.rfile.read(min(remaining, UPLOAD_CHUNK_SIZE))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+    def _upload_media(self):
+        config = self.server.config
+        disposition = self.headers.get('Content-Disposition', '')
+        encoded = ENCODED_FILENAME_RE.search(disposition)
+        match = encoded or FILENAME_RE.search(disposition)
+        if not match:
+            for _ in self._read_body_chunks():
+                pass
+            self._send_json(400, {'code': 'rest_upload_no_content_disposition'})
+            return
+        filename = unquote(match.group('name')) if encoded else match.group('name')
+        with config['lock']:
+            media_id = config['items'] + len(config['media']) + 1
+            config['media'][media_id] = None
+        path = os.path.join(config['media_dir'], str(media_id))
+        digest, size = hashlib.sha256(), 0
+        with open(path, 'wb') as f:
+            for chunk in self._read_body_chunks():
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        media = {
+            'id': media_id,
+            'slug': os.path.splitext(filename)[0],
+            'type': 'attachment',
+            'title': {'rendered': parse_qs(urlparse(self.path).query).get('title', [filename])[0]},
+            'mime_type': self.headers.get('Content-Type', 'application/octet-stream'),
+            'source_url': f'http://{self.headers.get("Host")}/wp-content/uploads/{media_id}/{quote(filename)}',
+            'media_details': {'filesize': size, 'sha256': digest.hexdigest()},
+        }
+        config['media'][media_id] = media
+        self.server.stats['media_bytes_received'] += size
+        self._send_json(201, media)
+
+    def _send_upload(self, media_id):
+        media = self.server.config['media'].get(media_id)
+        if media is None:
+            self._send_json(404, {'code': 'rest_no_route'})
+            return
+        self.server.stats['requests'] += 1
+        self.send_response(200)
+        self.send_header('Content-Type', media['mime_type'])
+        self.send_header('Content-Length', str(media['media_details']['filesize']))
+        self.end_headers()
+        with open(os.path.join(self.server.config['media_dir'], str(media_id)), 'rb') as f:
+            shutil.copyfileobj(f, self.wfile, UPLOAD_CHUNK_SIZE)
+
+    def do_GET(self):
+        config = self.server.config
+        time.sleep(config['latency'])
+        parsed = urlparse(self.path)
+        upload = UPLOAD_RE.match(parsed.path)
+        if upload:
+            self._send_upload(int(upload.group('id')))
+            return
+        match = ROUTE_RE.match(parsed.path)
+        if not match:
+            self._send_json(404, {'code': 'rest_no_route'})
+            return
+
+        collection = match.group('collection')
+        if match.group('id'):
+            item_id = int(match.group('id'))
+            fields = parse_qs(parsed.query).get('_fields', [''])[0]
+            if collection == 'media' and config['media'].get(item_id):
+                self._send_json(200, project(config['media'][item_id], fields))
+            elif item_id > config['items']:
+                self._send_json(404, {'code': 'rest_post_invalid_id'})
+            else:
+                item = make_item(collection, item_id, config['overrides'], config['content_bytes'])
+                self._send_json(200, project(item, fields))
+            return
+
+        query = parse_qs(parsed.query)
+        per_page = int(query.get('per_page', [config['default_per_page']])[0])
+        page = int(query.get('page', ['1'])[0])
+        if 'modified_after' in query:
+            # Only updated items have a modification date newer than the generated default
+            after = query['modified_after'][0]
+            ids = sorted(item_id for (name, item_id), changes in config['overrides'].items()
+                         if name == collection and changes.get('modified', '') > after)
+        else:
+            ids = range(1, config['items'] + 1)
+        total_pages = max(1, -(-len(ids) // per_page))
+        fields = query.get('_fields', [''])[0]
+        items = [project(make_item(collection, i, config['overrides'], config['content_bytes']), fields)
+                 for i in ids[(page - 1) * per_page:page * per_page]]
+        headers = {}
+        if config['pagination_headers']:
+            headers = {'X-WP-Total': str(len(ids)), 'X-WP-TotalPages': str(total_pages)}
+        self._send_json(200, items, headers)
+
+    def _update_item(self, path, changes):
+        """Apply a POST to an item and return (status, body)"""
+        config = self.server.config
+        match = ROUTE_RE.match(path)
+        if not match or not match.group('id'):
+            return 404, {'code': 'rest_no_route', 'message': 'No route was found'}
+        collection, item_id = match.group('collection'), int(match.group('id'))
+        if item_id > config['items']:
+            return 404, {'code': 'rest_post_invalid_id', 'message': 'Invalid post ID.'}
+        changes = dict(changes)
+        if 'title' in changes and not isinstance(changes['title'], dict):
+            changes['title'] = {'rendered': changes['title']}
+        changes['modified'] = changes['modified_gmt'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime())
+        config['overrides'].setdefault((collection, item_id), {}).update(changes)
+        return 200, make_item(collection, item_id, config['overrides'], config['content_bytes'])
+
+    def do_POST(self):
+        time.sleep(self.server.config['latency'])
+        path = urlparse(self.path).path
+        if path.rstrip('/') == '/wp-json/wp/v2/media':
+            self._upload_media()
+            return
+        payload = self._read_json()
+        if path.rstrip('/') == '/wp-json/batch/v1':
+            requests = payload.get('requests', [])
+            if len(requests) > 25:
+                self._send_json(400, {'code': 'rest_batch_max_requests'})
+                return
+            responses = []
+            for request in requests:
+                status, body = self._update_item('/wp-json' + request['path'], request.get('body') or {})
+                responses.append({'status': status, 'body': body, 'headers': {}})
+            failed = any(response['status'] >= 400 for response in responses)
+            self._send_json(207 if failed else 200, {'responses': responses})
+            return
+        status, body = self._update_item(path, payload)
+        self._send_json(status, body)
+
+
+def start_server(port=0, latency=0.0, items=25, content_bytes=0, default_per_page=10,
+                 etags=True, pagination_headers=True):
+    """Start the stub in a background thread and return (server, base_url)
+
+    Uploaded media is kept in a temporary directory that is removed on shutdown().
+    """
+    server = StubWordPressServer(('127.0.0.1', port), StubWordPressHandler)
+    server.config = {'latency': latency, 'items': items, 'overrides': {}, 'content_bytes': content_bytes,
+                     'default_per_page': default_per_page, 'etags': etags,
+                     'pagination_headers': pagination_headers,
+                     'media': {}, 'media_dir': tempfile.mkdtemp(prefix='stub_wordpress_media_'),
+                     'lock': threading.Lock()}
+    server.stats = {'requests': 0, 'not_modified': 0, 'bytes_sent': 0, 'media_bytes_received': 0}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds to wait before each response')
+    parser.add_argument('--items', type=int, default=25, help='items per collection')
+    parser.add_argument('--content-bytes', type=int, default=0, help='pad rendered content to this size')
+    parser.add_argument('--per-page', type=int, default=10, help='page size when the client sends no per_page')
+    parser.add_argument('--no-etags', action='store_true', help='send no ETags and never answer 304')
+    parser.add_argument('--no-pagination-headers', action='store_true', help='omit X-WP-Total and X-WP-TotalPages')
+    args = parser.parse_args()
+    server, url = start_server(args.port, args.latency, args.items, args.content_bytes, args.per_page,
+                               etags=not args.no_etags, pagination_headers=not args.no_pagination_headers)
+    print(f'Stub WordPress listening on {url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
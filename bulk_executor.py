@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from function_executor import FunctionExecutor
+from wordpress_client import MAX_BATCH_SIZE, WordPressAPIError, WordPressClient
+
+logger = logging.getLogger(__name__)
+
+
+def _materialize(result: Any) -> Any:
+    """Turn lazy collection results into lists so they can be returned as JSON"""
+    if isinstance(result, Iterator):
+        return list(result)
+    return result
+
+
+class BulkExecutor:
+    """Run one operation over many inputs with bounded concurrency
+
+    Every item gets its own result or error, so one failure never fails the
+    whole run. Registry functions are fanned out over the function executor;
+    raw REST writes are grouped into /batch/v1 requests of up to 25. Queries
+    fanned out across sites stream their outcomes back as they complete.
+    """
+
+    def __init__(self, api: WordPressClient, executor: FunctionExecutor,
+                 default_concurrency: Optional[int] = None):
+        self.api = api
+        self.executor = executor
+        self.default_concurrency = default_concurrency or int(os.getenv('BULK_CONCURRENCY', 8))
+        self.fan_out_concurrency = int(os.getenv('FANOUT_CONCURRENCY', self.default_concurrency))
+        self.site_timeout = float(os.getenv('SITE_TIMEOUT', 30))
+
+    def _report(self, items: List[Dict[str, Any]], started: float) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - started
+        succeeded = sum(1 for item in items if item['ok'])
+        return {
+            'items': items,
+            'succeeded': succeeded,
+            'failed': len(items) - succeeded,
+            'elapsed_s': round(elapsed, 4),
+            'items_per_s': round(len(items) / elapsed, 2) if elapsed else None,
+        }
+
+    async def call_many(self, func: Callable, arg_sets: List[Dict[str, Any]],
+                        concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """Call func once per argument set, at most `concurrency` calls at a time"""
+        semaphore = asyncio.Semaphore(concurrency or self.default_concurrency)
+        started = time.perf_counter()
+
+        async def call(index: int, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    result = await self.executor.run(func, **kwargs)
+                    if isinstance(result, Iterator):
+                        result = await self.executor.run(_materialize, result)
+                    return {'index': index, 'ok': True, 'result': result}
+                except Exception as e:
+                    logger.debug("Bulk item %d failed: %s", index, e)
+                    return {'index': index, 'ok': False, 'error': str(e)}
+
+        items = await asyncio.gather(*(call(i, kwargs) for i, kwargs in enumerate(arg_sets)))
+        return self._report(list(items), started)
+
+    async def fan_out(self, call: Callable[[str], Awaitable[Any]], sites: List[str],
+                      concurrency: Optional[int] = None, timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Run call(site) for every site and yield each outcome as soon as it is ready
+
+        At most `concurrency` sites are queried at once and each gets
+        `timeout` seconds, so a slow site neither holds back the results of
+        the others nor the end of the run. Outcomes arrive in completion
+        order as {'site', 'ok', 'result' or 'error', 'elapsed_s'}.
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.fan_out_concurrency)
+        timeout = timeout if timeout is not None else self.site_timeout
+
+        async def run(site: str) -> Dict[str, Any]:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(call(site), timeout)
+                    outcome = {'site': site, 'ok': True, 'result': result}
+                except asyncio.TimeoutError:
+                    outcome = {'site': site, 'ok': False, 'error': f'No answer within {timeout:g} seconds'}
+                except Exception as e:
+                    logger.debug("Fan-out to %s failed: %s", site, e)
+                    outcome = {'site': site, 'ok': False, 'error': str(e)}
+                outcome['elapsed_s'] = round(time.perf_counter() - started, 4)
+                return outcome
+
+        tasks = [asyncio.ensure_future(run(site)) for site in sites]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # The consumer went away; stop querying the remaining sites
+            for task in tasks:
+                task.cancel()
+
+    async def batch_many(self, operations: List[Dict[str, Any]],
+                         concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """Send write operations through /batch/v1, falling back to single requests if it is unavailable"""
+        semaphore = asyncio.Semaphore(concurrency or self.default_concurrency)
+        started = time.perf_counter()
+        chunks = [(offset, operations[offset:offset + MAX_BATCH_SIZE])
+                  for offset in range(0, len(operations), MAX_BATCH_SIZE)]
+
+        async def send(offset: int, chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    responses = await self.executor.run(self.api.batch, chunk)
+                except WordPressAPIError as e:
+                    if e.status_code != 404:
+                        return [{'index': offset + i, 'ok': False, 'error': str(e)} for i in range(len(chunk))]
+                    logger.info("Batch endpoint unavailable, sending requests individually")
+                    responses = None
+                except Exception as e:
+                    return [{'index': offset + i, 'ok': False, 'error': str(e)} for i in range(len(chunk))]
+            if responses is None:
+                return await self._send_individually(offset, chunk, semaphore)
+            return [self._batch_item(offset + i, response) for i, response in enumerate(responses)]
+
+        results = await asyncio.gather(*(send(offset, chunk) for offset, chunk in chunks))
+        return self._report([item for chunk in results for item in chunk], started)
+
+    def _batch_item(self, index: int, response: Dict[str, Any]) -> Dict[str, Any]:
+        status = response.get('status') or 0
+        if 200 <= status < 300:
+            return {'index': index, 'ok': True, 'status': status, 'result': response.get('body')}
+        body = response.get('body') or {}
+        message = body.get('message') if isinstance(body, dict) else None
+        return {'index': index, 'ok': False, 'status': status, 'error': message or f'Status code: {status}'}
+
+    async def _send_individually(self, offset: int, chunk: List[Dict[str, Any]],
+                                 semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+        async def send_one(index: int, operation: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    response = await self.executor.run(self.api.request, operation.get('method', 'POST'),
+                                                       operation['path'], json=operation.get('body') or {})
+                    try:
+                        body = response.json()
+                    except ValueError:
+                        body = response.text
+                    return self._batch_item(index, {'status': response.status_code, 'body': body})
+                except Exception as e:
+                    return {'index': index, 'ok': False, 'error': str(e)}
+
+        return list(await asyncio.gather(*(send_one(offset + i, op) for i, op in enumerate(chunk))))
@@ -1,33 +1,169 @@
+import ast
+import asyncio
 import logging
+import textwrap
+import time
+from typing import AsyncIterator, Dict, Optional, Tuple
+from generation_cache import GenerationCache, task_context, task_key
+from metrics import record_llm
 
 logger = logging.getLogger(__name__)
 
+GENERATION_MODEL = "claude-3-opus-20240229"
+GENERATION_MAX_TOKENS = 2048
+
 class CodeGenerator:
-    def __init__(self, claude_client):
+    def __init__(self, claude_client, cache: Optional[GenerationCache] = None):
         self.claude = claude_client
+        self.cache = cache if cache is not None else GenerationCache()
+        # One in-flight generation per normalized task; concurrent callers wait on it
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.counters = {'generated': 0, 'cache_hits': 0, 'coalesced': 0, 'discarded': 0}
+
+    def _build_prompt(self, task_description: str, context: str = "") -> str:
+        """Prompt asking Claude for a single WordPressAPI method"""
+        context = task_context(task_description, context)
+        if context:
+            context = f"""
+        Earlier requests in this conversation, for resolving references such as "the same" or "those":
+{textwrap.indent(context, '        ')}
+        """
+        return f"""You are a Python code generator for WordPress management.
+        Your task is to create a Python function for the WordPressAPI class that does the following:
+        {task_description}
+        {context}
         
-    def generate_function(self, task_description: str) -> str:
-        """Generate Python code for a given task"""
+        Rules:
+        1. Include proper error handling and logging
+        2. Make every HTTP call through the client's pooled session helpers:
+           self.get(route, params=...), self.post(route, json=...), self.put(...), self.delete(...)
+           or self.request(method, route, ...). Routes are REST paths such as 'wp/v2/posts/5';
+           authentication, timeouts, connection reuse and retries are already handled.
+           Never call requests.get/requests.post directly or pass auth= or timeout= yourself.
+           For I/O-heavy work you may write an `async def` method that awaits the async helpers
+           self.aget, self.apost, self.aput, self.adelete or self.arequest instead.
+        3. For list endpoints never fetch a single page: use self.iter_collection(route, params=...)
+           (or self.aiter_collection in async methods), which follows X-WP-TotalPages and fetches
+           the remaining pages concurrently. Return the iterator itself when the caller only needs
+           to walk the items, so large collections are never held in memory at once.
+        4. Functions that return posts, pages or other items as WordPress sends them must accept an
+           optional `fields: Optional[List[str]] = None` argument and pass it on as
+           self.iter_collection(route, params=..., fields=fields) or self.fetch_item(route, item_id, fields=fields),
+           so callers that only display a few fields can skip content, _links and meta.
+           Do not add it to functions that compute their result from other fields of the items.
+        5. Return only the function code without any markdown formatting
+        6. Include docstrings and type hints
+        7. Handle all potential errors appropriately
+        8. Use only names the method defines itself, builtins, or the module's imports (requests, json,
+           logging, os, datetime and the typing names); import anything else from the standard library
+           inside the method. Never import subprocess, socket, sys, shutil, pickle, ctypes or importlib,
+           and never call eval, exec, compile or __import__: such code is rejected.
+        9. Move media with self.upload_media(path, title=..., progress=...), self.upload_media_many(paths)
+           and self.download_media(media_id_or_url, destination), which stream files in chunks.
+           Never read a whole file into memory or post file contents yourself.
+        
+        Generate the function code now:"""
+
+    def _extract_code(self, code: str) -> str:
+        """Strip markdown fences from Claude's answer"""
+        if "```python" in code:
+            code = code.split("```python")[1].split("```")[0].strip()
+            logger.debug("Extracted code from markdown blocks")
+        elif "```" in code:
+            code = code.split("```")[1].split("```")[0].strip()
+            logger.debug("Extracted code from markdown blocks")
+        return code
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, 'cached_tasks': len(self.cache), 'in_flight': len(self._inflight)}
+
+    def _is_valid(self, code: Optional[str]) -> bool:
+        """Only cache code that parses and defines a function (add_function has the final say)"""
+        if not code:
+            return False
         try:
-            logger.debug(f"Generating code for task: {task_description}")
-            
-            prompt = f"""You are a Python code generator for WordPress management.
-            Your task is to create a Python function for the WordPressAPI class that does the following:
-            {task_description}
-            
-            Rules:
-            1. Include proper error handling and logging
-            2. Use self.wp_url, self.wp_username, and self.wp_password from the class
-            3. Return only the function code without any markdown formatting
-            4. Include docstrings and type hints
-            5. Handle all potential errors appropriately
-            
-            Generate the function code now:"""
+            tree = ast.parse(code)
+        except SyntaxError:
+            return False
+        return any(isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) for node in tree.body)
+
+    def _cached(self, key: str) -> Optional[str]:
+        code = self.cache.get(key)
+        if code is not None:
+            self.counters['cache_hits'] += 1
+            logger.debug("Generation cache hit for %.12s", key)
+        return code
+
+    async def _join(self, key: str) -> Optional[str]:
+        """Wait for the identical generation that is already running"""
+        self.counters['coalesced'] += 1
+        logger.debug("Coalescing with in-flight generation %.12s", key)
+        return await asyncio.shield(self._inflight[key])
+
+    def _start(self, key: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        # Mark failures as retrieved so one nobody waited for is not logged as unhandled
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        return future
+
+    def remember(self, task_description: str, context: str, code: str):
+        """Cache code for a task once add_function has accepted it"""
+        if self._is_valid(code):
+            self.cache.store(task_key(task_description, context), task_description, code)
+
+    def forget(self, task_description: str, context: str = ""):
+        """Drop cached code for a task that add_function rejected, so the next request regenerates it"""
+        if self.cache.discard(task_key(task_description, context)):
+            self.counters['discarded'] += 1
+            logger.info("Discarded cached code for %r", task_description)
+
+    def _finish(self, key: str, code: Optional[str]):
+        self.counters['generated'] += 1
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(code)
+
+    def _abandon(self, key: str, error: BaseException):
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+    async def generate_function(self, task_description: str, context: str = "") -> str:
+        """Generate Python code for a given task, reusing cached or in-flight results
+
+        `context` summarizes earlier turns of the conversation. When the task
+        refers back to them, it becomes part of the prompt and therefore of
+        the cache key. Generated code is
+        only cached once the caller reports it added with remember().
+        """
+        key = task_key(task_description, context)
+        code = self._cached(key)
+        if code is not None:
+            return code
+        if key in self._inflight:
+            return await self._join(key)
+
+        self._start(key)
+        try:
+            code = await self._generate(task_description, context)
+        except BaseException as e:
+            self._abandon(key, e if isinstance(e, Exception) else RuntimeError("Code generation was cancelled"))
+            raise
+        self._finish(key, code)
+        return code
+
+    async def _generate(self, task_description: str, context: str = "") -> str:
+        """Ask Claude for the code"""
+        try:
+            logger.debug("Generating code for task: %s", task_description)
+            prompt = self._build_prompt(task_description, context)
             
             logger.debug("Sending request to Claude...")
-            response = self.claude.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=2048,
+            start = time.perf_counter()
+            response = await self.claude.messages.create(
+                model=GENERATION_MODEL,
+                max_tokens=GENERATION_MAX_TOKENS,
                 messages=[
                     {
                         "role": "user",
@@ -35,25 +171,69 @@ class CodeGenerator:
                     }
                 ]
             )
+            record_llm('generate', time.perf_counter() - start, getattr(response, 'usage', None))
             
             if not response.content:
                 logger.error("No content in Claude's response")
                 return None
                 
             code = response.content[0].text
-            logger.debug(f"Received response from Claude: {code[:100]}...")
+            logger.debug("Received %d characters from Claude", len(code))
             
             # Clean up the code
-            if "```python" in code:
-                code = code.split("```python")[1].split("```")[0].strip()
-                logger.debug("Extracted code from markdown blocks")
-            elif "```" in code:
-                code = code.split("```")[1].split("```")[0].strip()
-                logger.debug("Extracted code from markdown blocks")
+            code = self._extract_code(code)
                 
-            logger.debug(f"Final generated code:\n{code}")
+            logger.debug("Final generated code:\n%s", code)
             return code
             
         except Exception as e:
-            logger.error(f"Error generating code: {str(e)}", exc_info=True)
-            raise
\ No newline at end of file
+            logger.error("Error generating code: %s", e, exc_info=True)
+            raise
+
+    async def stream_function(self, task_description: str, context: str = "") -> AsyncIterator[Tuple[str, Optional[str]]]:
+        """Generate code like generate_function, yielding ("token", text) as Claude writes it
+        and finally ("code", cleaned_code), or ("code", None) if nothing came back
+
+        Cached and coalesced requests skip straight to the final ("code", ...) event.
+        """
+        key = task_key(task_description, context)
+        code = self._cached(key)
+        if code is not None:
+            yield "code", code
+            return
+        if key in self._inflight:
+            yield "code", await self._join(key)
+            return
+
+        self._start(key)
+        try:
+            logger.debug("Streaming code generation for task: %s", task_description)
+            chunks = []
+            start = time.perf_counter()
+            async with self.claude.messages.stream(
+                model=GENERATION_MODEL,
+                max_tokens=GENERATION_MAX_TOKENS,
+                messages=[{"role": "user", "content": self._build_prompt(task_description, context)}]
+            ) as stream:
+                async for text in stream.text_stream:
+                    chunks.append(text)
+                    yield "token", text
+                final = await stream.get_final_message()
+            record_llm('generate', time.perf_counter() - start, getattr(final, 'usage', None))
+
+            code = "".join(chunks)
+            if not code:
+                logger.error("No content in Claude's response")
+                code = None
+            else:
+                code = self._extract_code(code)
+            self._finish(key, code)
+            yield "code", code
+
+        except Exception as e:
+            logger.error("Error generating code: %s", e, exc_info=True)
+            self._abandon(key, e)
+            raise
+        finally:
+            # The client may disconnect mid-stream; release anyone waiting on us
+            self._abandon(key, RuntimeError("Code generation was abandoned"))
\ No newline at end of file
@@ -1,18 +1,65 @@
 import ast
+import asyncio
+import importlib
+import itertools
 import os
 import inspect
+import sys
+import textwrap
 from typing import Optional, Tuple, Dict, List
 import logging
+import threading
+import time
 import anthropic
+from collections import Counter
+from code_validator import CodeValidator, fingerprint
+from function_index import FunctionIndex
+from llm_scheduler import is_overloaded
+from metrics import record_llm
+from prompt_builder import MatchPromptBuilder
+from registry_snapshot import RegistrySnapshot, code_hash, compile_method
 
 logger = logging.getLogger(__name__)
 
+MATCH_MODEL = "claude-3-5-sonnet-20241022"
+
+# Minimum local similarity score for a match to skip the Claude round-trip
+DEFAULT_MATCH_THRESHOLD = 0.45
+
 class DynamicCodeManager:
-    def __init__(self, filename="wordpress_api.py", claude_client=None):
+    """Registry of the WordPressAPI methods, matching requests to them and adding new ones
+
+    The registry is loaded from a snapshot kept next to the API file, so
+    startup does not parse the file and registry entries carry no code; the
+    file is only parsed when the snapshot is missing or out of date. The
+    match index is built on first use (or by warm()), and functions added
+    by other processes are picked up from the snapshot by refresh().
+
+    New functions go through static validation first, and one whose
+    normalized AST matches a registered function is not added again:
+    add_function returns the existing function's name, flagged as not created.
+    """
+
+    def __init__(self, filename="wordpress_api.py", claude_client=None, match_threshold=None):
         self.filename = filename
         self.claude = claude_client
-        self.current_code = self._read_current_code()
-        self.function_registry = self._analyze_existing_functions()
+        if match_threshold is None:
+            match_threshold = float(os.getenv("MATCH_THRESHOLD", DEFAULT_MATCH_THRESHOLD))
+        self.match_threshold = match_threshold
+        self.module_name = os.path.splitext(os.path.basename(filename))[0]
+        self._write_lock = threading.RLock()
+        # Guards the registry against changes while the index is built from it
+        self._index_lock = threading.Lock()
+        self._function_index: Optional[FunctionIndex] = None
+        # Normalized AST fingerprint -> name of the function registered with it
+        self._fingerprints: Dict[str, str] = {}
+        self._appendable = False
+        self.validator = CodeValidator()
+        self.snapshot = RegistrySnapshot(filename)
+        self._reset_registry(self._load_registry())
+        self.match_stats = {'local': 0, 'remote': 0}
+        self.function_usage = Counter()
+        self.prompt_builder = MatchPromptBuilder()
         
     def _read_current_code(self) -> str:
         """Read the current code from file or create base structure if doesn't exist"""
@@ -22,103 +69,239 @@ class DynamicCodeManager:
         except FileNotFoundError:
             base_code = """import requests
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator
 from datetime import datetime
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from wordpress_client import WordPressClient, WordPressAPIError
 
-class WordPressAPIError(Exception):
+class WordPressAPI(WordPressClient):
     pass
-
-class WordPressAPI:
-    def __init__(self):
-        self.wp_url = os.getenv("WP_URL")
-        self.wp_username = os.getenv("WP_USERNAME")
-        self.wp_password = os.getenv("WP_APP_PASSWORD")
-        
-        if not all([self.wp_url, self.wp_username, self.wp_password]):
-            missing = []
-            if not self.wp_url: missing.append("WP_URL")
-            if not self.wp_username: missing.append("WP_USERNAME")
-            if not self.wp_password: missing.append("WP_APP_PASSWORD")
-            raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
 """
             with open(self.filename, 'w') as f:
                 f.write(base_code)
             return base_code
 
-    def _analyze_existing_functions(self) -> Dict[str, Dict]:
+    def _load_registry(self) -> Dict[str, Dict]:
+        """Functions from the snapshot, re-analyzing the file only if it changed behind the snapshot's back"""
+        if not os.path.exists(self.filename):
+            self._read_current_code()
+        with self.snapshot.lock():
+            functions = self.snapshot.load()
+            if functions is not None:
+                self._appendable = self.snapshot.source['appendable']
+                logger.debug("Loaded %d functions from %s", len(functions), self.snapshot.path)
+                return functions
+            functions = self._analyze_existing_functions(self._read_current_code())
+            self.snapshot.rebuild(functions, self._appendable)
+            return functions
+
+    @property
+    def function_index(self) -> FunctionIndex:
+        """The local match index, built from the registry on first use"""
+        if self._function_index is None:
+            with self._index_lock:
+                if self._function_index is None:
+                    start = time.perf_counter()
+                    self._function_index = FunctionIndex(self.function_registry)
+                    logger.debug("Indexed %d functions in %.1fms", len(self.function_registry),
+                                 (time.perf_counter() - start) * 1000)
+        return self._function_index
+
+    def warm(self):
+        """Build the match index ahead of the first request"""
+        self.function_index
+
+    def _register(self, name: str, details: Dict):
+        with self._index_lock:
+            self.function_registry[name] = details
+            self._fingerprints.setdefault(details['fingerprint'], name)
+            if self._function_index is not None:
+                self._function_index.add(name, details)
+
+    def _reset_registry(self, functions: Dict[str, Dict]):
+        with self._index_lock:
+            self.function_registry = functions
+            self._fingerprints = {}
+            for name, details in functions.items():
+                self._fingerprints.setdefault(details['fingerprint'], name)
+            self._function_index = None
+
+    def refresh(self) -> int:
+        """Pick up functions other processes have added since the last look; returns how many
+
+        Checking costs one stat() of the snapshot, and new functions are
+        read from its tail, so this is cheap enough to run before every match.
+        """
+        # An add in progress refreshes first itself; don't hold up the caller behind it
+        if not self._write_lock.acquire(blocking=False):
+            return 0
+        try:
+            return self._refresh()
+        finally:
+            self._write_lock.release()
+
+    def _refresh(self) -> int:
+        added = self.snapshot.read_new()
+        if added is None:
+            # The file was rewritten: start over
+            return self.refresh_all()
+        for details in added:
+            self._register(details['name'], details)
+        return self._install(added)
+
+    def _install(self, added: List[Dict]) -> int:
+        """Compile new functions into the loaded WordPressAPI class, if it has been imported"""
+        if not added:
+            return 0
+        module = sys.modules.get(self.module_name)
+        if module is not None:
+            for details in added:
+                if not hasattr(module.WordPressAPI, details['name']):
+                    setattr(module.WordPressAPI, details['name'],
+                            self._compile_method(details['name'], self.function_code(details['name'])))
+        logger.info("Picked up %d new functions (registry version %d)", len(added), self.snapshot.version)
+        return len(added)
+
+    def refresh_all(self) -> int:
+        """Re-read the registry, re-analyzing the file if the snapshot is out of date"""
+        with self._write_lock:
+            known = set(self.function_registry)
+            self._reset_registry(self._load_registry())
+            return self._install([details for name, details in self.function_registry.items() if name not in known])
+
+    def function_code(self, name: str) -> str:
+        """Source of a registered function, read from the API file on demand"""
+        return self.snapshot.read_code(self.function_registry[name])
+
+    def _describe_function(self, item: ast.AST, code: str, span: List[int]) -> Dict:
+        """Registry entry for one method definition; span is the byte range of its source in the file"""
+        doc = ast.get_docstring(item)
+        params = [a.arg for a in item.args.args if a.arg != 'self']
+        returns = None
+        
+        # Get return type hint if exists
+        if item.returns:
+            returns = ast.unparse(item.returns)
+        
+        return {
+            'name': item.name,
+            'docstring': doc,
+            'parameters': params,
+            'returns': returns,
+            'hash': code_hash(code),
+            'fingerprint': fingerprint(item),
+            'span': span
+        }
+
+    def _analyze_existing_functions(self, code: str) -> Dict[str, Dict]:
         """Analyze existing functions and their purposes"""
         try:
-            tree = ast.parse(self.current_code)
+            tree = ast.parse(code)
             functions = {}
+            # AST column offsets count UTF-8 bytes, so spans are byte offsets too
+            line_starts = list(itertools.accumulate((len(line) for line in code.encode().splitlines(keepends=True)),
+                                                    initial=0))
+            
+            # New methods can only be appended to the file if the class body runs to its end
+            last = tree.body[-1] if tree.body else None
+            self._appendable = isinstance(last, ast.ClassDef) and last.name == "WordPressAPI"
             
             # Find the WordPressAPI class
             for node in ast.walk(tree):
                 if isinstance(node, ast.ClassDef) and node.name == "WordPressAPI":
                     # Analyze each function in the class
                     for item in node.body:
-                        if isinstance(item, ast.FunctionDef):
-                            doc = ast.get_docstring(item)
-                            params = [a.arg for a in item.args.args if a.arg != 'self']
-                            returns = None
+                        if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                            # From the start of the first line, so the source can be dedented
+                            first_line = item.decorator_list[0].lineno if item.decorator_list else item.lineno
+                            span = [line_starts[first_line - 1], line_starts[item.end_lineno - 1] + item.end_col_offset]
+                            functions[item.name] = self._describe_function(item, ast.unparse(item), span)
                             
-                            # Get return type hint if exists
-                            if item.returns:
-                                returns = ast.unparse(item.returns)
-                            
-                            functions[item.name] = {
-                                'name': item.name,
-                                'docstring': doc,
-                                'parameters': params,
-                                'returns': returns,
-                                'code': ast.unparse(item)
-                            }
-                            
-            logger.debug(f"Found {len(functions)} existing functions")
+            logger.debug("Found %d existing functions", len(functions))
             return functions
             
         except Exception as e:
-            logger.error(f"Error analyzing functions: {str(e)}")
+            logger.error("Error analyzing functions: %s", e)
             return {}
 
-    async def find_matching_function(self, user_request: str) -> Tuple[Optional[str], Optional[Dict]]:
+    def match_locally(self, user_request: str) -> Tuple[Optional[str], float]:
+        """Score the request against the local function index"""
+        start = time.perf_counter()
+        func_name, score = self.function_index.best_match(user_request)
+        logger.debug("Local match for %r: %s (%.3f) in %.2fms",
+                     user_request, func_name, score, (time.perf_counter() - start) * 1000)
+        return func_name, score
+
+    def _refresh_and_match(self, user_request: str) -> Tuple[Optional[str], float]:
+        self.refresh()
+        return self.match_locally(user_request)
+
+    async def find_matching_function(self, user_request: str, context: str = "") -> Tuple[Optional[str], Optional[Dict]]:
+        """Find an existing function for the request, asking Claude only when the local index is unsure
+
+        Raises the scheduler's error when Claude is too busy to ask, see
+        llm_scheduler.is_overloaded().
+
+        `context` summarizes earlier turns of the conversation; only the
+        Claude prompt uses it, the local index scores the request alone.
+        Refreshing the registry may take the snapshot lock or re-parse the
+        API file, and the index may still be building, so both run in a
+        worker thread rather than on the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        func_name, score = await loop.run_in_executor(None, self._refresh_and_match, user_request)
+        if func_name and score >= self.match_threshold:
+            self.match_stats['local'] += 1
+            self.function_usage[func_name] += 1
+            return func_name, self.function_registry[func_name]
+
+        self.match_stats['remote'] += 1
+        func_name, details = await self._find_matching_function_remote(user_request, context)
+        if func_name:
+            self.function_usage[func_name] += 1
+        return func_name, details
+
+    def _shortlist(self, user_request: str) -> List[str]:
+        """Best local candidates for Claude to choose from, topped up with frequently used functions"""
+        limit = self.prompt_builder.top_k
+        names = [name for name, _ in self.function_index.search(user_request, limit=limit)]
+        if len(names) < limit:
+            for name, _ in self.function_usage.most_common(limit):
+                if len(names) >= limit:
+                    break
+                if name not in names and name in self.function_registry:
+                    names.append(name)
+        if len(names) < limit:
+            for name in itertools.islice(self.function_registry, limit):
+                if len(names) >= limit:
+                    break
+                if name not in names:
+                    names.append(name)
+        return names
+
+    async def _find_matching_function_remote(self, user_request: str, context: str = "") -> Tuple[Optional[str], Optional[Dict]]:
         """Use Claude to determine if an existing function matches the user's request"""
         try:
-            # Prepare function registry for Claude
-            function_descriptions = []
-            for name, details in self.function_registry.items():
-                desc = f"""Function: {name}
-                Description: {details['docstring']}
-                Parameters: {', '.join(details['parameters'])}
-                Returns: {details['returns']}
-                """
-                function_descriptions.append(desc)
-                
-            prompt = f"""Given this user request: "{user_request}"
-            
-            Here are the existing functions:
-            {chr(10).join(function_descriptions)}
-            
-            Can any of these functions fulfill the user's request? If yes, which one?
-            Respond in this format:
-            MATCH: [function_name or "none"]
-            REASON: [brief explanation]
-            """
+            shortlist = await asyncio.get_running_loop().run_in_executor(None, self._shortlist, user_request)
+            prompt = self.prompt_builder.build(user_request, shortlist, self.function_registry, context=context)
+            if not prompt.candidates:
+                return None, None
             
+            start = time.perf_counter()
             response = await self.claude.messages.create(
-                model="claude-3-5-sonnet-20241022",
+                model=MATCH_MODEL,
                 max_tokens=1024,
-                messages=[{"role": "user", "content": prompt}]
+                system=prompt.system,
+                messages=prompt.messages
             )
+            record_llm('match', time.perf_counter() - start, getattr(response, 'usage', None))
+            self.prompt_builder.record_usage(prompt, getattr(response, 'usage', None))
             
             analysis = response.content[0].text
-            logger.debug(f"Claude function analysis: {analysis}")
+            logger.debug("Claude function analysis: %s", analysis)
             
             # Parse Claude's response
-            if "MATCH: none" in analysis.lower():
+            if "match: none" in analysis.lower():
                 return None, None
                 
             # Extract function name
@@ -131,49 +314,121 @@ class WordPressAPI:
             return None, None
             
         except Exception as e:
-            logger.error(f"Error finding matching function: {str(e)}")
+            if is_overloaded(e):
+                # Not "no match": falling through to a generate call would only add to the overload
+                raise
+            logger.error("Error finding matching function: %s", e)
             return None, None
 
-    def add_function(self, function_code: str) -> bool:
-        """Add a new function to the codebase"""
+    def add_function(self, function_code: str) -> Tuple[Optional[str], bool]:
+        """Add a new function to the codebase and the running WordPressAPI class
+
+        Returns the name of the function to call, or None if it could not be
+        added, and whether it was created: when the code is already
+        registered, or duplicates a registered function, that function's name
+        comes back with False.
+        """
+        # Callers run this in worker threads, and other processes may share the file
+        with self._write_lock, self.snapshot.lock():
+            # Another process may have added functions, or this very one
+            self.refresh()
+            if not self.snapshot.matches_source():
+                # Edited by hand since; the snapshot must not vouch for code it has not seen
+                self.refresh_all()
+            return self._add_function(function_code)
+
+    def _add_function(self, function_code: str) -> Tuple[Optional[str], bool]:
         try:
             # Parse the function code
             tree = ast.parse(function_code)
-            function_def = next(node for node in tree.body if isinstance(node, ast.FunctionDef))
+            function_def = next(node for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)))
             function_name = function_def.name
             
-            logger.debug(f"Adding function: {function_name}")
+            logger.debug("Adding function: %s", function_name)
             
-            # Parse current file
-            current_tree = ast.parse(self.current_code)
+            source = ast.unparse(function_def)
+            # Coalesced or cached generations hand out the same code more than once
+            if function_name in self.function_registry and \
+                    self.function_registry[function_name]['hash'] == code_hash(source):
+                logger.debug("Function %s is already registered", function_name)
+                return function_name, False
+
+            validation = self.validator.validate(function_def, source, set(vars(self._api_module())))
+            if not validation.ok:
+                logger.error("Rejected function %s: %s", function_name, "; ".join(validation.errors))
+                return None, False
+            existing = self._fingerprints.get(validation.fingerprint)
+            if existing is not None:
+                # Same code up to names, docstrings and formatting: reuse what is there
+                self.validator.prevented_duplicate()
+                logger.info("Function %s duplicates %s; using the existing function", function_name, existing)
+                return existing, False
+            if function_name in self.function_registry:
+                logger.error("Function %s already exists", function_name)
+                return None, False
             
-            # Find the WordPressAPI class
-            class_node = None
-            for node in ast.walk(current_tree):
-                if isinstance(node, ast.ClassDef) and node.name == "WordPressAPI":
-                    class_node = node
-                    break
-                    
-            if not class_node:
-                logger.error("WordPressAPI class not found")
-                return False
-                
-            # Add new function to class
-            class_node.body.append(function_def)
+            # Compile before touching the file so broken code never gets persisted
+            function = self._compile_method(function_name, source)
             
-            # Generate new code
-            new_code = ast.unparse(current_tree)
+            details = self._persist_function(function_def, source)
+            setattr(self._api_class(), function_name, function)
             
-            # Write updated code back to file
-            with open(self.filename, 'w') as f:
-                f.write(new_code)
-                
             # Update function registry
-            self._analyze_existing_functions()
+            self._register(function_name, details)
             
-            logger.info(f"Successfully added function: {function_name}")
-            return True
+            logger.info("Successfully added function: %s", function_name)
+            return function_name, True
             
         except Exception as e:
-            logger.error(f"Error adding function: {str(e)}")
-            return False
\ No newline at end of file
+            logger.error("Error adding function: %s", e)
+            return None, False
+
+    def _api_module(self):
+        """The imported module holding WordPressAPI (imported on first use)"""
+        return sys.modules.get(self.module_name) or importlib.import_module(self.module_name)
+
+    def _api_class(self):
+        return getattr(self._api_module(), "WordPressAPI")
+
+    def _compile_method(self, function_name: str, source: str):
+        """Compile a single method against the API module's globals"""
+        return compile_method(self._api_module(), function_name, source, self.filename)
+
+    def _persist_function(self, function_def: ast.AST, source: str) -> Dict:
+        """Write the method into the class body and the snapshot without re-parsing the file
+
+        Returns the function's registry entry.
+        """
+        if not self._appendable:
+            self._rewrite_with_function(source)
+            return self.function_registry[function_def.name]
+        method_code = ("\n\n" + textwrap.indent(source, "    ")).encode()
+        with open(self.filename, 'ab') as f:
+            start = f.tell()
+            f.write(method_code)
+            f.flush()
+            os.fsync(f.fileno())
+        # The method starts after the blank line separating it from the previous one
+        details = self._describe_function(function_def, source, [start + 2, start + len(method_code)])
+        self.snapshot.append(details, method_code)
+        return details
+
+    def _rewrite_with_function(self, source: str):
+        """Fallback for files where WordPressAPI is not the last statement: rewrite atomically"""
+        current_tree = ast.parse(self._read_current_code())
+        class_node = next((node for node in ast.walk(current_tree)
+                           if isinstance(node, ast.ClassDef) and node.name == "WordPressAPI"), None)
+        if not class_node:
+            raise ValueError("WordPressAPI class not found")
+        class_node.body.append(ast.parse(source).body[0])
+        new_code = ast.unparse(current_tree)
+        temp_name = f"{self.filename}.tmp"
+        with open(temp_name, 'w') as f:
+            f.write(new_code)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_name, self.filename)
+        self._appendable = True
+        # Spans of every function may have moved
+        self._reset_registry(self._analyze_existing_functions(new_code))
+        self.snapshot.rebuild(self.function_registry, self._appendable)
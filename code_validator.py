@@ -0,0 +1,175 @@
+import ast
+import builtins
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+from registry_snapshot import code_hash
+
+logger = logging.getLogger(__name__)
+
+# Modules generated functions have no business importing: process, network and interpreter control
+FORBIDDEN_IMPORTS = {
+    'builtins', 'ctypes', 'importlib', 'marshal', 'multiprocessing', 'pickle', 'pty', 'shutil',
+    'signal', 'socket', 'subprocess', 'sys',
+}
+
+# Builtins that run arbitrary code or import modules behind the checks above
+FORBIDDEN_NAMES = {'__import__', 'compile', 'eval', 'exec'}
+
+BUILTIN_NAMES = set(dir(builtins))
+
+
+def _strip_docstring(body: List[ast.stmt]) -> List[ast.stmt]:
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+            and isinstance(body[0].value.value, str):
+        body = body[1:]
+    return body or [ast.Pass()]
+
+
+def bound_names(function_def: ast.AST) -> Set[str]:
+    """Names a function binds itself: parameters, assignments, imports, nested definitions
+
+    Nested scopes are folded into one, which errs on the side of treating a
+    name as defined.
+    """
+    bound = set()
+    for node in ast.walk(function_def):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bound.add(node.id)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and node is not function_def:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            bound.update((alias.asname or alias.name).split('.')[0] for alias in node.names)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, (ast.ExceptHandler, ast.MatchAs, ast.MatchStar)) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            bound.add(node.rest)
+    return bound
+
+
+# Fields that do not change what a function does
+_IGNORED_FIELDS = {'annotation', 'returns', 'type_comment'}
+
+
+def _normalized_dump(node, local_names: Set[str], renamed: Dict[str, str]) -> str:
+    """ast.dump() without positions, annotations and docstrings, with bound names numbered by first use
+
+    Walks the tree read-only rather than transforming a copy, which would
+    cost more than the dump itself.
+    """
+    if isinstance(node, list):
+        return '[' + ', '.join(_normalized_dump(item, local_names, renamed) for item in node) + ']'
+    if not isinstance(node, ast.AST):
+        return repr(node)
+    fields = []
+    for field, value in ast.iter_fields(node):
+        if field in _IGNORED_FIELDS:
+            continue
+        if field == 'body' and isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            value = _strip_docstring(value)
+        elif isinstance(value, str) and (
+                (field == 'name' and isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef,
+                                                       ast.ExceptHandler)))
+                or (field == 'arg' and isinstance(node, ast.arg))
+                or (field == 'id' and value in local_names)):
+            value = renamed.setdefault(value, f'_{len(renamed)}')
+        fields.append(_normalized_dump(value, local_names, renamed))
+    return f"{type(node).__name__}({', '.join(fields)})"
+
+
+def fingerprint(function_def: ast.AST) -> str:
+    """Hash of a function's normalized AST
+
+    Two functions that differ only in their names, parameter and local
+    variable names, docstrings, type annotations or formatting get the
+    same fingerprint.
+    """
+    return code_hash(_normalized_dump(function_def, bound_names(function_def), {}))
+
+
+class ValidationResult:
+    """What static validation found out about one generated function"""
+
+    __slots__ = ('name', 'fingerprint', 'errors')
+
+    def __init__(self, name: str, fingerprint: str, errors: List[str]):
+        self.name = name
+        self.fingerprint = fingerprint
+        self.errors = errors
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+class CodeValidator:
+    """Static checks generated functions must pass before they are registered
+
+    A function is rejected if it does not take self first, uses a name
+    that is neither bound in the function, a global of the API module nor
+    a builtin, or imports a forbidden module. Its normalized AST
+    fingerprint lets the code manager spot near-duplicates of registered
+    functions. Results are cached by a hash of the source, so validating the
+    same code again (coalesced or cached generations) costs a dictionary
+    lookup.
+    """
+
+    def __init__(self, forbidden_imports: Optional[Iterable[str]] = None):
+        self.forbidden_imports = set(forbidden_imports if forbidden_imports is not None else FORBIDDEN_IMPORTS)
+        self._results: Dict[str, ValidationResult] = {}
+        self._lock = threading.Lock()
+        self.counters = {'validated': 0, 'cache_hits': 0, 'rejected': 0, 'duplicates_prevented': 0}
+
+    def validate(self, function_def: ast.AST, source: str, module_names: Set[str]) -> ValidationResult:
+        """Check one function definition; `source` is its unparsed code and the cache key"""
+        key = code_hash(source)
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self.counters['cache_hits'] += 1
+                return result
+        result = ValidationResult(function_def.name, fingerprint(function_def),
+                                  self._errors(function_def, module_names))
+        with self._lock:
+            self._results[key] = result
+            self.counters['validated'] += 1
+            if not result.ok:
+                self.counters['rejected'] += 1
+        return result
+
+    def _errors(self, function_def: ast.AST, module_names: Set[str]) -> List[str]:
+        errors = []
+        params = function_def.args.posonlyargs + function_def.args.args
+        if not params or params[0].arg != 'self':
+            errors.append("must be a method taking self as its first parameter")
+
+        for node in ast.walk(function_def):
+            modules = []
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                modules = [node.module]
+            for module in modules:
+                if module.split('.')[0] in self.forbidden_imports:
+                    errors.append(f"imports forbidden module {module}")
+
+        loaded = {node.id for node in ast.walk(function_def)
+                  if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+        for name in sorted(loaded & FORBIDDEN_NAMES):
+            errors.append(f"uses forbidden builtin {name}")
+        unresolved = loaded - FORBIDDEN_NAMES - bound_names(function_def) - module_names - BUILTIN_NAMES
+        if unresolved:
+            errors.append(f"uses undefined names: {', '.join(sorted(unresolved))}")
+        return errors
+
+    def prevented_duplicate(self):
+        with self._lock:
+            self.counters['duplicates_prevented'] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.counters, 'cached_results': len(self._results)}
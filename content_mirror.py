@@ -0,0 +1,360 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Mirrored content types and their REST routes
+MIRRORED_ROUTES = {
+    'posts': 'wp/v2/posts',
+    'pages': 'wp/v2/pages',
+    'media': 'wp/v2/media',
+    'categories': 'wp/v2/categories',
+    'tags': 'wp/v2/tags',
+}
+
+# Types that expose a modification date and so support incremental sync via modified_after
+INCREMENTAL_KINDS = {'posts', 'pages', 'media'}
+
+# Extra query parameters for a sync; drafts and private items need status=any
+SYNC_PARAMS = {
+    'posts': {'status': 'any', 'orderby': 'modified', 'order': 'asc'},
+    'pages': {'status': 'any', 'orderby': 'modified', 'order': 'asc'},
+    'media': {'orderby': 'modified', 'order': 'asc'},
+}
+
+# Collection query parameters the mirror can answer itself
+SUPPORTED_PARAMS = {'status', 'slug', 'search', 'per_page', 'page', '_fields'}
+
+# What the REST collections return when the query names no status; the mirror holds every status
+DEFAULT_STATUS = {'posts': 'publish', 'pages': 'publish'}
+
+# per_page WordPress assumes when a query asks for a page without saying how long pages are
+DEFAULT_PER_PAGE = 10
+
+_TAG_RE = re.compile(r'<[^>]+>')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    kind TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    slug TEXT,
+    status TEXT,
+    modified_gmt TEXT,
+    title TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (kind, id)
+);
+CREATE INDEX IF NOT EXISTS items_slug ON items (kind, slug);
+CREATE INDEX IF NOT EXISTS items_status ON items (kind, status);
+CREATE INDEX IF NOT EXISTS items_modified ON items (kind, modified_gmt);
+CREATE TABLE IF NOT EXISTS sync_state (
+    kind TEXT PRIMARY KEY,
+    last_modified TEXT,
+    synced_at REAL NOT NULL
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+    kind UNINDEXED, item_id UNINDEXED, title, content
+);
+"""
+
+
+def _rendered(value: Any) -> str:
+    """Plain text of a WordPress field that may be {'rendered': html} or a string"""
+    if isinstance(value, dict):
+        value = value.get('rendered') or value.get('raw') or ''
+    return _TAG_RE.sub(' ', value or '')
+
+
+def _cursor_before(modified: str) -> str:
+    """Step a modified_after cursor back one second
+
+    Modification dates only have second resolution and modified_after is
+    exclusive, so an edit in the same second as the last one seen would
+    otherwise be skipped. Items fetched twice are simply upserted again.
+    """
+    try:
+        return (datetime.fromisoformat(modified) - timedelta(seconds=1)).isoformat()
+    except ValueError:
+        return modified
+
+
+def kind_for_route(route: str) -> Optional[str]:
+    """Map a collection route or URL such as '.../wp/v2/pages' to its mirrored kind"""
+    path = route.split('?')[0].rstrip('/').split('/wp-json/')[-1].lstrip('/')
+    for kind, kind_route in MIRRORED_ROUTES.items():
+        if path == kind_route:
+            return kind
+    return None
+
+
+class ContentMirror:
+    """Local SQLite copy of posts, pages, media and terms
+
+    The first sync of a type downloads everything; later syncs of posts,
+    pages and media only fetch items changed since the newest `modified`
+    date seen (modified_after, which WordPress compares in site time), while terms, which have no modification date,
+    are re-read in full. Incremental syncs cannot see deletions, so a full
+    sync runs every `full_sync_interval` seconds. Reads are only served
+    while a type was synced within `max_staleness` seconds and no write
+    through the client has touched it since.
+    """
+
+    def __init__(self, api, path: Optional[str] = None, max_staleness: Optional[float] = None,
+                 full_sync_interval: Optional[float] = None):
+        self.api = api
+        self.path = path or os.getenv('WP_MIRROR_PATH', 'wordpress_mirror.db')
+        self.max_staleness = max_staleness if max_staleness is not None else \
+            float(os.getenv('MIRROR_MAX_STALENESS', 300))
+        self.full_sync_interval = full_sync_interval if full_sync_interval is not None else \
+            float(os.getenv('MIRROR_FULL_SYNC_INTERVAL', 86400))
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        try:
+            self._conn.executescript(FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            logger.warning("SQLite was built without FTS5; mirror search falls back to LIKE")
+            self.has_fts = False
+        self._last_full_sync: Dict[str, float] = {}
+        self._stale_kinds = set()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Sync
+
+    def sync(self, kinds: Optional[List[str]] = None, full: bool = False) -> Dict[str, int]:
+        """Bring the mirror up to date and return the number of items written per type"""
+        written = {}
+        for kind in kinds or MIRRORED_ROUTES:
+            written[kind] = self._sync_kind(kind, full)
+        return written
+
+    def _sync_kind(self, kind: str, full: bool) -> int:
+        started = time.time()
+        state = self._state(kind)
+        due_full = started - self._last_full_sync.get(kind, 0) >= self.full_sync_interval
+        incremental = (kind in INCREMENTAL_KINDS and state is not None and state['last_modified']
+                       and not full and not due_full)
+
+        params = dict(SYNC_PARAMS.get(kind, {}))
+        if incremental:
+            params['modified_after'] = _cursor_before(state['last_modified'])
+        # Clear the staleness mark before reading so writes made during the sync keep it stale
+        with self._lock:
+            self._stale_kinds.discard(kind)
+
+        seen = set()
+        newest = state['last_modified'] if state is not None else None
+        batch = []
+        count = 0
+        for item in self.api.iter_collection(MIRRORED_ROUTES[kind], params=params, use_mirror=False):
+            seen.add(item['id'])
+            modified = item.get('modified')
+            if modified and (newest is None or modified > newest):
+                newest = modified
+            batch.append(item)
+            if len(batch) >= 500:
+                self._upsert(kind, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self._upsert(kind, batch)
+            count += len(batch)
+
+        with self._lock, self._conn:
+            if not incremental:
+                # A full listing is authoritative: drop anything WordPress no longer returns
+                existing = {row['id'] for row in self._conn.execute('SELECT id FROM items WHERE kind = ?', (kind,))}
+                removed = existing - seen
+                for item_id in removed:
+                    self._delete(kind, item_id)
+                self._last_full_sync[kind] = started
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sync_state (kind, last_modified, synced_at) VALUES (?, ?, ?)',
+                (kind, newest, started))
+        logger.info("Mirror sync of %s: %d items (%s)", kind, count, 'incremental' if incremental else 'full')
+        return count
+
+    def _upsert(self, kind: str, items: List[Dict[str, Any]]):
+        with self._lock, self._conn:
+            for item in items:
+                title = _rendered(item.get('title')) or item.get('name') or ''
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO items (kind, id, slug, status, modified_gmt, title, data) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (kind, item['id'], item.get('slug'), item.get('status'), item.get('modified_gmt'),
+                     title, json.dumps(item)))
+                if self.has_fts:
+                    self._conn.execute('DELETE FROM items_fts WHERE kind = ? AND item_id = ?', (kind, item['id']))
+                    content = _rendered(item.get('content')) or item.get('description') or ''
+                    self._conn.execute('INSERT INTO items_fts (kind, item_id, title, content) VALUES (?, ?, ?, ?)',
+                                       (kind, item['id'], title, _rendered(content)))
+
+    def _delete(self, kind: str, item_id: int):
+        self._conn.execute('DELETE FROM items WHERE kind = ? AND id = ?', (kind, item_id))
+        if self.has_fts:
+            self._conn.execute('DELETE FROM items_fts WHERE kind = ? AND item_id = ?', (kind, item_id))
+
+    def _state(self, kind: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute('SELECT * FROM sync_state WHERE kind = ?', (kind,)).fetchone()
+
+    # Freshness
+
+    def mark_stale(self, route: str):
+        """Stop serving a type from the mirror after a write until the next sync"""
+        path = route.split('?')[0].split('/wp-json/')[-1].lstrip('/')
+        for kind, kind_route in MIRRORED_ROUTES.items():
+            if path == kind_route or path.startswith(kind_route + '/'):
+                with self._lock:
+                    self._stale_kinds.add(kind)
+
+    def is_fresh(self, kind: str) -> bool:
+        if kind in self._stale_kinds:
+            return False
+        state = self._state(kind)
+        return state is not None and time.time() - state['synced_at'] <= self.max_staleness
+
+    def serves(self, route: str, params: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Return the kind if this collection query can be answered from the mirror"""
+        kind = kind_for_route(route)
+        if kind is None or not set(params or {}) <= SUPPORTED_PARAMS:
+            return None
+        return kind if self.is_fresh(kind) else None
+
+    # Reads
+
+    def _project(self, row: sqlite3.Row, fields: Optional[List[str]]) -> Dict[str, Any]:
+        item = json.loads(row['data'])
+        if fields:
+            item = {key: value for key, value in item.items() if key in fields}
+        return item
+
+    @staticmethod
+    def _statuses(status: Optional[str]) -> List[str]:
+        """Statuses a status filter ('publish', 'draft,pending', 'any') admits; empty for all"""
+        statuses = [value.strip() for value in (status or '').split(',') if value.strip()]
+        return [] if 'any' in statuses else statuses
+
+    def iter_items(self, kind: str, status: Optional[str] = None, slug: Optional[str] = None,
+                   fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                   offset: int = 0) -> Iterator[Dict[str, Any]]:
+        """Yield mirrored items of a type, newest first, like the REST collection would
+
+        Unlike the REST collection, no status means every status.
+        """
+        query = 'SELECT data FROM items WHERE kind = ?'
+        args: List[Any] = [kind]
+        statuses = self._statuses(status)
+        if statuses:
+            query += ' AND status IN (%s)' % ', '.join('?' * len(statuses))
+            args.extend(statuses)
+        if slug:
+            query += ' AND slug = ?'
+            args.append(slug)
+        query += ' ORDER BY modified_gmt DESC, id DESC'
+        if limit is not None:
+            query += ' LIMIT ? OFFSET ?'
+            args.extend([limit, offset])
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        for row in rows:
+            yield self._project(row, fields)
+
+    def get(self, kind: str, item_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM items WHERE kind = ? AND id = ?', (kind, item_id)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def count(self, kind: str, status: Optional[str] = None) -> int:
+        query = 'SELECT COUNT(*) FROM items WHERE kind = ?'
+        args: List[Any] = [kind]
+        statuses = self._statuses(status)
+        if statuses:
+            query += ' AND status IN (%s)' % ', '.join('?' * len(statuses))
+            args.extend(statuses)
+        with self._lock:
+            return self._conn.execute(query, args).fetchone()[0]
+
+    def search(self, text: str, kind: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Full-text search over titles and content; blank text matches nothing"""
+        words = text.split()
+        if not words:
+            return []
+        with self._lock:
+            if self.has_fts:
+                # Quote each word so user input cannot inject FTS syntax
+                match = ' '.join('"%s"' % word.replace('"', '""') for word in words)
+                query = ('SELECT items.data FROM items_fts JOIN items '
+                         'ON items.kind = items_fts.kind AND items.id = items_fts.item_id '
+                         'WHERE items_fts MATCH ?')
+                args: List[Any] = [match]
+            else:
+                query = 'SELECT data FROM items WHERE title LIKE ?'
+                args = [f'%{text}%']
+            if kind:
+                query += ' AND items.kind = ?' if self.has_fts else ' AND kind = ?'
+                args.append(kind)
+            query += ' ORDER BY rank LIMIT ?' if self.has_fts else ' LIMIT ?'
+            args.append(limit)
+            rows = self._conn.execute(query, args).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def iter_collection(self, kind: str, params: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Answer a REST collection query (as accepted by serves()) from the mirror
+
+        Like WordPress, a query without a status returns only published
+        posts and pages. With `page`, only that page of `per_page` items
+        comes back; without it, every item does, as iter_collection walks
+        all pages anyway.
+        """
+        params = params or {}
+        fields = params.get('_fields')
+        if isinstance(fields, str):
+            fields = fields.split(',')
+        status = params.get('status') or DEFAULT_STATUS.get(kind)
+        limit, offset = None, 0
+        if params.get('page'):
+            limit = int(params.get('per_page') or DEFAULT_PER_PAGE)
+            offset = (int(params['page']) - 1) * limit
+        # WordPress ignores a blank search rather than matching nothing
+        if str(params.get('search') or '').strip():
+            items = self.search(params['search'], kind=kind, limit=10000)
+            statuses = self._statuses(status)
+            if statuses:
+                items = [item for item in items if item.get('status') in statuses]
+            if limit is not None:
+                items = items[offset:offset + limit]
+            if fields:
+                items = [{key: value for key, value in item.items() if key in fields} for item in items]
+            return iter(items)
+        return self.iter_items(kind, status=status, slug=params.get('slug'), fields=fields,
+                               limit=limit, offset=offset)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute('SELECT * FROM sync_state').fetchall()
+        return {
+            row['kind']: {
+                'items': self.count(row['kind']),
+                'synced_at': row['synced_at'],
+                'last_modified': row['last_modified'],
+                'fresh': self.is_fresh(row['kind']),
+            }
+            for row in rows
+        }
@@ -0,0 +1,42 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FunctionExecutor:
+    """Run WordPressAPI methods from async code without blocking the event loop
+
+    Coroutine functions are awaited directly. Legacy synchronous methods are
+    offloaded to a bounded thread pool, so a slow WordPress or Claude call
+    only occupies one worker thread instead of the whole event loop.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        if max_workers is None:
+            max_workers = int(os.getenv('EXECUTOR_THREADS', 32))
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='wp-sync')
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Call func with the given arguments and return its result"""
+        if inspect.iscoroutinefunction(func):
+            return await func(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        # Carry context variables into the worker thread like asyncio.to_thread does
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, func, *args, **kwargs)
+        result = await loop.run_in_executor(self._pool, call)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
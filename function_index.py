@@ -0,0 +1,175 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'for', 'from',
+    'i', 'in', 'is', 'it', 'me', 'my', 'of', 'on', 'or', 'our', 'please', 'show',
+    'that', 'the', 'this', 'to', 'us', 'we', 'what', 'which', 'with', 'you', 'your',
+    'args', 'returns', 'raises', 'str', 'int', 'dict', 'list', 'any', 'none', 'self'
+}
+
+# Action words that mean the same thing to the WordPress REST API
+ACTION_SYNONYMS = {
+    'get': 'get', 'list': 'get', 'fetch': 'get', 'retrieve': 'get', 'read': 'get',
+    'find': 'get', 'display': 'get', 'view': 'get', 'lookup': 'get',
+    'create': 'create', 'add': 'create', 'new': 'create', 'make': 'create', 'insert': 'create',
+    'update': 'update', 'edit': 'update', 'change': 'update', 'modify': 'update',
+    'set': 'update', 'rename': 'update',
+    'delete': 'delete', 'remove': 'delete', 'trash': 'delete', 'erase': 'delete',
+    'test': 'test', 'check': 'test', 'ping': 'test', 'verify': 'test',
+}
+
+ACTIONS = set(ACTION_SYNONYMS.values())
+
+# Penalty applied when the request asks for a different action than the function performs
+ACTION_MISMATCH_PENALTY = 0.5
+
+# Name tokens say more about what a function does than its docstring prose
+NAME_WEIGHT = 3
+PARAM_WEIGHT = 2
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_CAMEL_RE = re.compile(r'(?<=[a-z0-9])(?=[A-Z])')
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into lowercase, lightly stemmed tokens without stopwords"""
+    if not text:
+        return []
+    text = _CAMEL_RE.sub(' ', text).replace('_', ' ').lower()
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        if token in STOPWORDS or token.isdigit():
+            continue
+        token = _stem(token)
+        tokens.append(ACTION_SYNONYMS.get(token, token))
+    return tokens
+
+
+def _stem(token: str) -> str:
+    """Strip common plural suffixes so 'pages' matches 'page'"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def _actions(tokens: List[str]) -> set:
+    return {token for token in tokens if token in ACTIONS}
+
+
+class FunctionIndex:
+    """TF-IDF index over registered functions for local request matching
+
+    Scores are cosine similarities. Adding a function only touches its own
+    postings and norm, so the cost of an update does not grow with the size
+    of the registry; norms are recomputed in bulk by renormalize().
+    """
+
+    def __init__(self, registry: Optional[Dict[str, Dict]] = None):
+        self._term_counts: Dict[str, Counter] = {}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._norms: Dict[str, float] = {}
+        self._name_actions: Dict[str, set] = {}
+        for name, details in (registry or {}).items():
+            self._index(name, details)
+        self.renormalize()
+
+    def __len__(self) -> int:
+        return len(self._term_counts)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._term_counts
+
+    def _document_terms(self, name: str, details: Dict) -> Counter:
+        """Build the weighted bag of words describing one function"""
+        terms = Counter()
+        for token in tokenize(name):
+            terms[token] += NAME_WEIGHT
+        for param in details.get('parameters') or []:
+            for token in tokenize(param):
+                terms[token] += PARAM_WEIGHT
+        terms.update(tokenize(details.get('docstring')))
+        terms.update(tokenize(details.get('returns')))
+        return terms
+
+    def add(self, name: str, details: Dict):
+        """Add or replace a function in the index"""
+        if name in self._term_counts:
+            self.remove(name)
+        self._index(name, details)
+        self._norms[name] = self._norm(name)
+
+    def _index(self, name: str, details: Dict):
+        """Add a function's terms and postings, leaving its norm to the caller"""
+        terms = self._document_terms(name, details)
+        self._term_counts[name] = terms
+        self._name_actions[name] = _actions(tokenize(name))
+        for term, count in terms.items():
+            self._postings.setdefault(term, {})[name] = 1 + math.log(count)
+
+    def remove(self, name: str):
+        """Remove a function from the index"""
+        terms = self._term_counts.pop(name, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(name, None)
+                if not postings:
+                    del self._postings[term]
+        self._norms.pop(name, None)
+        self._name_actions.pop(name, None)
+
+    def _idf(self, term: str) -> float:
+        total = len(self._term_counts)
+        return math.log((1 + total) / (1 + len(self._postings.get(term, ())))) + 1
+
+    def _norm(self, name: str) -> float:
+        return math.sqrt(sum(((1 + math.log(count)) * self._idf(term)) ** 2
+                             for term, count in self._term_counts[name].items())) or 1.0
+
+    def renormalize(self):
+        """Recompute every document norm against the current vocabulary"""
+        self._norms = {name: self._norm(name) for name in self._term_counts}
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """Return up to `limit` (name, cosine score) pairs, best first"""
+        query_tokens = tokenize(query)
+        query_weights = {term: (1 + math.log(count)) * self._idf(term)
+                         for term, count in Counter(query_tokens).items()}
+        query_norm = math.sqrt(sum(weight * weight for weight in query_weights.values()))
+        if not query_norm:
+            return []
+
+        # Only functions sharing at least one term with the query can score
+        scores: Dict[str, float] = {}
+        for term, query_weight in query_weights.items():
+            idf = self._idf(term)
+            for name, weight in self._postings.get(term, {}).items():
+                scores[name] = scores.get(name, 0.0) + query_weight * weight * idf
+
+        query_actions = _actions(query_tokens)
+        results = []
+        for name, score in scores.items():
+            score /= self._norms[name] * query_norm
+            name_actions = self._name_actions[name]
+            if query_actions and name_actions and not (query_actions & name_actions):
+                score *= ACTION_MISMATCH_PENALTY
+            results.append((name, score))
+        return heapq.nsmallest(limit, results, key=lambda item: (-item[1], item[0]))
+
+    def best_match(self, query: str) -> Tuple[Optional[str], float]:
+        """Return the highest scoring function name and its score"""
+        results = self.search(query, limit=1)
+        if not results:
+            return None, 0.0
+        return results[0]
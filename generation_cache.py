@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Words that change how a request is phrased but not what it asks for
+FILLER_WORDS = {
+    'a', 'an', 'the', 'please', 'can', 'could', 'would', 'you', 'me', 'my', 'our',
+    'i', 'want', 'to', 'kindly', 'just', 'some', 'for', 'us'
+}
+
+# Words by which a request leans on earlier turns ("the same for drafts", "delete those")
+REFERENCE_WORDS = {
+    'it', 'its', 'they', 'them', 'their', 'these', 'those', 'ones', 'same', 'again', 'also', 'too',
+    'instead', 'previous', 'above', 'earlier'
+}
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize_task(task_description: str) -> str:
+    """Lowercase, drop punctuation and filler words so rephrasings share a key"""
+    words = _WORD_RE.findall(task_description.lower())
+    return ' '.join(word for word in words if word not in FILLER_WORDS)
+
+
+def task_context(task_description: str, context: str = '') -> str:
+    """The conversation context if the task refers back to it, else ''
+
+    A request that stands on its own gets the same prompt and cache key in
+    every session, however much history the session has.
+    """
+    if context and REFERENCE_WORDS.intersection(_WORD_RE.findall(task_description.lower())):
+        return context
+    return ''
+
+
+def task_key(task_description: str, context: str = '') -> str:
+    """Hash of the normalized task, and of the conversation context when the task refers to it"""
+    text = normalize_task(task_description)
+    context = task_context(task_description, context)
+    if context:
+        text += '\n' + normalize_task(context)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class GenerationCache:
+    """Append-only JSON Lines store mapping task hashes to generated code
+
+    Each store is a single appended line, so persisting does not get slower
+    as the cache grows; on load the last line for a key wins, and a line
+    without code removes the key.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('GENERATION_CACHE_PATH', 'generation_cache.jsonl')
+        self._entries: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        if record['code'] is None:
+                            self._entries.pop(record['key'], None)
+                        else:
+                            self._entries[record['key']] = record['code']
+                    except (ValueError, KeyError):
+                        logger.warning("Skipping malformed line in %s", self.path)
+        except FileNotFoundError:
+            return
+        logger.debug("Loaded %d cached generations from %s", len(self._entries), self.path)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._entries.get(key)
+
+    def store(self, key: str, task_description: str, code: str):
+        """Remember code for a task and append it to disk"""
+        with self._lock:
+            if self._entries.get(key) == code:
+                return
+            self._entries[key] = code
+            self._append({'key': key, 'task': normalize_task(task_description), 'code': code})
+
+    def discard(self, key: str) -> bool:
+        """Forget the code for a task, on disk too; returns whether there was any"""
+        with self._lock:
+            if self._entries.pop(key, None) is None:
+                return False
+            self._append({'key': key, 'code': None})
+            return True
+
+    def _append(self, record: Dict):
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError as e:
+            logger.error("Could not persist generation cache: %s", e)
@@ -0,0 +1,107 @@
+import codecs
+import json
+import sys
+from typing import Any, AsyncIterator, Iterable, Iterator, List
+
+# Drop the consumed part of the buffer once it grows past this many characters
+_COMPACT_AT = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+
+
+def _interned_object(pairs):
+    # json.loads shares key strings within one document; decoding element by
+    # element loses that, so intern keys to keep many similar items compact
+    return {sys.intern(key): value for key, value in pairs}
+
+
+class JSONArrayDecoder:
+    """Incrementally decode a top-level JSON array fed in byte chunks
+
+    Each element is decoded with json.JSONDecoder.raw_decode as soon as it is
+    complete, so the raw body is never held in memory at once.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder(object_pairs_hook=_interned_object)
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._started = False
+        self._finished = False
+
+    def _skip(self, chars: str):
+        while self._pos < len(self._buffer) and self._buffer[self._pos] in chars:
+            self._pos += 1
+
+    def feed(self, chunk: bytes, final: bool = False) -> List[Any]:
+        """Add a chunk and return the elements it completed"""
+        self._buffer += self._text.decode(chunk, final)
+        items = []
+        while not self._finished:
+            self._skip(_WHITESPACE)
+            if not self._started:
+                if self._pos >= len(self._buffer):
+                    break
+                if self._buffer[self._pos] != '[':
+                    raise ValueError('Expected a JSON array')
+                self._started = True
+                self._pos += 1
+                continue
+            self._skip(_WHITESPACE + ',')
+            if self._pos >= len(self._buffer):
+                break
+            if self._buffer[self._pos] == ']':
+                self._finished = True
+                break
+            try:
+                item, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break
+            # Only accept an element once its delimiter has arrived: a number
+            # such as 2.5e3 split across chunks would otherwise decode as 2
+            after = end
+            while after < len(self._buffer) and self._buffer[after] in _WHITESPACE:
+                after += 1
+            if after >= len(self._buffer):
+                if final:
+                    raise ValueError('Truncated JSON array')
+                break
+            if self._buffer[after] not in ',]':
+                partial_number = isinstance(item, (int, float)) and not isinstance(item, bool) and after == end
+                if partial_number and not final:
+                    break
+                raise ValueError(f'Unexpected character in JSON array at position {after}')
+            items.append(item)
+            self._pos = after + 1 if self._buffer[after] == ',' else after
+        if self._pos > _COMPACT_AT:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        return items
+
+    def close(self) -> List[Any]:
+        """Flush the decoder, raising ValueError if the array was incomplete"""
+        items = self.feed(b'', final=True)
+        if not self._finished:
+            raise ValueError('Truncated JSON array')
+        return items
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Yield the elements of a JSON array body as its chunks arrive"""
+    decoder = JSONArrayDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
+
+
+async def aiter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Async counterpart of iter_json_array()"""
+    decoder = JSONArrayDecoder()
+    async for chunk in chunks:
+        for item in decoder.feed(chunk):
+            yield item
+    for item in decoder.close():
+        yield item
@@ -0,0 +1,375 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import LLM_QUEUE_DEPTH, LLM_QUEUE_SECONDS, LLM_SCHEDULED, record_timing
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Lower goes first: matching is cheap and gates every chat, generation is slow and rare
+PRIORITIES = {'match': 0, 'generate': 1}
+
+# Seconds a call may wait for its turn before it is dropped
+DEFAULT_MAX_WAIT = {'match': 15.0, 'generate': 60.0}
+
+# Rate limited, overloaded
+RETRY_STATUSES = (429, 529)
+
+# Seconds clients turned away while Claude is saturated are asked to wait, at least
+BUSY_RETRY_AFTER = 5
+
+
+class LLMDeadlineExceeded(Exception):
+    """A Claude call could not be sent before its deadline and was dropped"""
+
+
+def is_overloaded(error: BaseException) -> bool:
+    """Whether a Claude call failed because the service is saturated rather than because of the call
+
+    True for calls dropped at their deadline and for rate limit or overload
+    errors that outlasted the retries.
+    """
+    return isinstance(error, LLMDeadlineExceeded) or getattr(error, 'status_code', None) in RETRY_STATUSES
+
+
+def estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """Tokens a messages call may use: its prompt at about four characters per token, plus max_tokens"""
+    chars = len(str(kwargs.get('system') or ''))
+    for message in kwargs.get('messages', []):
+        chars += len(str(message.get('content', '')))
+    return chars // 4 + int(kwargs.get('max_tokens') or 0)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _used_tokens(usage) -> Optional[int]:
+    if usage is None:
+        return None
+    return sum(getattr(usage, name, 0) or 0 for name in ('input_tokens', 'output_tokens'))
+
+
+class _Waiter:
+    def __init__(self, purpose: str, tokens: int, deadline: float, future: asyncio.Future):
+        self.purpose = purpose
+        self.tokens = tokens
+        self.deadline = deadline
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class LLMScheduler:
+    """Queue in front of the Claude client that keeps calls within the account's limits
+
+    Calls wait in a priority queue: match calls go ahead of generations, and
+    calls of one kind are served first come, first served. A call is sent
+    once a concurrency slot is free and the requests-per-minute and
+    tokens-per-minute buckets allow it. Its token cost is estimated up front
+    and the unused part refunded once the response reports its usage.
+
+    A call that cannot be sent before its deadline is dropped with
+    LLMDeadlineExceeded rather than answered too late. 429 and 529
+    responses are retried with jittered exponential backoff, or after the
+    Retry-After the API asked for. A 429 also pauses every other call for
+    that long, since they would be rejected too.
+
+    scheduled_client(purpose) returns a drop-in for the Anthropic client.
+    """
+
+    def __init__(self, client, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, max_concurrency: Optional[int] = None,
+                 max_retries: Optional[int] = None, max_wait: Optional[Dict[str, float]] = None,
+                 burst_seconds: Optional[float] = None, backoff_base: float = 1.0, backoff_cap: float = 30.0):
+        self.client = client
+        requests_per_minute = requests_per_minute or float(os.getenv('LLM_REQUESTS_PER_MINUTE', 0))
+        tokens_per_minute = tokens_per_minute or float(os.getenv('LLM_TOKENS_PER_MINUTE', 0))
+        # The API refills its limits continuously, so a full minute's allowance at once can still be rejected
+        burst_seconds = burst_seconds or float(os.getenv('LLM_BURST_SECONDS', 10))
+        self.requests = TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 60 * burst_seconds),
+                                    name='llm-requests') if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute / 60 * burst_seconds,
+                                  name='llm-tokens') if tokens_per_minute else None
+        self.max_concurrency = max_concurrency or int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('LLM_MAX_RETRIES', 4))
+        self.max_wait = dict(DEFAULT_MAX_WAIT)
+        for purpose in PRIORITIES:
+            value = os.getenv(f'LLM_{purpose.upper()}_MAX_WAIT')
+            if value:
+                self.max_wait[purpose] = float(value)
+        self.max_wait.update(max_wait or {})
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self._queue: List[Tuple[int, int, _Waiter]] = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._stats = {purpose: {'sent': 0, 'retried': 0, 'dropped': 0, 'failed': 0, 'waited_s': 0.0,
+                                 'max_wait_s': 0.0} for purpose in PRIORITIES}
+
+    def scheduled_client(self, purpose: str) -> 'ScheduledClient':
+        """A stand-in for the Anthropic client whose calls are scheduled as `purpose`"""
+        if purpose not in PRIORITIES:
+            raise ValueError(f'Unknown purpose: {purpose}')
+        return ScheduledClient(self, purpose)
+
+    def _depth(self) -> Dict[str, int]:
+        depth = dict.fromkeys(PRIORITIES, 0)
+        for _, _, waiter in self._queue:
+            if not waiter.future.done():
+                depth[waiter.purpose] += 1
+        return depth
+
+    def _report_depth(self):
+        for purpose, depth in self._depth().items():
+            LLM_QUEUE_DEPTH.set(depth, purpose=purpose)
+
+    def _ensure_dispatcher(self):
+        if (self._dispatcher is None or self._dispatcher.done()
+                or self._dispatcher.get_loop() is not asyncio.get_running_loop()):
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def _drop(self, waiter: _Waiter, reason: str) -> LLMDeadlineExceeded:
+        self._stats[waiter.purpose]['dropped'] += 1
+        LLM_SCHEDULED.inc(purpose=waiter.purpose, outcome='dropped')
+        logger.warning("Dropped %s call after %.2fs in the queue: %s",
+                       waiter.purpose, time.monotonic() - waiter.enqueued, reason)
+        return LLMDeadlineExceeded(reason)
+
+    def _reserve(self, tokens: int) -> float:
+        delay = 0.0
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(tokens))
+        return delay
+
+    def _unreserve(self, tokens: int):
+        if self.requests is not None:
+            self.requests.refund(1)
+        if self.tokens is not None:
+            self.tokens.refund(tokens)
+
+    async def _dispatch(self):
+        """Hand out send permits to waiters in priority order as slots and budget allow"""
+        while True:
+            if not self._queue or self._in_flight >= self.max_concurrency:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            _, _, waiter = heapq.heappop(self._queue)
+            if waiter.future.done():
+                # The caller gave up
+                continue
+            if waiter.deadline <= time.monotonic():
+                waiter.future.set_exception(self._drop(waiter, f"not sent within {self.max_wait[waiter.purpose]:g}s"))
+                continue
+            delay = self._reserve(waiter.tokens)
+            if time.monotonic() + delay > waiter.deadline:
+                self._unreserve(waiter.tokens)
+                waiter.future.set_exception(self._drop(waiter, f"rate limits would delay it {delay:.1f}s, past its deadline"))
+                continue
+            if delay:
+                # Later arrivals of higher priority are served next; this one already has its budget
+                await asyncio.sleep(delay)
+            if waiter.future.done():
+                self._unreserve(waiter.tokens)
+                continue
+            self._in_flight += 1
+            waiter.future.set_result(None)
+            self._report_depth()
+
+    async def _admit(self, purpose: str, tokens: int, deadline: float):
+        """Wait for this call's turn; on return it holds a concurrency slot"""
+        self._ensure_dispatcher()
+        waiter = _Waiter(purpose, tokens, deadline, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, (PRIORITIES[purpose], next(self._sequence), waiter))
+        self._report_depth()
+        self._wakeup.set()
+        try:
+            # Give up at the deadline even if the dispatcher is busy with slots or budget
+            await asyncio.wait_for(asyncio.shield(waiter.future), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            if waiter.future.done():
+                # Decided just as the deadline passed; raises if it was dropped
+                waiter.future.result()
+                return
+            waiter.future.cancel()
+            raise self._drop(waiter, f"not sent within {self.max_wait[purpose]:g}s")
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # Granted just as the caller was cancelled
+                self._release()
+            waiter.future.cancel()
+            raise
+        finally:
+            waited = time.monotonic() - waiter.enqueued
+            stats = self._stats[purpose]
+            stats['waited_s'] += waited
+            stats['max_wait_s'] = max(stats['max_wait_s'], waited)
+            LLM_QUEUE_SECONDS.observe(waited, purpose=purpose)
+            record_timing(f'llm-queue-{purpose}', waited)
+            self._report_depth()
+
+    def _release(self, tokens: int = 0, usage=None):
+        """Free a concurrency slot and refund tokens reserved beyond what the call used"""
+        self._in_flight -= 1
+        used = _used_tokens(usage)
+        if self.tokens is not None and used is not None and used < tokens:
+            self.tokens.refund(tokens - used)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Full jitter, so callers rejected together do not retry together"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay += retry_after
+        return delay
+
+    async def run(self, purpose: str, kwargs: Dict[str, Any], send: Callable[[], Awaitable[Any]]) -> Tuple[Any, int]:
+        """Send a call when its turn comes, retrying rate limit and overload errors
+
+        Returns send()'s result and the tokens reserved for it. The caller
+        then holds a concurrency slot and must hand it back with
+        _release(tokens, usage) once the response is complete.
+        """
+        tokens = estimate_tokens(kwargs)
+        deadline = time.monotonic() + self.max_wait[purpose]
+        stats = self._stats[purpose]
+        for attempt in itertools.count():
+            await self._admit(purpose, tokens, deadline)
+            try:
+                result = await send()
+            except Exception as e:
+                # A rejected call's tokens stay spent, which slows the next ones down
+                self._release()
+                status = getattr(e, 'status_code', None)
+                if status not in RETRY_STATUSES or attempt >= self.max_retries:
+                    stats['failed'] += 1
+                    LLM_SCHEDULED.inc(purpose=purpose, outcome='failed')
+                    raise
+                delay = self._backoff(attempt, _retry_after(e))
+                if time.monotonic() + delay > deadline:
+                    stats['failed'] += 1
+                    LLM_SCHEDULED.inc(purpose=purpose, outcome='failed')
+                    raise
+                if status == 429:
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                stats['retried'] += 1
+                LLM_SCHEDULED.inc(purpose=purpose, outcome='retried')
+                logger.warning("Claude returned %s for a %s call; retrying in %.2fs (attempt %d)",
+                               status, purpose, delay, attempt + 1)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self._release()
+                raise
+            stats['sent'] += 1
+            LLM_SCHEDULED.inc(purpose=purpose, outcome='sent')
+            return result, tokens
+
+    def retry_after(self) -> int:
+        """Seconds a client turned away for overload should wait before trying again"""
+        return max(BUSY_RETRY_AFTER, math.ceil(self._paused_until - time.monotonic()))
+
+    def stats(self) -> Dict[str, Any]:
+        waits = {}
+        for purpose, stats in self._stats.items():
+            # Every attempt waited once, whether it was then sent, retried, failed or dropped
+            admitted = stats['sent'] + stats['retried'] + stats['failed'] + stats['dropped']
+            waits[purpose] = {**{k: v for k, v in stats.items() if k != 'waited_s'},
+                              'max_wait_s': round(stats['max_wait_s'], 4),
+                              'mean_wait_s': round(stats['waited_s'] / admitted, 4) if admitted else None}
+        return {
+            'queue_depth': self._depth(),
+            'in_flight': self._in_flight,
+            'max_concurrency': self.max_concurrency,
+            'paused_for_s': round(max(0.0, self._paused_until - time.monotonic()), 3),
+            'requests_bucket': self.requests.stats() if self.requests is not None else None,
+            'tokens_bucket': self.tokens.stats() if self.tokens is not None else None,
+            'purposes': waits,
+        }
+
+
+class _ScheduledStream:
+    """messages.stream() context manager whose request waits for its turn"""
+
+    def __init__(self, scheduler: LLMScheduler, purpose: str, client, kwargs: Dict[str, Any]):
+        self.scheduler = scheduler
+        self.purpose = purpose
+        self.client = client
+        self.kwargs = kwargs
+        self._manager = None
+        self._stream = None
+        self._tokens = 0
+        self._usage = None
+
+    async def __aenter__(self):
+        async def open_stream():
+            # The request goes out, and rate limit errors surface, when the stream is entered
+            manager = self.client.messages.stream(**self.kwargs)
+            stream = await manager.__aenter__()
+            return manager, stream
+
+        (self._manager, self._stream), self._tokens = await self.scheduler.run(self.purpose, self.kwargs, open_stream)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        try:
+            return await self._manager.__aexit__(*exc_info)
+        finally:
+            self.scheduler._release(self._tokens, self._usage)
+
+    @property
+    def text_stream(self):
+        return self._stream.text_stream
+
+    async def get_final_message(self):
+        message = await self._stream.get_final_message()
+        self._usage = getattr(message, 'usage', None)
+        return message
+
+    def __getattr__(self, name: str):
+        return getattr(self._stream, name)
+
+
+class _ScheduledMessages:
+    def __init__(self, scheduler: LLMScheduler, purpose: str):
+        self.scheduler = scheduler
+        self.purpose = purpose
+
+    async def create(self, **kwargs):
+        client = self.scheduler.client
+        response, tokens = await self.scheduler.run(self.purpose, kwargs, lambda: client.messages.create(**kwargs))
+        self.scheduler._release(tokens, getattr(response, 'usage', None))
+        return response
+
+    def stream(self, **kwargs) -> _ScheduledStream:
+        return _ScheduledStream(self.scheduler, self.purpose, self.scheduler.client, kwargs)
+
+
+class ScheduledClient:
+    """The subset of the Anthropic client this service uses, with every call scheduled"""
+
+    def __init__(self, scheduler: LLMScheduler, purpose: str):
+        self.messages = _ScheduledMessages(scheduler, purpose)
@@ -1,35 +1,66 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 import anthropic
+import functools
+import itertools
+import json
 import requests
 import uvicorn
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, Iterator, AsyncIterator
+import inspect
 import os  # Added missing import
 from dotenv import load_dotenv
 from code_manager import DynamicCodeManager  # This import should now work
 from code_generator import CodeGenerator
 from wordpress_api import WordPressAPI
+from function_executor import FunctionExecutor
+from bulk_executor import BulkExecutor
+from content_mirror import ContentMirror
+from sandbox import SandboxExecutor
+from session_store import Session, SessionStore
+from llm_scheduler import LLMScheduler, is_overloaded
+from site_registry import SiteRegistry
+from logging_config import configure_logging
+from metrics import (CHAT_REQUESTS, REGISTRY, current_timings, finish_request, server_timing_header,
+                     stage, start_request, summarize_timings)
+import asyncio
 import logging
-
-# Set up logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+import time
 
 # Load environment variables
 load_dotenv()
 
+# Set up logging: JSON records written by a background thread, INFO unless LOG_LEVEL says otherwise
+configure_logging()
+logger = logging.getLogger(__name__)
+
 # Initialize FastAPI app
 app = FastAPI()
-claude = anthropic.Client(api_key=os.getenv("ANTHROPIC_API_KEY"))
-wp_api = WordPressAPI()
-code_manager = DynamicCodeManager()
-code_generator = CodeGenerator(claude)
+# Retries are left to the scheduler, which also keeps other calls from piling onto a 429
+claude = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=0)
+llm_scheduler = LLMScheduler(claude)
+# Every managed site, each with its own client; wp_api is the default site
+sites = SiteRegistry(WordPressAPI)
+wp_api = sites.get()
+code_manager = DynamicCodeManager(claude_client=llm_scheduler.scheduled_client("match"))
+code_generator = CodeGenerator(llm_scheduler.scheduled_client("generate"))
+executor = FunctionExecutor()
+bulk_executor = BulkExecutor(wp_api, executor)
+
+# Optional local SQLite mirror of the site's content, enabled by WP_MIRROR_PATH
+mirror = ContentMirror(wp_api) if os.getenv("WP_MIRROR_PATH") else None
+if mirror is not None:
+    wp_api.attach_mirror(mirror)
+MIRROR_SYNC_INTERVAL = float(os.getenv("MIRROR_SYNC_INTERVAL", 60))
+
+# Conversation state kept server-side, so clients send only their new message
+sessions = SessionStore()
+
+# Optional pool of worker processes for running registered functions, enabled by SANDBOX_WORKERS
+sandbox = SandboxExecutor() if int(os.getenv("SANDBOX_WORKERS", 0)) > 0 else None
 
 # Enable CORS
 app.add_middleware(
@@ -40,6 +71,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Number of collection items formatted per streamed result chunk
+RESULT_CHUNK_ITEMS = 200
+
+# The only item fields the chat formatter shows
+SUMMARY_FIELDS = ['id', 'title', 'link']
+
+# Said instead of generating code when Claude is saturated and a call was dropped
+BUSY_REPLY = "Claude is busy right now, so I couldn't work on your request. Please try again in a moment."
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Report the stages recorded while handling a request in a Server-Timing header"""
+    token = start_request()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        timings = finish_request(token)
+    # For streamed responses this is the time to the headers; later stages go in the final SSE event
+    timings.append(("total", time.perf_counter() - start))
+    response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
 # Serve static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -49,42 +103,282 @@ class Message(BaseModel):
 
 class ChatRequest(BaseModel):
     messages: List[Message]
+    # A site name, or "all" to ask every site; by default taken from the message
+    site: Optional[str] = None
+
+class SessionMessage(BaseModel):
+    content: str
+    site: Optional[str] = None
+
+class BatchOperation(BaseModel):
+    method: str = "POST"
+    path: str
+    body: Optional[Dict[str, Any]] = None
+
+class BulkRequest(BaseModel):
+    # Either a registry function plus one argument set per call...
+    function: Optional[str] = None
+    args: List[Dict[str, Any]] = []
+    # ...or raw REST writes, sent through /batch/v1 in groups of 25
+    operations: List[BatchOperation] = []
+    concurrency: Optional[int] = None
 
 @app.get("/", response_class=HTMLResponse)
 def get_index():
     with open("static/index.html") as f:
         return f.read()
 
+def format_item(item) -> str:
+    """Render one collection item, preferring its title"""
+    if isinstance(item, dict) and 'title' in item:
+        title = item['title']
+        return f"- {title['rendered'] if isinstance(title, dict) else title}"
+    return f"- {item}"
+
+def display_kwargs(func) -> Dict[str, Any]:
+    """Ask functions that support projection for only the fields the formatter shows"""
+    try:
+        parameters = inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return {}
+    return {"fields": SUMMARY_FIELDS} if "fields" in parameters else {}
+
+async def run_registered(func_name: str, site: Optional[str] = None):
+    """Run a registry function for one site, in a sandbox worker when enabled, otherwise in this process"""
+    func = getattr(sites.get(site), func_name)
+    if sandbox is not None:
+        return await sandbox.run(func_name, site=site, **display_kwargs(func))
+    return await executor.run(func, **display_kwargs(func))
+
+def resolve_sites(user_request: str, site: Optional[str]) -> List[str]:
+    try:
+        return sites.resolve(user_request, site)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+async def site_results(func_name: str, targets: List[str]) -> AsyncIterator[str]:
+    """Run a function on every target site, yielding each site's formatted section as it completes"""
+    async def call(site: str) -> str:
+        return await render_result(await run_registered(func_name, site))
+
+    async for outcome in bulk_executor.fan_out(call, targets):
+        body = outcome["result"] if outcome["ok"] else f"Error: {outcome['error']}"
+        yield f"### {outcome['site']}\n{body}\n\n"
+
+def format_result(result) -> str:
+    """Format a function result for the chat, consuming iterators one item at a time"""
+    if isinstance(result, list) and len(result) > 0 and isinstance(result[0], dict) and 'title' in result[0]:
+        # It's probably a list of pages/posts
+        return "\n".join(format_item(item) for item in result)
+    if isinstance(result, Iterator):
+        return "\n".join(format_item(item) for item in result)
+    return str(result)
+
+async def render_result(result) -> str:
+    """Format a result without blocking the event loop on lazily fetched collections"""
+    if inspect.isasyncgen(result):
+        return "\n".join([format_item(item) async for item in result])
+    if isinstance(result, Iterator):
+        # Iterating may trigger further page fetches, so do it off the loop
+        return await executor.run(format_result, result)
+    return format_result(result)
+
+def take_formatted(iterator: Iterator, size: int) -> List[str]:
+    """Format the next `size` items of an iterator"""
+    return [format_item(item) for item in itertools.islice(iterator, size)]
+
+async def stream_result(result) -> AsyncIterator[str]:
+    """Yield the formatted result in chunks instead of building one large string"""
+    if inspect.isasyncgen(result):
+        lines = []
+        async for item in result:
+            lines.append(format_item(item))
+            if len(lines) >= RESULT_CHUNK_ITEMS:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+        return
+    if isinstance(result, list) and len(result) > 0 and isinstance(result[0], dict) and 'title' in result[0]:
+        for start in range(0, len(result), RESULT_CHUNK_ITEMS):
+            yield "\n".join(format_item(item) for item in result[start:start + RESULT_CHUNK_ITEMS]) + "\n"
+        return
+    if isinstance(result, Iterator):
+        while True:
+            # Pulling items may fetch further pages, so do it off the loop
+            lines = await executor.run(take_formatted, result, RESULT_CHUNK_ITEMS)
+            if not lines:
+                return
+            yield "\n".join(lines) + "\n"
+    yield str(result)
+
+def sse(event: str, data: Dict) -> str:
+    """Encode one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def done_event() -> str:
+    """Final SSE frame; carries the stage timings, which stream too late for a Server-Timing header"""
+    timings = {name: {"ms": round(entry["ms"], 1), "count": entry["count"]}
+               for name, entry in summarize_timings(current_timings()).items()}
+    return sse("done", {"timings": timings})
+
+async def chat_events(user_request: str, context: str = "", turn: Optional[Dict[str, Any]] = None,
+                      targets: Optional[List[str]] = None) -> AsyncIterator[str]:
+    """Run the chat pipeline, emitting stage, token and text events as each step progresses
+
+    Concatenating the data of all "text" events gives the assistant's reply.
+    `context` summarizes earlier turns of a session; `turn`, if given, is
+    filled in with the reply parts and the function that answered. With
+    several `targets` sites, each site's result is sent as soon as it arrives.
+    """
+    targets = targets or [sites.default]
+    turn = turn if turn is not None else {}
+    reply = turn.setdefault("reply", [])
+
+    def text(value: str) -> str:
+        reply.append(value)
+        return sse("text", {"text": value})
+
+    yield sse("stage", {"stage": "matching"})
+    try:
+        code = None
+        created = False
+        with stage("match"):
+            func_name, func_details = await code_manager.find_matching_function(user_request, context)
+
+        if func_name:
+            logger.info("Found matching function: %s", func_name)
+            CHAT_REQUESTS.inc(path="match")
+            turn["function"] = func_name
+            yield sse("stage", {"stage": "matched", "function": func_name})
+            yield text(f"I found an existing function ({func_name}) that can help. Here's the result:\n\n")
+        else:
+            logger.info("No matching function found, generating new code...")
+            yield sse("stage", {"stage": "generating"})
+            with stage("generate"):
+                async for kind, value in code_generator.stream_function(user_request, context):
+                    if kind == "token":
+                        yield sse("token", {"text": value})
+                    else:
+                        code = value
+
+            if code is None:
+                CHAT_REQUESTS.inc(path="generation_failed")
+                yield text("I apologize, but I wasn't able to generate code for your request. Could you please rephrase it?")
+                yield done_event()
+                return
+            with stage("add_function"):
+                func_name, created = await executor.run(code_manager.add_function, code)
+            if not func_name:
+                CHAT_REQUESTS.inc(path="add_failed")
+                code_generator.forget(user_request, context)
+                yield text("I wasn't able to add the new function to handle your request. This might be due to a code error or naming conflict.")
+                yield done_event()
+                return
+            code_generator.remember(user_request, context, code)
+            turn.update(function=func_name, created=created)
+            if created:
+                CHAT_REQUESTS.inc(path="generate")
+                yield sse("stage", {"stage": "generated", "function": func_name})
+                yield text("I've created and executed a new function to handle your request. Here's the result:\n\n")
+            else:
+                # The generated code turned out to be a function we already had
+                CHAT_REQUESTS.inc(path="reused")
+                yield sse("stage", {"stage": "matched", "function": func_name})
+                yield text(f"I already had a function ({func_name}) that does this. Here's the result:\n\n")
+
+        yield sse("stage", {"stage": "executing", "function": func_name, "sites": targets})
+        try:
+            if len(targets) > 1:
+                with stage("fan_out"):
+                    async for section in site_results(func_name, targets):
+                        yield text(section)
+            else:
+                with stage("execute"):
+                    result = await run_registered(func_name, targets[0])
+                with stage("format"):
+                    async for chunk in stream_result(result):
+                        yield text(chunk)
+        except Exception as e:
+            logger.error("Error executing function %s: %s", func_name, e)
+            CHAT_REQUESTS.inc(path="execution_failed")
+            yield text(f"\n\nI encountered an error when executing {func_name}: {str(e)}")
+
+        if created:
+            yield text(f"\n\nI added this function for future use:\n```python\n{code}\n```")
+
+    except Exception as e:
+        if is_overloaded(e):
+            logger.warning("Turned a chat request away, Claude is saturated: %s", e)
+            CHAT_REQUESTS.inc(path="busy")
+            yield text(BUSY_REPLY)
+            yield sse("busy", {"retry_after": llm_scheduler.retry_after()})
+        else:
+            logger.error("Error in chat stream: %s", e, exc_info=True)
+            CHAT_REQUESTS.inc(path="error")
+            yield sse("error", {"message": str(e)})
+    yield done_event()
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    logger.debug("Received streaming chat request with %d messages", len(request.messages))
+    user_request = request.messages[-1].content
+    targets = resolve_sites(user_request, request.site)
+    return event_stream(chat_events(user_request, targets=targets))
+
+def event_stream(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/chat")
 async def chat(request: ChatRequest):
-    logger.debug(f"Received chat request: {request}")
-    
+    logger.debug("Received chat request with %d messages", len(request.messages))
+    user_request = request.messages[-1].content
+    return await chat_reply(user_request, targets=resolve_sites(user_request, request.site))
+
+async def execute(func_name: str, targets: List[str]) -> str:
+    """Run a function on the target sites and format the result; several sites are queried concurrently"""
+    if len(targets) > 1:
+        with stage("fan_out"):
+            sections = {}
+            async for section in site_results(func_name, targets):
+                sections[section.split("\n", 1)[0]] = section
+        # Report sites in their configured order rather than completion order
+        return "".join(sections[f"### {site}"] for site in targets).rstrip()
+    with stage("execute"):
+        result = await run_registered(func_name, targets[0])
+    with stage("format"):
+        return await render_result(result)
+
+async def chat_reply(user_request: str, context: str = "", turn: Optional[Dict[str, Any]] = None,
+                     targets: Optional[List[str]] = None) -> Dict[str, str]:
+    """Answer one request; `turn`, if given, is filled in with the function that answered"""
+    turn = turn if turn is not None else {}
+    targets = targets or [sites.default]
     try:
-        user_request = request.messages[-1].content
-        
         # First, check if we have a suitable existing function
-        func_name, func_details = await code_manager.find_matching_function(user_request)
+        with stage("match"):
+            func_name, func_details = await code_manager.find_matching_function(user_request, context)
         
         if func_name:
-            logger.info(f"Found matching function: {func_name}")
+            logger.info("Found matching function: %s", func_name)
+            turn["function"] = func_name
             try:
-                # Execute the existing function
-                func = getattr(wp_api, func_name)
-                result = func()
-                
-                # Format the result
-                if isinstance(result, list) and len(result) > 0 and 'title' in result[0]:
-                    # It's probably a list of pages/posts
-                    formatted_result = "\n".join([f"- {item['title']['rendered']}" for item in result])
-                else:
-                    formatted_result = str(result)
+                # Execute the existing function and format the result
+                formatted_result = await execute(func_name, targets)
                 
+                CHAT_REQUESTS.inc(path="match")
                 return {
                     "role": "assistant",
                     "content": f"I found an existing function ({func_name}) that can help. Here's the result:\n\n{formatted_result}"
                 }
             except Exception as e:
-                logger.error(f"Error executing function {func_name}: {str(e)}")
+                logger.error("Error executing function %s: %s", func_name, e)
+                CHAT_REQUESTS.inc(path="execution_failed")
                 return {
                     "role": "assistant",
                     "content": f"I found a matching function but encountered an error: {str(e)}"
@@ -92,46 +386,217 @@ async def chat(request: ChatRequest):
         
         # If no matching function, generate new code
         logger.info("No matching function found, generating new code...")
-        code = code_generator.generate_function(user_request)
+        with stage("generate"):
+            code = await code_generator.generate_function(user_request, context)
         
         if code is None:
+            CHAT_REQUESTS.inc(path="generation_failed")
             return {
                 "role": "assistant",
                 "content": "I apologize, but I wasn't able to generate code for your request. Could you please rephrase it?"
             }
             
         # Add the new function
-        if code_manager.add_function(code):
+        with stage("add_function"):
+            func_name, created = await executor.run(code_manager.add_function, code)
+        if func_name and not created:
+            # The generated code turned out to be a function we already had
+            code_generator.remember(user_request, context, code)
+            turn.update(function=func_name, created=False)
+            try:
+                formatted_result = await execute(func_name, targets)
+
+                CHAT_REQUESTS.inc(path="reused")
+                return {
+                    "role": "assistant",
+                    "content": f"I already had a function ({func_name}) that does this. Here's the result:\n\n{formatted_result}"
+                }
+            except Exception as e:
+                logger.error("Error executing function %s: %s", func_name, e)
+                CHAT_REQUESTS.inc(path="execution_failed")
+                return {
+                    "role": "assistant",
+                    "content": f"I found a matching function but encountered an error: {str(e)}"
+                }
+        if func_name:
+            code_generator.remember(user_request, context, code)
+            turn.update(function=func_name, created=True)
             # Try to execute the new function
             try:
-                func_name = ast.parse(code).body[0].name
-                func = getattr(wp_api, func_name)
-                result = func()
-                
-                # Format the result
-                if isinstance(result, list) and len(result) > 0 and 'title' in result[0]:
-                    formatted_result = "\n".join([f"- {item['title']['rendered']}" for item in result])
-                else:
-                    formatted_result = str(result)
+                formatted_result = await execute(func_name, targets)
                 
+                CHAT_REQUESTS.inc(path="generate")
                 return {
                     "role": "assistant",
                     "content": f"I've created and executed a new function to handle your request. Here's the result:\n\n{formatted_result}\n\nI added this function for future use:\n```python\n{code}\n```"
                 }
             except Exception as e:
+                CHAT_REQUESTS.inc(path="execution_failed")
                 return {
                     "role": "assistant",
                     "content": f"I created a new function but encountered an error when executing it: {str(e)}\n\nHere's the function I added:\n```python\n{code}\n```"
                 }
         else:
+            CHAT_REQUESTS.inc(path="add_failed")
+            code_generator.forget(user_request, context)
             return {
                 "role": "assistant",
                 "content": "I wasn't able to add the new function to handle your request. This might be due to a code error or naming conflict."
             }
             
     except Exception as e:
-        logger.error(f"Error in chat endpoint: {str(e)}", exc_info=True)
+        if is_overloaded(e):
+            logger.warning("Turned a chat request away, Claude is saturated: %s", e)
+            CHAT_REQUESTS.inc(path="busy")
+            raise HTTPException(status_code=503, detail=BUSY_REPLY,
+                                headers={"Retry-After": str(llm_scheduler.retry_after())})
+        logger.error("Error in chat endpoint: %s", e, exc_info=True)
+        CHAT_REQUESTS.inc(path="error")
         raise HTTPException(status_code=500, detail=str(e))
+
+def get_session(session_id: str) -> Session:
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return session
+
+@app.post("/api/sessions")
+def create_session():
+    return {"session_id": sessions.create().id}
+
+@app.get("/api/sessions/stats")
+def session_stats():
+    return sessions.stats()
+
+@app.get("/api/sessions/{session_id}")
+def read_session(session_id: str):
+    return {"session_id": session_id, "messages": get_session(session_id).messages()}
+
+@app.delete("/api/sessions/{session_id}")
+def delete_session(session_id: str):
+    if not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return {"deleted": True}
+
+@app.post("/api/sessions/{session_id}/chat")
+async def session_chat(session_id: str, message: SessionMessage):
+    session = get_session(session_id)
+    targets = resolve_sites(message.content, message.site)
+    turn: Dict[str, Any] = {}
+    reply = await chat_reply(message.content, session.context_summary(), turn, targets)
+    session.record(message.content, reply["content"], turn.get("function"), turn.get("created", False))
+    return reply
+
+@app.post("/api/sessions/{session_id}/chat/stream")
+async def session_chat_stream(session_id: str, message: SessionMessage):
+    session = get_session(session_id)
+    targets = resolve_sites(message.content, message.site)
+
+    async def events() -> AsyncIterator[str]:
+        turn: Dict[str, Any] = {}
+        try:
+            async for event in chat_events(message.content, session.context_summary(), turn, targets):
+                yield event
+        finally:
+            # Also keeps what was sent when the client disconnects mid-reply
+            session.record(message.content, "".join(turn["reply"]), turn.get("function"), turn.get("created", False))
+
+    return event_stream(events())
+
+@app.post("/api/bulk")
+async def bulk(request: BulkRequest):
+    if request.function and request.operations:
+        raise HTTPException(status_code=400, detail="Send either a function with args or operations, not both")
+    if request.operations:
+        operations = [operation.dict() for operation in request.operations]
+        return await bulk_executor.batch_many(operations, request.concurrency)
+    if not request.function:
+        raise HTTPException(status_code=400, detail="A function or a list of operations is required")
+    await executor.run(code_manager.refresh)
+    if request.function not in code_manager.function_registry or not hasattr(wp_api, request.function):
+        raise HTTPException(status_code=404, detail=f"Unknown function: {request.function}")
+    logger.info("Bulk call of %s with %d argument sets", request.function, len(request.args))
+    if sandbox is not None:
+        func = functools.partial(sandbox.run, request.function)
+    else:
+        func = getattr(wp_api, request.function)
+    return await bulk_executor.call_many(func, request.args, request.concurrency)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache/stats")
+def cache_stats():
+    if wp_api.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **wp_api.cache.stats()}
+
+@app.get("/api/sites")
+def list_sites():
+    return {"default": sites.default, "sites": sites.status()}
+
+@app.get("/api/sandbox/stats")
+def sandbox_stats():
+    if sandbox is None:
+        return {"enabled": False}
+    return {"enabled": True, **sandbox.stats()}
+
+@app.get("/api/llm/stats")
+def llm_stats():
+    return llm_scheduler.stats()
+
+@app.get("/api/generation/stats")
+def generation_stats():
+    return {**code_generator.stats(), "validation": code_manager.validator.stats()}
+
+@app.get("/api/mirror/status")
+def mirror_status():
+    if mirror is None:
+        return {"enabled": False}
+    return {"enabled": True, "max_staleness": mirror.max_staleness, "kinds": mirror.status()}
+
+@app.post("/api/mirror/sync")
+async def mirror_sync(full: bool = False):
+    if mirror is None:
+        raise HTTPException(status_code=404, detail="Content mirror is not enabled")
+    return await executor.run(mirror.sync, full=full)
+
+@app.get("/api/mirror/search")
+def mirror_search(q: str, kind: Optional[str] = None, limit: int = 20):
+    if mirror is None:
+        raise HTTPException(status_code=404, detail="Content mirror is not enabled")
+    return mirror.search(q, kind=kind, limit=limit)
+
+async def keep_mirror_synced():
+    """Sync the content mirror in the background so reads stay within the staleness bound"""
+    while True:
+        try:
+            await executor.run(mirror.sync)
+        except Exception as e:
+            logger.error("Content mirror sync failed: %s", e)
+        await asyncio.sleep(MIRROR_SYNC_INTERVAL)
+
+@app.on_event("startup")
+async def startup():
+    # Build the match index in the background rather than delay serving
+    app.state.index_task = asyncio.create_task(executor.run(code_manager.warm))
+    if mirror is not None:
+        app.state.mirror_task = asyncio.create_task(keep_mirror_synced())
+    if sandbox is not None:
+        await sandbox.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    if mirror is not None:
+        app.state.mirror_task.cancel()
+        mirror.close()
+    if sandbox is not None:
+        await sandbox.shutdown()
+    executor.shutdown(wait=False)
+    sites.close()
+    await sites.aclose()
+
 if __name__ == "__main__":
     logger.info("Starting application...")
     try:
@@ -228,7 +693,8 @@ if __name__ == "__main__":
 </html>""")
             logger.info("Created default index.html")
             
-        uvicorn.run(app, host="0.0.0.0", port=8000)
+        # log_config=None keeps uvicorn on the queued handler set up above
+        uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)
     except Exception as e:
-        logger.error(f"Failed to start application: {str(e)}", exc_info=True)
+        logger.error("Failed to start application: %s", e, exc_info=True)
         raise
\ No newline at end of file
@@ -0,0 +1,79 @@
+import logging
+import mimetypes
+import mmap
+import os
+from typing import Callable, Iterator, Optional
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from disk and handed to the socket at a time
+MEDIA_CHUNK_SIZE = 1024 * 1024
+
+# Called with (bytes sent so far, total bytes) after every chunk
+Progress = Callable[[int, int], None]
+
+
+def media_content_type(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def content_disposition(filename: str) -> str:
+    """Content-Disposition naming an upload, with an RFC 5987 filename* for non-ASCII names"""
+    fallback = filename.encode('ascii', 'replace').decode().replace('?', '_').replace('"', '').replace('\\', '')
+    if fallback == filename:
+        return f'attachment; filename="{filename}"'
+    return f'attachment; filename="{fallback}"; filename*=UTF-8\'\'{quote(filename)}'
+
+
+class FileChunks:
+    """A file as a request body: fixed-size chunks read through a memory map
+
+    Defines __len__, so requests sends a Content-Length rather than chunked
+    encoding, and every iteration starts again from the top, so a retried
+    request resends the whole file. Pages already sent are dropped from
+    the mapping, so memory use stays at about one chunk however large the
+    file is. Files that cannot be mapped (empty files, pipes) are read
+    instead.
+    """
+
+    def __init__(self, path: str, chunk_size: int = MEDIA_CHUNK_SIZE, progress: Optional[Progress] = None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.size = os.path.getsize(path)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[bytes]:
+        sent = 0
+        for chunk in self._chunks():
+            yield chunk
+            sent += len(chunk)
+            if self.progress is not None:
+                self.progress(sent, self.size)
+
+    def _chunks(self) -> Iterator[bytes]:
+        with open(self.path, 'rb') as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                yield from iter(lambda: f.read(self.chunk_size), b'')
+                return
+            with mapped:
+                if hasattr(mapped, 'madvise'):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                released = 0
+                for start in range(0, len(mapped), self.chunk_size):
+                    yield mapped[start:start + self.chunk_size]
+                    released = self._release(mapped, released, start + self.chunk_size)
+
+    @staticmethod
+    def _release(mapped: mmap.mmap, start: int, end: int) -> int:
+        """Unmap the pages between start and end from this process; the page cache keeps them"""
+        end -= end % mmap.PAGESIZE
+        if end > start and hasattr(mmap, 'MADV_DONTNEED'):
+            mapped.madvise(mmap.MADV_DONTNEED, start, end - start)
+            return end
+        return start
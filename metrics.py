@@ -0,0 +1,236 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans a cached local match up to a slow code generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage timings of the request being handled, for its Server-Timing header
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = \
+    contextvars.ContextVar('request_timings', default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """Base for labelled metrics rendered in the Prometheus text format"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (the last is +Inf), sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {total[0]}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+CHAT_STAGE_SECONDS = REGISTRY.register(Histogram(
+    'chat_stage_seconds', 'Time spent in each stage of a chat request', ['stage']))
+CHAT_REQUESTS = REGISTRY.register(Counter(
+    'chat_requests_total', 'Chat requests by the path they took', ['path']))
+WORDPRESS_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'wordpress_request_seconds', 'WordPress REST API time to response headers', ['method', 'route', 'status']))
+WORDPRESS_RESPONSE_BYTES = REGISTRY.register(Counter(
+    'wordpress_response_bytes_total', 'Bytes received from the WordPress REST API', ['method', 'route']))
+LLM_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'llm_request_seconds', 'Claude API call duration', ['purpose']))
+LLM_TOKENS = REGISTRY.register(Counter(
+    'llm_tokens_total', 'Tokens reported by the Claude API', ['purpose', 'direction']))
+SANDBOX_CALLS = REGISTRY.register(Counter(
+    'sandbox_calls_total', 'Registered function calls run in sandbox workers, by outcome', ['outcome']))
+LLM_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'llm_queue_depth', 'Claude calls waiting in the scheduler queue', ['purpose']))
+LLM_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    'llm_queue_seconds', 'Time Claude calls waited in the scheduler queue', ['purpose']))
+LLM_SCHEDULED = REGISTRY.register(Counter(
+    'llm_scheduled_total', 'Claude calls through the scheduler, by outcome', ['purpose', 'outcome']))
+
+
+def record_timing(name: str, seconds: float):
+    """Add a timing to the current request's Server-Timing header, if there is one"""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time one stage of a chat request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        CHAT_STAGE_SECONDS.observe(elapsed, stage=name)
+        record_timing(name, elapsed)
+
+
+def record_wordpress(method: str, route: str, status: int, seconds: float, size: Optional[int]):
+    WORDPRESS_REQUEST_SECONDS.observe(seconds, method=method, route=route, status=status)
+    if size:
+        WORDPRESS_RESPONSE_BYTES.inc(size, method=method, route=route)
+    record_timing('wordpress', seconds)
+
+
+def record_llm(purpose: str, seconds: float, usage) -> None:
+    """Record a Claude call's duration and the token usage it reported"""
+    LLM_REQUEST_SECONDS.observe(seconds, purpose=purpose)
+    record_timing(f'llm-{purpose}', seconds)
+    if usage is None:
+        return
+    for direction in ('input', 'output'):
+        tokens = getattr(usage, f'{direction}_tokens', None)
+        if tokens:
+            LLM_TOKENS.inc(tokens, purpose=purpose, direction=direction)
+
+
+def start_request() -> contextvars.Token:
+    """Begin collecting Server-Timing entries for the current request"""
+    return _request_timings.set([])
+
+
+def current_timings() -> List[Tuple[str, float]]:
+    """Timings recorded so far for the current request"""
+    return list(_request_timings.get() or [])
+
+
+def finish_request(token: contextvars.Token) -> List[Tuple[str, float]]:
+    """Stop collecting and return the request's timings"""
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+def summarize_timings(timings: List[Tuple[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Total milliseconds and call count per timing name, in first-seen order"""
+    summary: Dict[str, Dict[str, float]] = {}
+    for name, seconds in timings:
+        entry = summary.setdefault(name, {'ms': 0.0, 'count': 0})
+        entry['ms'] += seconds * 1000
+        entry['count'] += 1
+    return summary
+
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    """Format timings as a Server-Timing header, summing repeated names"""
+    entries = []
+    for name, entry in summarize_timings(timings).items():
+        value = f'{name};dur={entry["ms"]:.1f}'
+        if entry['count'] > 1:
+            value += f';desc="{int(entry["count"])} calls"'
+        entries.append(value)
+    return ', '.join(entries)
@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Fixed instructions, sent as the system prompt. At about 80 tokens they are
+# far below the smallest prefix the provider's prompt cache accepts, so they
+# are not marked for caching.
+MATCH_INSTRUCTIONS = """You decide whether an existing WordPressAPI function can fulfil a user's request.
+You are given a shortlist of candidate functions, each with its description, parameters and return type.
+Only answer with a function from the shortlist.
+Respond in this format:
+MATCH: [function_name or "none"]
+REASON: [brief explanation]"""
+
+# Starting estimate for English prose and Python identifiers; refined from real usage
+DEFAULT_CHARS_PER_TOKEN = 3.5
+DOCSTRING_CHARS = 300
+
+
+class MatchPrompt:
+    """A built matching prompt and its token accounting"""
+
+    def __init__(self, system: List[Dict], messages: List[Dict], candidates: List[str],
+                 chars: int, estimated_tokens: int):
+        self.system = system
+        self.messages = messages
+        self.candidates = candidates
+        self.chars = chars
+        self.estimated_tokens = estimated_tokens
+
+
+class MatchPromptBuilder:
+    """Build find_matching_function prompts whose size does not grow with the registry
+
+    Only a shortlist of the top-k candidates is described. Candidates are
+    listed in name order so identical shortlists produce byte-identical
+    prompts, and the whole prompt is kept under a token budget.
+
+    The budget is enforced on an estimate, not an exact count: the prompt's
+    characters divided by a chars-per-token ratio that starts at a fixed
+    value and is calibrated against the input token counts Claude reports
+    back. Counting exactly would cost a count_tokens round trip per match,
+    so set MATCH_PROMPT_TOKEN_BUDGET with some headroom.
+    """
+
+    def __init__(self, top_k: Optional[int] = None, token_budget: Optional[int] = None):
+        self.top_k = top_k or int(os.getenv('MATCH_PROMPT_TOP_K', 8))
+        self.token_budget = token_budget or int(os.getenv('MATCH_PROMPT_TOKEN_BUDGET', 1500))
+        self.chars_per_token = DEFAULT_CHARS_PER_TOKEN
+        self._lock = threading.Lock()
+
+    def estimate_tokens(self, chars: int) -> int:
+        # Round up so the budget errs on the safe side
+        return int(chars / self.chars_per_token) + 1
+
+    def describe(self, name: str, details: Dict) -> str:
+        """Compact description of one candidate function"""
+        docstring = (details.get('docstring') or '').strip()
+        # The first paragraph says what the function does; Args/Raises sections rarely help matching
+        summary = ' '.join(docstring.split('\n\n')[0].split())[:DOCSTRING_CHARS]
+        return (f"Function: {name}\n"
+                f"Description: {summary}\n"
+                f"Parameters: {', '.join(details.get('parameters') or [])}\n"
+                f"Returns: {details.get('returns')}\n")
+
+    def build(self, user_request: str, candidates: Sequence[str], registry: Dict[str, Dict],
+              context: str = '') -> MatchPrompt:
+        """Build a prompt for the best-first candidate names, dropping the weakest to fit the budget
+
+        `context` is a short summary of the conversation so far, which helps
+        with follow-ups such as "now do the same for posts".
+        """
+        candidates = [name for name in candidates if name in registry][:self.top_k]
+        request_section = f'Given this user request: "{user_request}"\n\n' \
+                          'Can any of these functions fulfill the request? If yes, which one?'
+        if context:
+            request_section = f"Earlier requests in this conversation:\n{context}\n\n{request_section}"
+        fixed_chars = len(MATCH_INSTRUCTIONS) + len(request_section) + len("Candidate functions:\n")
+        descriptions = {name: self.describe(name, registry[name]) for name in candidates}
+
+        # Drop the lowest scoring candidates until the prompt fits
+        while candidates and self.estimate_tokens(
+                fixed_chars + sum(len(descriptions[name]) + 1 for name in candidates)) > self.token_budget:
+            candidates = candidates[:-1]
+
+        registry_section = "Candidate functions:\n" + "\n".join(descriptions[name] for name in sorted(candidates))
+        system = [{"type": "text", "text": MATCH_INSTRUCTIONS}]
+        messages = [{"role": "user", "content": f"{registry_section}\n{request_section}"}]
+        chars = len(MATCH_INSTRUCTIONS) + len(messages[0]['content'])
+        return MatchPrompt(system, messages, sorted(candidates), chars, self.estimate_tokens(chars))
+
+    def record_usage(self, prompt: MatchPrompt, usage) -> None:
+        """Calibrate the chars-per-token estimate from Claude's reported input tokens"""
+        input_tokens = getattr(usage, 'input_tokens', None) if usage is not None else None
+        if not input_tokens:
+            return
+        # Tokens served from the prompt cache are reported separately
+        input_tokens += getattr(usage, 'cache_read_input_tokens', 0) or 0
+        input_tokens += getattr(usage, 'cache_creation_input_tokens', 0) or 0
+        observed = prompt.chars / input_tokens
+        with self._lock:
+            # Exponential moving average keeps one odd request from swinging the budget
+            self.chars_per_token = 0.8 * self.chars_per_token + 0.2 * observed
+        logger.debug("Match prompt used %d tokens (estimated %d), chars/token now %.2f",
+                     input_tokens, prompt.estimated_tokens, self.chars_per_token)
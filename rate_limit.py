@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from metrics import record_timing
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by sync and async callers
+
+    Tokens refill continuously at `rate` per second up to `capacity`. A
+    caller reserves the tokens it needs up front and then sleeps until they
+    would have been available, so waiters are served in arrival order and a
+    burst is spread out instead of retried. Costs may exceed the capacity
+    (e.g. a large request against a tokens-per-minute budget); they simply
+    wait longer.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, name: str = ''):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.name = name
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.waited_seconds = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take `tokens` now, going into debt if need be, and return how long to wait before using them"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            delay = -self._tokens / self.rate
+            self.waits += 1
+            self.waited_seconds += delay
+            return delay
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take `tokens` only if they are available right now"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def refund(self, tokens: float):
+        """Return tokens that were reserved but not used, e.g. after over-estimating a cost"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Block until `tokens` are available; returns the time waited"""
+        delay = self.reserve(tokens)
+        if delay:
+            logger.debug("Rate limit %s: waiting %.3fs", self.name, delay)
+            record_timing('rate_limit', delay)
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self, tokens: float = 1) -> float:
+        """Async counterpart of acquire()"""
+        delay = self.reserve(tokens)
+        if delay:
+            logger.debug("Rate limit %s: waiting %.3fs", self.name, delay)
+            record_timing('rate_limit', delay)
+            await asyncio.sleep(delay)
+        return delay
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'rate': self.rate,
+            'capacity': self.capacity,
+            'available': round(self.available(), 3),
+            'waits': self.waits,
+            'waited_s': round(self.waited_seconds, 3),
+        }
@@ -0,0 +1,247 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import textwrap
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever function records gain or change fields; older snapshots are rebuilt
+SNAPSHOT_FORMAT = 2
+
+
+def source_signature(path: str) -> Tuple[int, int]:
+    """(mtime_ns, size) of a file, a cheap stand-in for its content"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_hash(path: str) -> str:
+    return _hash_file(path)[0].hexdigest()
+
+
+def _hash_file(path: str) -> Tuple[Any, int]:
+    """A running SHA-256 of a file's contents, and how many bytes it covers"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+        return digest, f.tell()
+
+
+def code_hash(code: str) -> str:
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+def compile_method(module: ModuleType, name: str, source: str, filename: str) -> Callable:
+    """Compile a single WordPressAPI method against a module's globals"""
+    namespace = {}
+    exec(compile(source, filename, 'exec'), module.__dict__, namespace)
+    function = namespace[name]
+    function.__module__ = module.__name__
+    function.__qualname__ = f"WordPressAPI.{name}"
+    return function
+
+
+class RegistrySnapshot:
+    """Append-only JSON Lines record of the functions defined in an API source file
+
+    A "function" record holds one function's metadata (docstring,
+    parameters, return type, the hashes of its code and of its normalized
+    AST, and the byte span of its source in the file) but not its code, which is read from the file on
+    demand. A "source" record follows every change with the file's mtime,
+    size and SHA-256 at that point, the appendable flag and a version that
+    counts changes, along with the record format. The last source record wins and tells whether the
+    snapshot still describes the file.
+
+    Processes sharing the file append under an exclusive lock and follow
+    each other's changes by reading only the bytes added since they last
+    looked, so picking up a new function costs the same however many there
+    are. Likewise, the hash in an append's source record extends a running
+    hash of the file by the appended bytes instead of re-reading it all.
+    """
+
+    def __init__(self, source_path: str, path: Optional[str] = None):
+        self.source_path = source_path
+        self.path = path or os.getenv('REGISTRY_SNAPSHOT_PATH') or os.path.splitext(source_path)[0] + '.registry.jsonl'
+        self.source: Dict[str, Any] = {}
+        # How much of the snapshot file has been read, and which file it was
+        self.offset = 0
+        self._inode: Optional[int] = None
+        self._lock_depth = 0
+        # Running hash of the first _hashed_size bytes of the source file
+        self._hasher = None
+        self._hashed_size = 0
+
+    @property
+    def version(self) -> int:
+        return self.source.get('version', 0)
+
+    @contextlib.contextmanager
+    def lock(self) -> Iterator[None]:
+        """Hold the snapshot's cross-process write lock
+
+        Re-entrant, but not thread-safe: callers in one process serialize
+        their writes themselves.
+        """
+        if self._lock_depth:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        with open(self.path + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            self._lock_depth = 1
+            try:
+                yield
+            finally:
+                self._lock_depth = 0
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _source_record(self, appendable: bool, version: int, sha256: str) -> Dict[str, Any]:
+        mtime_ns, size = source_signature(self.source_path)
+        return {'mtime_ns': mtime_ns, 'size': size, 'sha256': sha256,
+                'appendable': appendable, 'version': version, 'format': SNAPSHOT_FORMAT}
+
+    def _rehash(self) -> str:
+        self._hasher, self._hashed_size = _hash_file(self.source_path)
+        return self._hasher.hexdigest()
+
+    def _hash_after_append(self, data: bytes) -> str:
+        """SHA-256 of the source file now that `data` was appended to what the last record describes
+
+        Bytes other processes appended in the meantime are hashed from the
+        file. If the running hash does not come out at the recorded one
+        (first append in this process, or the file was changed some other
+        way), the whole file is hashed again.
+        """
+        before = self.source.get('size')
+        if self._hasher is not None and before is not None and self._hashed_size <= before:
+            if self._hashed_size < before:
+                with open(self.source_path, 'rb') as f:
+                    f.seek(self._hashed_size)
+                    self._hasher.update(f.read(before - self._hashed_size))
+                self._hashed_size = before
+            if self._hasher.hexdigest() == self.source['sha256']:
+                self._hasher.update(data)
+                self._hashed_size += len(data)
+                return self._hasher.hexdigest()
+        return self._rehash()
+
+    def matches_source(self) -> bool:
+        """Whether the last source record describes the file as it is now"""
+        if not self.source:
+            return False
+        mtime_ns, size = source_signature(self.source_path)
+        if (mtime_ns, size) == (self.source['mtime_ns'], self.source['size']):
+            return True
+        # A checkout or copy touches the file without changing it; only then pay for hashing it
+        return size == self.source['size'] and file_hash(self.source_path) == self.source['sha256']
+
+    def load(self) -> Optional[Dict[str, Dict]]:
+        """The recorded functions, or None if there is no snapshot or the file has changed since"""
+        functions: Dict[str, Dict] = {}
+        self.source = {}
+        try:
+            with open(self.path, 'rb') as f:
+                self._inode = os.fstat(f.fileno()).st_ino
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            self.offset = self._apply(data, functions.__setitem__)
+        except (ValueError, KeyError) as e:
+            logger.warning("Discarding unreadable registry snapshot %s: %s", self.path, e)
+            return None
+        if self.source.get('format') != SNAPSHOT_FORMAT:
+            logger.info("Registry snapshot %s has an old format", self.path)
+            return None
+        if not self.matches_source():
+            logger.info("Registry snapshot %s is out of date with %s", self.path, self.source_path)
+            return None
+        return functions
+
+    def _apply(self, data: bytes, add: Callable[[str, Dict], None]) -> int:
+        """Apply the complete records in data and return how many bytes they took"""
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            if 'function' in record:
+                add(record['function']['name'], record['function'])
+            else:
+                self.source = record['source']
+        return end
+
+    def rebuild(self, functions: Dict[str, Dict], appendable: bool):
+        """Replace the snapshot with the given functions, as found by parsing the source file"""
+        self.source = self._source_record(appendable, self.version + 1, self._rehash())
+        lines = [json.dumps({'function': entry}) for entry in functions.values()]
+        lines.append(json.dumps({'source': self.source}))
+        data = ('\n'.join(lines) + '\n').encode()
+        temp_name = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_name, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_name, self.path)
+        self._inode = os.stat(self.path).st_ino
+        self.offset = len(data)
+        logger.info("Wrote registry snapshot of %d functions to %s", len(functions), self.path)
+
+    def append(self, entry: Dict[str, Any], data: bytes):
+        """Record a function whose code, `data`, was just appended to the source file; call with the lock held"""
+        self.source = self._source_record(True, self.version + 1, self._hash_after_append(data))
+        data = (json.dumps({'function': entry}) + '\n' + json.dumps({'source': self.source}) + '\n').encode()
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.offset += len(data)
+
+    def read_new(self) -> Optional[List[Dict]]:
+        """Functions other processes recorded since the last load or read
+
+        Returns None when the snapshot was rebuilt in the meantime, which
+        means the source file was rewritten and has to be loaded afresh.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        if stat.st_ino != self._inode or stat.st_size < self.offset:
+            return None
+        if stat.st_size == self.offset:
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        added: List[Dict] = []
+        self.offset += self._apply(data, lambda name, entry: added.append(entry))
+        return added
+
+    def skip_to_end(self):
+        """Start following the snapshot from its current end, for processes that just imported the module"""
+        try:
+            with open(self.path, 'rb') as f:
+                self._inode = os.fstat(f.fileno()).st_ino
+                data = f.read()
+        except FileNotFoundError:
+            return
+        self.offset = self._apply(data, lambda name, entry: None)
+
+    def read_code(self, entry: Dict[str, Any]) -> str:
+        """The source of a recorded function, read from its span in the source file
+
+        The code is dedented, so docstring lines indented less than the def
+        itself come back with less indentation; cleaned docstrings are the same.
+        """
+        start, end = entry['span']
+        with open(self.source_path, 'rb') as f:
+            f.seek(start)
+            return textwrap.dedent(f.read(end - start).decode())
@@ -0,0 +1,184 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+logger = logging.getLogger(__name__)
+
+_REST_PREFIX_RE = re.compile(r'^.*?/wp-json/')
+
+# The cached body is already decoded, so these no longer describe it
+_HOP_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+
+def resource_family(url: str) -> str:
+    """Return the collection a URL belongs to, e.g. 'wp/v2/posts' for .../wp/v2/posts/42/revisions"""
+    path = _REST_PREFIX_RE.sub('', urlsplit(url).path).strip('/')
+    family = []
+    for part in path.split('/'):
+        if not part or part.isdigit():
+            break
+        family.append(part)
+    return '/'.join(family)
+
+
+def cache_key(url: str, params: Optional[Mapping[str, Any]] = None) -> str:
+    """Build a stable key from the URL and its query parameters"""
+    if not params:
+        return url
+    query = urlencode(sorted((str(k), str(v)) for k, v in params.items()))
+    separator = '&' if '?' in url else '?'
+    return f'{url}{separator}{query}'
+
+
+class CachedResponse:
+    """Body and validators of a successful GET"""
+
+    __slots__ = ('url', 'content', 'headers', 'etag', 'last_modified', 'stored_at', 'family')
+
+    def __init__(self, url: str, content: bytes, headers: Mapping[str, str]):
+        self.url = url
+        self.content = content
+        self.headers = {k: v for k, v in headers.items() if k.lower() not in _HOP_HEADERS}
+        self.etag = headers.get('ETag')
+        self.last_modified = headers.get('Last-Modified')
+        self.stored_at = time.monotonic()
+        self.family = resource_family(url)
+
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers that let the server answer 304"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """Size-bounded LRU of GET responses revalidated with ETag/Last-Modified
+
+    Entries younger than `ttl` seconds are served without contacting
+    WordPress. Older entries (or all of them when ttl is None) are
+    revalidated with a conditional request, so an unchanged resource costs a
+    bodiless 304 instead of a full download. Bodies larger than
+    `max_entry_bytes` are not cached so they can be streamed instead.
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: Optional[float] = None, max_entry_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes or max_bytes, max_bytes)
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, CachedResponse]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.invalidations = 0
+        self.bytes_saved = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: str) -> Tuple[Optional[CachedResponse], bool]:
+        """Return (entry, fresh); fresh entries can be served without a request"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, False
+            self._entries.move_to_end(key)
+            fresh = self.ttl is not None and time.monotonic() - entry.stored_at < self.ttl
+            if fresh:
+                self.hits += 1
+                self.bytes_saved += len(entry.content)
+            return entry, fresh
+
+    def record_miss(self):
+        """Count a revalidation that came back with a new body"""
+        with self._lock:
+            self.misses += 1
+
+    def cacheable(self, headers: Mapping[str, str]) -> bool:
+        """Whether a response with these headers may be cached at all, body size aside"""
+        return bool(headers.get('ETag') or headers.get('Last-Modified') or self.ttl)
+
+    def accepts(self, headers: Mapping[str, str]) -> Optional[bool]:
+        """Whether a response with these headers would be cached, judged before reading its body
+
+        None when that depends on a body of unknown length (compressed or
+        chunked responses carry no usable Content-Length); reading at most
+        max_entry_bytes + 1 bytes of it settles the question.
+        """
+        if not self.cacheable(headers):
+            return False
+        length = headers.get('Content-Length')
+        if length is None or not length.isdigit() or headers.get('Content-Encoding'):
+            return None
+        return int(length) <= self.max_entry_bytes
+
+    def store(self, key: str, url: str, content: bytes, headers: Mapping[str, str]):
+        """Cache a 200 response if it carries validators or a TTL applies"""
+        if not self.cacheable(headers):
+            return
+        if len(content) > self.max_entry_bytes:
+            return
+        entry = CachedResponse(url, content, headers)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = entry
+            self._size += len(content)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+
+    def revalidated(self, key: str, entry: CachedResponse, headers: Mapping[str, str]):
+        """Record a 304 and refresh the entry's age and validators"""
+        with self._lock:
+            self.revalidations += 1
+            self.bytes_saved += len(entry.content)
+            entry.stored_at = time.monotonic()
+            entry.etag = headers.get('ETag', entry.etag)
+            entry.last_modified = headers.get('Last-Modified', entry.last_modified)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+    def invalidate(self, url: str):
+        """Drop every entry in the same resource family as url"""
+        family = resource_family(url)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if entry.family == family or entry.family.startswith(family + '/')]
+            for key in stale:
+                self._discard(key)
+            self.invalidations += len(stale)
+        if stale:
+            logger.debug('Invalidated %d cached responses for %s', len(stale), family)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry.content)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'invalidations': self.invalidations,
+                'bytes_saved': self.bytes_saved,
+            }
@@ -0,0 +1,383 @@
+import asyncio
+import functools
+import importlib
+import inspect
+import logging
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from content_mirror import ContentMirror
+from logging_config import configure_logging
+from metrics import SANDBOX_CALLS
+from registry_snapshot import RegistrySnapshot, compile_method
+from site_registry import SiteRegistry
+
+logger = logging.getLogger(__name__)
+
+# Workers are fresh interpreters rather than multiprocessing children, which
+# would re-import the server's __main__ (and with it the whole app) on start
+WORKER_COMMAND = 'import sandbox, sys; sandbox.serve_worker(*sys.argv[1:])'
+
+# Seconds between attempts to start a worker in place of one that could not be replaced
+RESPAWN_BACKOFF = 1.0
+RESPAWN_BACKOFF_CAP = 30.0
+
+
+class SandboxError(Exception):
+    """A registered function could not be run in a sandbox worker"""
+
+
+class SandboxTimeout(SandboxError):
+    """A registered function ran past its time limit; its worker was killed"""
+
+
+def _file_signature(path: str) -> Tuple[int, int]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (0, 0)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _limit_memory(memory_mb: int):
+    if memory_mb <= 0:
+        return
+    try:
+        import resource
+    except ImportError:
+        logger.warning("Memory limits are not supported on this platform")
+        return
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+async def _collect(result) -> List[Any]:
+    return [item async for item in result]
+
+
+def _materialize(result: Any, loop: asyncio.AbstractEventLoop) -> Any:
+    """Resolve coroutines and drain iterators so the result can be pickled"""
+    if inspect.isawaitable(result):
+        result = loop.run_until_complete(result)
+    if inspect.isasyncgen(result):
+        return loop.run_until_complete(_collect(result))
+    if isinstance(result, Iterator):
+        return list(result)
+    return result
+
+
+def _error_reply(exc: BaseException, recycle: bool) -> bytes:
+    """Send the exception itself when it pickles, else its type and message"""
+    try:
+        return pickle.dumps((False, exc, recycle), pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        error = SandboxError(f"{type(exc).__name__}: {exc}")
+        return pickle.dumps((False, error, recycle), pickle.HIGHEST_PROTOCOL)
+
+
+def serve_worker(fd: str, module_path: str, memory_mb: str):
+    """Entry point of a worker process; fd is its end of the parent's socket pair"""
+    _worker_main(Connection(int(fd)), module_path, int(memory_mb))
+
+
+def _worker_main(conn: Connection, module_path: str, memory_mb: int):
+    """Serve calls for one worker process until the parent closes the pipe
+
+    The API module and its WordPressAPI instances (one per site, created on
+    first use) are loaded once, so the registry, HTTP sessions and response
+    caches stay warm between calls. Functions the code manager appends are
+    compiled from the registry snapshot one by one; any other change to the
+    file reloads the whole module.
+    """
+    _limit_memory(memory_mb)
+    configure_logging()
+
+    module_dir, module_file = os.path.split(os.path.abspath(module_path))
+    module_name = os.path.splitext(module_file)[0]
+    if module_dir not in sys.path:
+        sys.path.insert(0, module_dir)
+    module = importlib.import_module(module_name)
+    sites = SiteRegistry(module.WordPressAPI)
+    if os.getenv('WP_MIRROR_PATH'):
+        default = sites.get()
+        default.attach_mirror(ContentMirror(default))
+    snapshot = RegistrySnapshot(module_path)
+    snapshot.skip_to_end()
+    signature = _file_signature(module_path)
+    loop = asyncio.new_event_loop()
+    conn.send_bytes(pickle.dumps(('ready', os.getpid()), pickle.HIGHEST_PROTOCOL))
+
+    while True:
+        try:
+            name, site, kwargs = pickle.loads(conn.recv_bytes())
+        except EOFError:
+            break
+        if name is None:
+            break
+        try:
+            current = _file_signature(module_path)
+            if current != signature:
+                added = snapshot.read_new()
+                if added is not None and current == (snapshot.source.get('mtime_ns'), snapshot.source.get('size')):
+                    for entry in added:
+                        code = snapshot.read_code(entry)
+                        setattr(module.WordPressAPI, entry['name'],
+                                compile_method(module, entry['name'], code, module_path))
+                    logger.info("Added %d functions in sandbox worker %d", len(added), os.getpid())
+                else:
+                    module = importlib.reload(module)
+                    # Keep the instances, and with them the pooled connections
+                    sites.rebind(module.WordPressAPI)
+                    logger.info("Reloaded %s in sandbox worker %d", module_name, os.getpid())
+                signature = current
+            if name.startswith('_') or not callable(getattr(module.WordPressAPI, name, None)):
+                raise SandboxError(f"Unknown function: {name}")
+            result = _materialize(getattr(sites.get(site), name)(**kwargs), loop)
+            reply = pickle.dumps((True, result, False), pickle.HIGHEST_PROTOCOL)
+        except MemoryError as e:
+            # The heap may be in a bad state; have the parent replace this worker
+            reply = _error_reply(SandboxError(f"Memory limit of {memory_mb} MB exceeded: {e}"), True)
+        except Exception as e:
+            reply = _error_reply(e, False)
+        conn.send_bytes(reply)
+
+    loop.run_until_complete(sites.aclose())
+    loop.close()
+    sites.close()
+
+
+class _Worker:
+    def __init__(self, process: subprocess.Popen, conn: Connection):
+        self.process = process
+        self.conn = conn
+        self.calls = 0
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+
+class SandboxExecutor:
+    """Run registered WordPressAPI functions in a pool of warm worker processes
+
+    Each worker imports the API module once and keeps its own HTTP session,
+    so calls pay only for pickling arguments and results. A call that runs
+    past `timeout` seconds has its worker killed and replaced, so a runaway
+    function costs one worker rather than the server. Workers are also
+    recycled after `max_calls` calls and after running out of memory, and
+    each one is limited to `memory_mb` of address space. If a replacement
+    fails to start, it is retried in the background until one does, so
+    the pool keeps its size.
+    """
+
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = None,
+                 memory_mb: Optional[int] = None, max_calls: Optional[int] = None,
+                 module_path: str = 'wordpress_api.py'):
+        self.workers = workers if workers is not None else int(os.getenv('SANDBOX_WORKERS', 0)) or os.cpu_count() or 1
+        self.timeout = timeout if timeout is not None else float(os.getenv('SANDBOX_TIMEOUT', 30))
+        self.memory_mb = memory_mb if memory_mb is not None else int(os.getenv('SANDBOX_MEMORY_MB', 1024))
+        self.max_calls = max_calls if max_calls is not None else int(os.getenv('SANDBOX_MAX_CALLS', 1000))
+        self.module_path = module_path
+        self.start_timeout = float(os.getenv('SANDBOX_START_TIMEOUT', 30))
+        # Each in-flight call waits on its worker's pipe in one of these threads
+        self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='sandbox')
+        self._idle: Optional[asyncio.Queue] = None
+        self._starting: Optional[asyncio.Task] = None
+        self._all: List[_Worker] = []
+        self._respawning: Set[asyncio.Task] = set()
+        self._stats = {'calls': 0, 'errors': 0, 'timeouts': 0, 'crashes': 0, 'recycled': 0}
+
+    def _spawn(self) -> _Worker:
+        """Start a worker and wait until it has loaded the API module"""
+        parent_sock, child_sock = socket.socketpair()
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                          env.get('PYTHONPATH')]))
+        with child_sock:
+            process = subprocess.Popen(
+                [sys.executable, '-c', WORKER_COMMAND, str(child_sock.fileno()), self.module_path, str(self.memory_mb)],
+                pass_fds=(child_sock.fileno(),), env=env)
+        parent_conn = Connection(parent_sock.detach())
+        if not parent_conn.poll(self.start_timeout):
+            process.kill()
+            process.wait()
+            parent_conn.close()
+            raise SandboxError('Sandbox worker did not start in time')
+        try:
+            parent_conn.recv_bytes()
+        except EOFError:
+            parent_conn.close()
+            raise SandboxError(f'Sandbox worker exited during startup with code {process.wait()}')
+        logger.debug("Started sandbox worker %d", process.pid)
+        return _Worker(process, parent_conn)
+
+    def _kill(self, worker: _Worker):
+        worker.conn.close()
+        if worker.process.poll() is None:
+            worker.process.kill()
+        worker.process.wait()
+
+    def _stop(self, worker: _Worker):
+        try:
+            worker.conn.send_bytes(pickle.dumps((None, None, None)))
+            worker.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self._kill(worker)
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        self._kill(worker)
+        replacement = self._spawn()
+        self._all[self._all.index(worker)] = replacement
+        self._stats['recycled'] += 1
+        return replacement
+
+    def _exchange(self, worker: _Worker, payload: bytes, timeout: float) -> Tuple[str, Any, _Worker]:
+        """Send one call and wait for its reply; returns (outcome, value, worker to put back)"""
+        worker.calls += 1
+        try:
+            worker.conn.send_bytes(payload)
+            if not worker.conn.poll(timeout):
+                logger.warning("Sandbox worker %d timed out after %.1fs, replacing it", worker.pid, timeout)
+                return 'timeout', None, self._replace(worker)
+            ok, value, recycle = pickle.loads(worker.conn.recv_bytes())
+        except (EOFError, OSError) as e:
+            logger.warning("Sandbox worker %d died (exit code %s), replacing it", worker.pid, worker.process.poll())
+            return 'crashed', e, self._replace(worker)
+        if recycle or worker.calls >= self.max_calls:
+            worker = self._replace(worker)
+        return ('ok' if ok else 'error'), value, worker
+
+    async def _start_workers(self):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        workers = await asyncio.gather(*(loop.run_in_executor(self._threads, self._spawn)
+                                         for _ in range(self.workers)), return_exceptions=True)
+        failures = [worker for worker in workers if isinstance(worker, BaseException)]
+        for worker in workers:
+            if not isinstance(worker, BaseException):
+                self._all.append(worker)
+        if failures:
+            for worker in self._all:
+                self._kill(worker)
+            self._all = []
+            raise failures[0]
+        self._idle = asyncio.Queue()
+        for worker in self._all:
+            self._idle.put_nowait(worker)
+        logger.info("Started %d sandbox workers in %.2fs", self.workers, time.perf_counter() - started)
+
+    async def start(self):
+        """Start the workers; the first call starts them if this was not awaited at startup"""
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._start_workers())
+        try:
+            await asyncio.shield(self._starting)
+        except Exception:
+            # Let the next call try again
+            self._starting = None
+            raise
+
+    async def run(self, name: str, timeout: Optional[float] = None, site: Optional[str] = None, **kwargs) -> Any:
+        """Call the registered function `name` in a worker and return its result
+
+        `site` selects the WordPress site to call it on, the default one when
+        None. Iterators and async generators are drained in the worker, so
+        collection results come back as lists.
+        """
+        await self.start()
+        payload = pickle.dumps((name, site, kwargs), pickle.HIGHEST_PROTOCOL)
+        limit = timeout if timeout is not None else self.timeout
+        worker = await self._idle.get()
+        loop = asyncio.get_running_loop()
+        exchange = loop.run_in_executor(self._threads, self._exchange, worker, payload, limit)
+        try:
+            # Shielded: a cancelled caller must not lose the worker the call is still running on
+            outcome, value, worker = await asyncio.shield(exchange)
+        except asyncio.CancelledError:
+            exchange.add_done_callback(functools.partial(self._check_in, worker))
+            raise
+        except Exception:
+            self._respawn_later(worker)
+            raise
+        self._idle.put_nowait(worker)
+
+        self._stats['calls'] += 1
+        SANDBOX_CALLS.inc(outcome=outcome)
+        if outcome == 'ok':
+            return value
+        if outcome == 'timeout':
+            self._stats['timeouts'] += 1
+            raise SandboxTimeout(f"{name} did not finish within {limit:g} seconds")
+        if outcome == 'crashed':
+            self._stats['crashes'] += 1
+            raise SandboxError(f"The worker running {name} exited unexpectedly")
+        self._stats['errors'] += 1
+        raise value
+
+    def _check_in(self, worker: _Worker, exchange: asyncio.Future):
+        """Put back the worker a call left behind once it finishes, after its caller went away"""
+        if self._idle is None:
+            return
+        if exchange.cancelled() or exchange.exception() is not None:
+            self._respawn_later(worker)
+        else:
+            self._idle.put_nowait(exchange.result()[2])
+
+    def _respawn_later(self, worker: _Worker):
+        """Drop a worker that could not be replaced and keep trying to start one in its place"""
+        if worker in self._all:
+            self._all.remove(worker)
+        logger.error("Could not replace sandbox worker %s; %d left, retrying in the background",
+                     worker.pid, len(self._all))
+        task = asyncio.ensure_future(self._respawn())
+        self._respawning.add(task)
+        task.add_done_callback(self._respawning.discard)
+
+    async def _respawn(self):
+        loop = asyncio.get_running_loop()
+        delay = RESPAWN_BACKOFF
+        while self._idle is not None:
+            try:
+                worker = await loop.run_in_executor(self._threads, self._spawn)
+            except Exception as e:
+                logger.warning("Sandbox worker still failing to start (%s); next attempt in %.0fs", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RESPAWN_BACKOFF_CAP)
+                continue
+            if self._idle is None:
+                self._kill(worker)
+                return
+            self._all.append(worker)
+            self._stats['recycled'] += 1
+            self._idle.put_nowait(worker)
+            logger.info("Started sandbox worker %d in place of a lost one", worker.pid)
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'workers': len(self._all),
+            'idle': self._idle.qsize() if self._idle is not None else 0,
+            'respawning': len(self._respawning),
+            'timeout': self.timeout,
+            'memory_mb': self.memory_mb,
+            **self._stats,
+        }
+
+    async def shutdown(self):
+        """Ask workers to close their connections and exit"""
+        loop = asyncio.get_running_loop()
+        for task in self._respawning:
+            task.cancel()
+        await asyncio.gather(*(loop.run_in_executor(self._threads, self._stop, worker) for worker in self._all))
+        self._all = []
+        self._idle = None
+        self._starting = None
+        self._threads.shutdown(wait=False)
@@ -0,0 +1,163 @@
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Longest request quoted in a context summary
+SUMMARY_REQUEST_CHARS = 160
+
+
+def _clip(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:limit - 1].rstrip() + '…'
+
+
+class Turn:
+    """One request and what answered it"""
+
+    __slots__ = ('request', 'reply', 'function', 'created', 'at')
+
+    def __init__(self, request: str, reply: str, function: Optional[str], created: bool):
+        self.request = request
+        self.reply = reply
+        self.function = function
+        self.created = created
+        self.at = time.time()
+
+    def summary(self) -> str:
+        line = f'- "{_clip(" ".join(self.request.split()), SUMMARY_REQUEST_CHARS)}"'
+        if self.function:
+            line += f' -> {"created" if self.created else "used"} {self.function}'
+        return line
+
+
+class Session:
+    """Server-side state of one conversation
+
+    Only the last `max_turns` turns are kept, and stored text is clipped to
+    `max_chars` per message; the history is context for matching and
+    generation, not an archive of every listing the assistant returned.
+    """
+
+    def __init__(self, session_id: str, max_turns: int, max_chars: int):
+        self.id = session_id
+        self.max_chars = max_chars
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, request: str, reply: str, function: Optional[str] = None, created: bool = False):
+        """Add a finished turn"""
+        with self._lock:
+            self.turns.append(Turn(_clip(request, self.max_chars), _clip(reply, self.max_chars), function, created))
+
+    def context_summary(self, max_turns: int = 5, max_chars: int = 800) -> str:
+        """Compact description of the most recent turns, newest last
+
+        Each turn contributes its request and the function that answered it,
+        never the reply itself, so the summary stays small however long the
+        conversation or its results get.
+        """
+        with self._lock:
+            turns = list(self.turns)[-max_turns:]
+        lines: List[str] = []
+        used = 0
+        for turn in reversed(turns):
+            line = turn.summary()
+            if used + len(line) + 1 > max_chars:
+                break
+            lines.append(line)
+            used += len(line) + 1
+        return '\n'.join(reversed(lines))
+
+    def messages(self) -> List[Dict[str, str]]:
+        """The stored history in the chat message format"""
+        with self._lock:
+            turns = list(self.turns)
+        messages = []
+        for turn in turns:
+            messages.append({'role': 'user', 'content': turn.request})
+            messages.append({'role': 'assistant', 'content': turn.reply})
+        return messages
+
+
+class SessionStore:
+    """In-memory LRU of conversation sessions with an idle timeout
+
+    At most `max_sessions` sessions are kept; the least recently used is
+    evicted to make room, and sessions idle for longer than `ttl` seconds
+    are dropped when next looked up or when the store is full.
+    """
+
+    def __init__(self, max_sessions: Optional[int] = None, ttl: Optional[float] = None,
+                 max_turns: Optional[int] = None, max_chars: Optional[int] = None):
+        self.max_sessions = max_sessions or int(os.getenv('SESSION_MAX_COUNT', 1000))
+        self.ttl = ttl or float(os.getenv('SESSION_TTL', 1800))
+        self.max_turns = max_turns or int(os.getenv('SESSION_MAX_TURNS', 20))
+        self.max_chars = max_chars or int(os.getenv('SESSION_MAX_MESSAGE_CHARS', 2000))
+        self._sessions: 'OrderedDict[str, Session]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expired(self, session: Session, now: float) -> bool:
+        return now - session.last_used > self.ttl
+
+    def _purge_expired(self, now: float):
+        # Sessions are in last-used order, so the expired ones are at the front
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if not self._expired(session, now):
+                break
+            del self._sessions[session.id]
+            self.expirations += 1
+
+    def create(self) -> Session:
+        """Start a new session, evicting the least recently used one if the store is full"""
+        session = Session(secrets.token_urlsafe(16), self.max_turns, self.max_chars)
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            while len(self._sessions) >= self.max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                self.evictions += 1
+                logger.debug("Evicted session %s", evicted)
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """Look up a live session and mark it as used"""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if self._expired(session, now):
+                del self._sessions[session_id]
+                self.expirations += 1
+                return None
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'sessions': len(self._sessions),
+            'max_sessions': self.max_sessions,
+            'ttl': self.ttl,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
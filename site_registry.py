@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Type
+
+from rate_limit import TokenBucket
+from wordpress_client import WordPressClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SITE = 'default'
+
+# "which sites ...", "across all my sites", "every site", "each of our blogs"
+_FAN_OUT_RE = re.compile(r'\b(?:all|every|each|which|across|any)\s+(?:of\s+)?(?:(?:my|our|the)\s+)?'
+                         r'(?:sites?|websites?|blogs?)\b', re.IGNORECASE)
+
+
+class SiteConfig:
+    """Connection settings of one WordPress site"""
+
+    def __init__(self, name: str, url: Optional[str], username: Optional[str], password: Optional[str],
+                 rate_limit: Optional[float] = None, burst: Optional[float] = None,
+                 pool_size: Optional[int] = None):
+        self.name = name
+        self.url = url
+        self.username = username
+        self.password = password
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.pool_size = pool_size
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SiteConfig':
+        """Build a config from a sites file entry
+
+        The application password may be given inline as "password" or, to
+        keep it out of the file, as "password_env": the name of an
+        environment variable holding it.
+        """
+        missing = [key for key in ('name', 'url', 'username') if not data.get(key)]
+        password = data.get('password') or os.getenv(data.get('password_env') or '')
+        if not password:
+            missing.append('password or password_env')
+        if missing:
+            raise ValueError(f"Site {data.get('name', '?')!r} is missing {', '.join(missing)}")
+        return cls(data['name'], data['url'], data['username'], password,
+                   rate_limit=data.get('rate_limit'), burst=data.get('burst'), pool_size=data.get('pool_size'))
+
+    @classmethod
+    def from_env(cls) -> 'SiteConfig':
+        """The single site configured with WP_URL, WP_USERNAME and WP_APP_PASSWORD"""
+        rate_limit = os.getenv('WP_RATE_LIMIT')
+        burst = os.getenv('WP_RATE_BURST')
+        return cls(DEFAULT_SITE, os.getenv('WP_URL'), os.getenv('WP_USERNAME'), os.getenv('WP_APP_PASSWORD'),
+                   rate_limit=float(rate_limit) if rate_limit else None, burst=float(burst) if burst else None)
+
+    def public(self) -> Dict[str, Any]:
+        """Everything but the credentials"""
+        return {'name': self.name, 'url': self.url, 'rate_limit': self.rate_limit, 'burst': self.burst}
+
+
+class SiteRegistry:
+    """The WordPress sites this service manages, each with its own API client
+
+    Sites come from the JSON file named by WP_SITES_FILE: a list of
+    {"name", "url", "username", "password" or "password_env", "rate_limit",
+    "burst", "pool_size"} objects, or {"default": name, "sites": [...]}.
+    Without it there is one site, "default", configured from WP_URL as
+    before. Each site's client is created on first use and has its own
+    connection pool, response cache and, when rate_limit (requests per
+    second) is set, its own token bucket.
+    """
+
+    def __init__(self, api_class: Type[WordPressClient], path: Optional[str] = None):
+        self.api_class = api_class
+        self.sites: Dict[str, SiteConfig] = {}
+        path = path or os.getenv('WP_SITES_FILE')
+        if path:
+            self.default = self._load(path)
+        else:
+            self.sites[DEFAULT_SITE] = SiteConfig.from_env()
+            self.default = DEFAULT_SITE
+        self._apis: Dict[str, WordPressClient] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, path: str) -> str:
+        with open(path) as f:
+            data = json.load(f)
+        entries = data['sites'] if isinstance(data, dict) else data
+        for entry in entries:
+            config = SiteConfig.from_dict(entry)
+            if config.name in self.sites:
+                raise ValueError(f'Site {config.name!r} is configured twice in {path}')
+            self.sites[config.name] = config
+        if not self.sites:
+            raise ValueError(f'No sites configured in {path}')
+        default = data.get('default') if isinstance(data, dict) else None
+        default = default or os.getenv('WP_DEFAULT_SITE') or next(iter(self.sites))
+        if default not in self.sites:
+            raise ValueError(f'Default site {default!r} is not configured')
+        logger.info("Loaded %d sites from %s", len(self.sites), path)
+        return default
+
+    def names(self) -> List[str]:
+        return list(self.sites)
+
+    def get(self, name: Optional[str] = None) -> WordPressClient:
+        """The API client of a site, the default one when name is None"""
+        name = name or self.default
+        api = self._apis.get(name)
+        if api is not None:
+            return api
+        config = self.sites.get(name)
+        if config is None:
+            raise KeyError(f'Unknown site: {name}')
+        with self._lock:
+            api = self._apis.get(name)
+            if api is None:
+                limiter = TokenBucket(config.rate_limit, config.burst, name=name) if config.rate_limit else None
+                api = self.api_class(wp_url=config.url, wp_username=config.username, wp_password=config.password,
+                                     pool_size=config.pool_size, rate_limiter=limiter)
+                self._apis[name] = api
+        return api
+
+    def resolve(self, text: str, site: Optional[str] = None) -> List[str]:
+        """The sites a request is about
+
+        An explicit site wins, with "*" or "all" meaning every site. Otherwise
+        sites named in the text are used, then phrases such as "which sites"
+        or "across all sites" fan out to every site, and anything else goes
+        to the default site.
+        """
+        if site:
+            if site in ('*', 'all'):
+                return self.names()
+            if site not in self.sites:
+                raise KeyError(f'Unknown site: {site}')
+            return [site]
+        if len(self.sites) == 1:
+            return [self.default]
+        mentioned = [name for name in self.sites if re.search(rf'\b{re.escape(name)}\b', text, re.IGNORECASE)]
+        if mentioned:
+            return mentioned
+        if _FAN_OUT_RE.search(text):
+            return self.names()
+        return [self.default]
+
+    def rebind(self, api_class: Type[WordPressClient]):
+        """Switch existing clients to a reloaded API class, keeping their connections"""
+        self.api_class = api_class
+        for api in self._apis.values():
+            api.__class__ = api_class
+
+    def status(self) -> List[Dict[str, Any]]:
+        sites = []
+        for name, config in self.sites.items():
+            api = self._apis.get(name)
+            limiter = getattr(api, 'rate_limiter', None)
+            sites.append({**config.public(), 'default': name == self.default, 'connected': api is not None,
+                          'rate_limiter': limiter.stats() if limiter is not None else None})
+        return sites
+
+    def close(self):
+        for api in self._apis.values():
+            api.close()
+
+    async def aclose(self):
+        for api in self._apis.values():
+            await api.aclose()
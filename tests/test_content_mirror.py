@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content_mirror import ContentMirror  # noqa: E402
+
+POST = {'id': 1, 'slug': 'hello', 'status': 'publish', 'modified_gmt': '2024-01-01T00:00:00',
+        'title': {'rendered': 'Hello world'}, 'content': {'rendered': '<p>First post</p>'}}
+
+
+@pytest.fixture(params=[True, False], ids=['fts', 'like'])
+def mirror(request, tmp_path):
+    mirror = ContentMirror(api=None, path=str(tmp_path / 'mirror.db'))
+    mirror.has_fts = mirror.has_fts and request.param
+    mirror._upsert('posts', [POST])
+    yield mirror
+    mirror.close()
+
+
+def test_search_finds_words(mirror):
+    assert [item['id'] for item in mirror.search('hello')] == [1]
+
+
+@pytest.mark.parametrize('text', ['', '   ', '\t\n'])
+def test_blank_search_matches_nothing(mirror, text):
+    assert mirror.search(text) == []
+
+
+@pytest.mark.parametrize('text', ['', '   '])
+def test_blank_search_param_is_ignored(mirror, text):
+    assert list(mirror.iter_collection('posts', {'search': text})) == [POST]
@@ -1,56 +1,29 @@
 import requests
+import json
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator
 from datetime import datetime
 import os
-from dotenv import load_dotenv
-load_dotenv()
+from wordpress_client import WordPressClient, WordPressAPIError
 
-class WordPressAPIError(Exception):
-    pass
-
-class WordPressAPI:
-
-    def __init__(self):
-        self.wp_url = os.getenv('WP_URL')
-        self.wp_username = os.getenv('WP_USERNAME')
-        self.wp_password = os.getenv('WP_APP_PASSWORD')
-        if not all([self.wp_url, self.wp_username, self.wp_password]):
-            missing = []
-            if not self.wp_url:
-                missing.append('WP_URL')
-            if not self.wp_username:
-                missing.append('WP_USERNAME')
-            if not self.wp_password:
-                missing.append('WP_APP_PASSWORD')
-            raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
-        logging.debug(f'Initialized WordPress API with URL: {self.wp_url}')
+class WordPressAPI(WordPressClient):
 
     def test_connection(self) -> bool:
         """Test WordPress connection"""
         try:
-            response = requests.get(f'{self.wp_url}/posts', auth=(self.wp_username, self.wp_password), timeout=10)
+            response = self.get(f'{self.wp_url}/posts')
             response.raise_for_status()
             return True
         except Exception as e:
             raise ConnectionError(f'Failed to connect to WordPress: {str(e)}')
 
-    def get_pages(self) -> List[Dict[str, Any]]:
-        """Get all pages"""
-        try:
-            response = requests.get(f'{self.wp_url}/pages', auth=(self.wp_username, self.wp_password), timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logging.error(f'Error getting pages: {str(e)}')
-            raise WordPressAPIError(f'Failed to get pages: {str(e)}')
-
-    def get_post(self, post_id: int) -> Dict[str, Any]:
+    def get_post(self, post_id: int, fields: Optional[List[str]] = None) -> Dict[str, Any]:
         """
     Retrieves a specific post from WordPress by its ID.
 
     Args:
         post_id (int): The ID of the post to retrieve.
+        fields (Optional[List[str]]): Only request these fields of the post.
 
     Returns:
         Dict[str, Any]: The retrieved post data as a dictionary.
@@ -61,10 +34,7 @@ class WordPressAPI:
         KeyError: If the 'id' key is missing from the API response.
     """
         try:
-            url = f'{self.wp_url}/wp-json/wp/v2/posts/{post_id}'
-            response = requests.get(url, auth=(self.wp_username, self.wp_password))
-            response.raise_for_status()
-            post_data = response.json()
+            post_data = self.fetch_item('wp/v2/posts', post_id, fields=fields)
             if 'id' not in post_data:
                 raise KeyError("'id' key missing from API response")
             return post_data
@@ -75,10 +45,13 @@ class WordPressAPI:
             logging.error(f'Invalid API response: {e}')
             raise
 
-    def get_pages(self) -> List[Dict[str, Any]]:
+    def get_pages(self, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """
     Retrieves all pages from the WordPress website.
 
+    Args:
+        fields (Optional[List[str]]): Only request these fields of each page.
+
     Returns:
         List[Dict[str, Any]]: A list of dictionaries representing the pages.
 
@@ -87,15 +60,9 @@ class WordPressAPI:
         WordPressAPIError: If the API response contains an error message.
     """
         try:
-            response = requests.get(f'{self.wp_url}/wp-json/wp/v2/pages', auth=(self.wp_username, self.wp_password))
-            if response.status_code == 200:
-                pages = response.json()
-                logging.info(f'Successfully retrieved {len(pages)} pages from {self.wp_url}')
-                return pages
-            else:
-                error_message = f'Failed to retrieve pages. Status code: {response.status_code}'
-                logging.error(error_message)
-                raise WordPressAPIError(error_message)
+            pages = list(self.iter_pages(fields=fields))
+            logging.info(f'Successfully retrieved {len(pages)} pages from {self.wp_url}')
+            return pages
         except requests.exceptions.RequestException as e:
             error_message = f'An error occurred while making the API request: {str(e)}'
             logging.exception(error_message)
@@ -107,4 +74,8 @@ class WordPressAPI:
         except Exception as e:
             error_message = f'An unexpected error occurred: {str(e)}'
             logging.exception(error_message)
-            raise
\ No newline at end of file
+            raise
+
+    def iter_pages(self, fields: Optional[List[str]] = None, **params) -> Iterator[Dict[str, Any]]:
+        """Yield every page across all result pages, fetching them concurrently"""
+        return self.iter_collection('wp/v2/pages', params=params, fields=fields)
\ No newline at end of file
@@ -0,0 +1,670 @@
+import asyncio
+import functools
+import logging
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+from content_mirror import ContentMirror
+from json_stream import aiter_json_array, iter_json_array
+from media_stream import MEDIA_CHUNK_SIZE, FileChunks, Progress, content_disposition, media_content_type
+from metrics import record_wordpress
+from rate_limit import TokenBucket
+from response_cache import CachedResponse, ResponseCache, cache_key, resource_family
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Methods whose success makes cached reads of the same resource family stale
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+# WordPress caps per_page at 100 for core collection endpoints
+MAX_PER_PAGE = 100
+
+# Maximum number of requests the /batch/v1 endpoint accepts at once
+MAX_BATCH_SIZE = 25
+
+# Read size when decoding streamed collection bodies
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _response_size(headers, content: Optional[bytes]) -> Optional[int]:
+    """Bytes received for a response: Content-Length, or the body if it was already read"""
+    length = headers.get('Content-Length')
+    if length and length.isdigit():
+        return int(length)
+    return len(content) if content is not None else None
+
+
+class _PrefixedBody:
+    """Stand-in for a response's raw stream that replays chunks already read before the rest"""
+
+    def __init__(self, chunks: List[bytes], rest: Iterator[bytes], raw):
+        self._chunks = deque(chunks)
+        self._rest = rest
+        self._raw = raw
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        if self._chunks:
+            return self._chunks.popleft()
+        return next(self._rest, b'')
+
+    def close(self):
+        self._raw.close()
+
+    def release_conn(self):
+        release_conn = getattr(self._raw, 'release_conn', None)
+        if release_conn is not None:
+            release_conn()
+
+
+def _buffer_body(response: requests.Response, limit: int) -> bool:
+    """Read a streamed body into the response if it is at most `limit` bytes
+
+    A larger body is left to stream: what was read is replayed before the
+    rest, so at most `limit` bytes plus one chunk are ever held.
+    """
+    chunks, size = [], 0
+    body = response.iter_content(STREAM_CHUNK_SIZE)
+    for chunk in body:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > limit:
+            response.raw = _PrefixedBody(chunks, body, response.raw)
+            return False
+    response._content = b''.join(chunks)
+    return True
+
+
+class _PrefixedAsyncStream(httpx.AsyncByteStream):
+    """Async counterpart of _PrefixedBody: decoded chunks already read, then the rest of the body"""
+
+    def __init__(self, chunks: List[bytes], rest: AsyncIterator[bytes], response: httpx.Response):
+        self._chunks = chunks
+        self._rest = rest
+        self._response = response
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for chunk in self._chunks:
+            yield chunk
+        async for chunk in self._rest:
+            yield chunk
+
+    async def aclose(self):
+        await self._response.aclose()
+
+
+async def _abuffer_body(response: httpx.Response, limit: int) -> Tuple[bool, httpx.Response]:
+    """Async counterpart of _buffer_body(), returning the response to use from then on
+
+    httpx cannot replay a body it has begun to decode, so a larger body comes
+    back as a new response that streams what was read before the rest.
+    """
+    chunks, size = [], 0
+    body = response.aiter_bytes(STREAM_CHUNK_SIZE)
+    async for chunk in body:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > limit:
+            # The chunks are decoded already
+            headers = [(name, value) for name, value in response.headers.multi_items()
+                       if name.lower() not in ('content-encoding', 'content-length')]
+            return False, httpx.Response(response.status_code, headers=headers, request=response.request,
+                                         stream=_PrefixedAsyncStream(chunks, body, response))
+    response._content = b''.join(chunks)
+    return True, response
+
+
+def fields_param(fields: Optional[List[str]]) -> Optional[str]:
+    """Build a _fields value; 'id' is always kept so items stay addressable"""
+    if not fields:
+        return None
+    return ','.join(dict.fromkeys(['id', *fields]))
+
+
+class WordPressAPIError(Exception):
+    def __init__(self, message: str = '', status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class WordPressClient:
+    """Connection settings and the pooled HTTP session shared by every WordPressAPI method"""
+
+    def __init__(self, wp_url: Optional[str] = None, wp_username: Optional[str] = None,
+                 wp_password: Optional[str] = None, pool_size: Optional[int] = None,
+                 max_retries: Optional[int] = None, timeout: Optional[float] = None,
+                 rate_limiter: Optional[TokenBucket] = None):
+        self.wp_url = wp_url or os.getenv('WP_URL')
+        self.wp_username = wp_username or os.getenv('WP_USERNAME')
+        self.wp_password = wp_password or os.getenv('WP_APP_PASSWORD')
+        if not all([self.wp_url, self.wp_username, self.wp_password]):
+            missing = []
+            if not self.wp_url:
+                missing.append('WP_URL')
+            if not self.wp_username:
+                missing.append('WP_USERNAME')
+            if not self.wp_password:
+                missing.append('WP_APP_PASSWORD')
+            raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
+
+        self.timeout = timeout if timeout is not None else float(os.getenv('WP_TIMEOUT', 10))
+        self.pool_size = pool_size if pool_size is not None else int(os.getenv('WP_POOL_SIZE', 20))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('WP_MAX_RETRIES', 3))
+        self.page_concurrency = int(os.getenv('WP_PAGE_CONCURRENCY', 4))
+        # Uploads end with WordPress generating image sizes, which can outlast the usual timeout
+        self.media_timeout = float(os.getenv('WP_MEDIA_TIMEOUT', 120))
+        self.media_concurrency = int(os.getenv('WP_MEDIA_CONCURRENCY', 3))
+        self.media_chunk_size = int(os.getenv('WP_MEDIA_CHUNK_KB', MEDIA_CHUNK_SIZE // 1024)) * 1024
+        self.session = self._build_session()
+        self.cache = self._build_cache()
+        # Optional local SQLite copy of the site's content, attached with attach_mirror()
+        self.mirror: Optional[ContentMirror] = None
+        # Requests wait for a token from this bucket when the site sets a rate limit
+        self.rate_limiter = rate_limiter
+        self._async_client: Optional[httpx.AsyncClient] = None
+        logger.debug('Initialized WordPress API with URL: %s', self.wp_url)
+
+    def _build_session(self) -> requests.Session:
+        """Create a keep-alive session with a bounded connection pool and retry policy"""
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=float(os.getenv('WP_RETRY_BACKOFF', 0.5)),
+            status_forcelist=RETRY_STATUS_CODES,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        # pool_block makes bursts wait for a pooled connection instead of
+        # opening throwaway sockets that pile up in TIME_WAIT
+        adapter = HTTPAdapter(
+            pool_connections=int(os.getenv('WP_POOL_HOSTS', 4)),
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+            pool_block=os.getenv('WP_POOL_BLOCK', 'true').lower() == 'true'
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.auth = (self.wp_username, self.wp_password)
+        session.headers.update({'Accept': 'application/json'})
+        return session
+
+    def _build_cache(self) -> Optional[ResponseCache]:
+        """Create the conditional-request cache, or None when WP_CACHE_ENTRIES is 0"""
+        max_entries = int(os.getenv('WP_CACHE_ENTRIES', 512))
+        if max_entries <= 0:
+            return None
+        ttl = os.getenv('WP_CACHE_TTL')
+        return ResponseCache(
+            max_entries=max_entries,
+            max_bytes=int(float(os.getenv('WP_CACHE_MAX_MB', 64)) * 1024 * 1024),
+            ttl=float(ttl) if ttl else None,
+            max_entry_bytes=int(float(os.getenv('WP_CACHE_MAX_ENTRY_KB', 1024)) * 1024)
+        )
+
+    def attach_mirror(self, mirror: ContentMirror):
+        """Serve collection reads from a local content mirror while it is fresh"""
+        self.mirror = mirror
+
+    def _invalidate(self, url: str):
+        """Forget cached and mirrored copies of the resource family behind url"""
+        if self.cache is not None:
+            self.cache.invalidate(url)
+        if self.mirror is not None:
+            self.mirror.mark_stale(url)
+
+    def rest_url(self, route: str) -> str:
+        """Build a REST API URL from a route such as 'wp/v2/posts'
+
+        WP_URL may point at the site root or at the REST API itself, so both
+        'https://example.com' and 'https://example.com/wp-json/wp/v2' work.
+        Absolute URLs are returned unchanged.
+        """
+        if route.startswith(('http://', 'https://')):
+            return route
+        base = self.wp_url.rstrip('/')
+        if '/wp-json' in base:
+            base = base[:base.index('/wp-json')]
+        return f"{base}/wp-json/{route.lstrip('/')}"
+
+    def request(self, method: str, route: str, **kwargs) -> requests.Response:
+        """Send a request through the pooled session with the default timeout
+
+        GETs are answered from the response cache when possible, and writes
+        invalidate cached reads of the same resource family. With stream=True
+        a body too large to cache is left unread for the caller to stream;
+        one of unknown length is read up to the cache's entry limit, and
+        streams on from there if it turns out larger.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        method = method.upper()
+        url = self.rest_url(route)
+        if method == 'GET' and self.cache is not None:
+            return self._cached_get(url, **kwargs)
+        response = self._send(method, url, **kwargs)
+        if method in WRITE_METHODS:
+            self._invalidate(url)
+        return response
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send one request through the pooled session, recording its timing, status and size"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            record_wordpress(method, resource_family(url), 'error', time.perf_counter() - start, None)
+            raise
+        body = None if kwargs.get('stream') else response.content
+        record_wordpress(method, resource_family(url), response.status_code, time.perf_counter() - start,
+                         _response_size(response.headers, body))
+        return response
+
+    def _cached_get(self, url: str, **kwargs) -> requests.Response:
+        key = cache_key(url, kwargs.get('params'))
+        entry, fresh = self.cache.lookup(key)
+        if fresh:
+            return self._cached_response(entry)
+        if entry is not None:
+            kwargs['headers'] = {**entry.validators(), **(kwargs.get('headers') or {})}
+
+        response = self._send('GET', url, **kwargs)
+        if entry is not None:
+            if response.status_code == 304:
+                self.cache.revalidated(key, entry, response.headers)
+                response.close()
+                return self._cached_response(entry)
+            self.cache.record_miss()
+        if response.status_code == 200:
+            accepts = self.cache.accepts(response.headers) if kwargs.get('stream') else True
+            if accepts is None:
+                # No usable Content-Length: find out whether the body fits by reading up to the limit
+                accepts = _buffer_body(response, self.cache.max_entry_bytes)
+            if accepts:
+                self.cache.store(key, url, response.content, response.headers)
+        return response
+
+    @staticmethod
+    def _cached_response(entry: CachedResponse) -> requests.Response:
+        """Rebuild a 200 response from a cache entry"""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = entry.url
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response._content = entry.content
+        response._content_consumed = True
+        return response
+
+    def get(self, route: str, **kwargs) -> requests.Response:
+        return self.request('GET', route, **kwargs)
+
+    def post(self, route: str, **kwargs) -> requests.Response:
+        return self.request('POST', route, **kwargs)
+
+    def put(self, route: str, **kwargs) -> requests.Response:
+        return self.request('PUT', route, **kwargs)
+
+    def delete(self, route: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', route, **kwargs)
+
+    def close(self):
+        """Release pooled connections"""
+        self.session.close()
+
+    def _fetch_page(self, route: str, params: Dict[str, Any], page: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Fetch one page of a collection and return its items and the total page count
+
+        Uncached bodies are decoded item by item as they arrive instead of
+        being read into memory whole and parsed with response.json().
+        """
+        with self.get(route, params={**params, 'page': page}, stream=True) as response:
+            if response.status_code != 200:
+                raise WordPressAPIError(f'Failed to fetch page {page} of {route}. Status code: {response.status_code}',
+                                        status_code=response.status_code)
+            items = list(iter_json_array(response.iter_content(STREAM_CHUNK_SIZE)))
+            return items, int(response.headers.get('X-WP-TotalPages', 1))
+
+    def _mirrored(self, route: str, params: Optional[Dict[str, Any]]) -> Optional[Iterator[Dict[str, Any]]]:
+        """Items for a collection query from the content mirror, or None if it cannot answer it"""
+        if self.mirror is None:
+            return None
+        kind = self.mirror.serves(route, params)
+        if kind is None:
+            return None
+        logger.debug("Serving %s from the content mirror", route)
+        return self.mirror.iter_collection(kind, params)
+
+    def fetch_item(self, collection: str, item_id: int, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Fetch one item such as post 5 of 'wp/v2/posts', from the mirror when it is fresh
+
+        With `fields`, only those top-level fields (plus 'id') are requested.
+        """
+        projection = fields_param(fields)
+        if self.mirror is not None:
+            kind = self.mirror.serves(collection)
+            item = self.mirror.get(kind, item_id) if kind else None
+            if item is not None:
+                if projection:
+                    wanted = projection.split(',')
+                    item = {key: value for key, value in item.items() if key in wanted}
+                return item
+        params = {'_fields': projection} if projection else None
+        response = self.get(f"{collection.rstrip('/')}/{item_id}", params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def iter_collection(self, route: str, params: Optional[Dict[str, Any]] = None,
+                        per_page: int = MAX_PER_PAGE, concurrency: Optional[int] = None,
+                        use_mirror: bool = True, fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield every item of a paginated collection such as 'wp/v2/pages'
+
+        With `fields`, WordPress is asked for only those top-level fields
+        (plus 'id') via _fields, which drops rendered content, _links and
+        meta from the response. Queries the content mirror can answer are
+        served locally. Otherwise
+        page 1 is fetched first to learn X-WP-TotalPages, then the remaining
+        pages are fetched in parallel with at most `concurrency` requests in
+        flight. Items are yielded in page order as soon as each page arrives,
+        so only a bounded window of pages is ever held in memory.
+        """
+        if fields:
+            params = {**(params or {}), '_fields': fields_param(fields)}
+        mirrored = self._mirrored(route, params) if use_mirror else None
+        if mirrored is not None:
+            yield from mirrored
+            return
+        params = {**(params or {}), 'per_page': min(per_page, MAX_PER_PAGE)}
+        concurrency = concurrency or self.page_concurrency
+        items, total_pages = self._fetch_page(route, params, 1)
+        yield from items
+        if total_pages <= 1:
+            return
+
+        remaining = iter(range(2, total_pages + 1))
+        with ThreadPoolExecutor(max_workers=min(concurrency, total_pages - 1)) as pool:
+            pending = deque(pool.submit(self._fetch_page, route, params, page)
+                            for _, page in zip(range(concurrency), remaining))
+            try:
+                while pending:
+                    items, _ = pending.popleft().result()
+                    next_page = next(remaining, None)
+                    if next_page is not None:
+                        pending.append(pool.submit(self._fetch_page, route, params, next_page))
+                    yield from items
+            finally:
+                # Stop fetching if the caller abandons the iterator early
+                for future in pending:
+                    future.cancel()
+
+    def batch(self, operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Send up to 25 write operations through WordPress's /batch/v1 endpoint
+
+        Each operation is a dict with 'method' (POST, PUT, PATCH or DELETE),
+        'path' (a route such as 'wp/v2/posts/5') and an optional 'body'.
+        Returns one {'status', 'body'} dict per operation, in order. Raises
+        WordPressAPIError if the batch as a whole is rejected, e.g. with a 404
+        on sites older than WordPress 5.6.
+        """
+        if len(operations) > MAX_BATCH_SIZE:
+            raise ValueError(f'A batch can hold at most {MAX_BATCH_SIZE} operations')
+        requests_payload = []
+        for operation in operations:
+            requests_payload.append({
+                'method': operation.get('method', 'POST').upper(),
+                'path': '/' + operation['path'].split('/wp-json/')[-1].lstrip('/'),
+                'body': operation.get('body') or {}
+            })
+        response = self.post('batch/v1', json={'validation': 'normal', 'requests': requests_payload})
+        if response.status_code not in (200, 207):
+            raise WordPressAPIError(f'Batch request failed. Status code: {response.status_code}',
+                                    status_code=response.status_code)
+        for operation in requests_payload:
+            self._invalidate(self.rest_url(operation['path']))
+        responses = response.json().get('responses', [])
+        return [{'status': item.get('status'), 'body': item.get('body')} for item in responses]
+
+    def upload_media(self, path: str, filename: Optional[str] = None, content_type: Optional[str] = None,
+                     progress: Optional[Progress] = None, **fields) -> Dict[str, Any]:
+        """Upload a file to the media library and return the new attachment
+
+        The file is streamed from disk in fixed-size chunks, so memory use
+        does not grow with its size. `filename` and `content_type` default
+        to the file's own name and the type guessed from it; further
+        attachment fields such as title, alt_text or caption go along as
+        query parameters. `progress` is called with (bytes sent, total
+        bytes) after every chunk.
+        """
+        filename = filename or os.path.basename(path)
+        body = FileChunks(path, self.media_chunk_size, progress)
+        headers = {'Content-Disposition': content_disposition(filename),
+                   'Content-Type': content_type or media_content_type(filename)}
+        logger.debug('Uploading %s (%d bytes) as %s', path, len(body), filename)
+        response = self.post('wp/v2/media', data=body, headers=headers, params=fields or None,
+                             timeout=self.media_timeout)
+        if response.status_code != 201:
+            raise WordPressAPIError(f'Failed to upload {filename}. Status code: {response.status_code}',
+                                    status_code=response.status_code)
+        return response.json()
+
+    def upload_media_many(self, paths: List[str], concurrency: Optional[int] = None,
+                          progress: Optional[Callable[[str, int, int], None]] = None,
+                          **fields) -> List[Dict[str, Any]]:
+        """Upload several files with at most `concurrency` uploads in flight
+
+        Returns the attachments in the order of `paths`. A failed upload does
+        not stop the others; the first failure is raised once they are all
+        done. `progress` is called with (path, bytes sent, total bytes).
+        """
+        concurrency = concurrency or self.media_concurrency
+
+        def upload(path: str) -> Dict[str, Any]:
+            return self.upload_media(path, progress=functools.partial(progress, path) if progress else None,
+                                     **fields)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(paths)))) as pool:
+            futures = [pool.submit(upload, path) for path in paths]
+        return [future.result() for future in futures]
+
+    def download_media(self, media: Union[int, str], destination: str, progress: Optional[Progress] = None) -> str:
+        """Download an attachment, given by ID or source URL, to `destination` and return the path
+
+        The body is written to disk chunk by chunk and moved into place once
+        complete, so a failed download never leaves a truncated file behind.
+        `progress` is called with (bytes received, total bytes, or 0 if unknown).
+        """
+        url = media
+        if not isinstance(media, str):
+            url = self.fetch_item('wp/v2/media', media, fields=['source_url'])['source_url']
+        temp_name = f'{destination}.part'
+        # Straight to the session: media bodies have no place in the response cache
+        with self._send('GET', url, stream=True, timeout=self.media_timeout) as response:
+            if response.status_code != 200:
+                raise WordPressAPIError(f'Failed to download {url}. Status code: {response.status_code}',
+                                        status_code=response.status_code)
+            total = int(response.headers.get('Content-Length') or 0)
+            received = 0
+            try:
+                with open(temp_name, 'wb') as f:
+                    for chunk in response.iter_content(self.media_chunk_size):
+                        f.write(chunk)
+                        received += len(chunk)
+                        if progress is not None:
+                            progress(received, total)
+                os.replace(temp_name, destination)
+            except BaseException:
+                if os.path.exists(temp_name):
+                    os.remove(temp_name)
+                raise
+        return destination
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Lazily created httpx client mirroring the sync session's pool and auth"""
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(
+                auth=(self.wp_username, self.wp_password),
+                headers={'Accept': 'application/json'},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size),
+                transport=httpx.AsyncHTTPTransport(retries=self.max_retries)
+            )
+        return self._async_client
+
+    async def arequest(self, method: str, route: str, **kwargs) -> httpx.Response:
+        """Async counterpart of request() with the same caching and retry policy
+
+        With stream=True the body is left unread, as with request(), and the
+        caller must close the response (await response.aclose()).
+        """
+        method = method.upper()
+        url = self.rest_url(route)
+        if method == 'GET' and self.cache is not None:
+            return await self._acached_get(url, **kwargs)
+        response = await self._asend(method, url, **kwargs)
+        if method in WRITE_METHODS:
+            self._invalidate(url)
+        return response
+
+    async def _acached_get(self, url: str, **kwargs) -> httpx.Response:
+        key = cache_key(url, kwargs.get('params'))
+        entry, fresh = self.cache.lookup(key)
+        if fresh:
+            return self._acached_response(entry)
+        if entry is not None:
+            kwargs['headers'] = {**entry.validators(), **(kwargs.get('headers') or {})}
+
+        response = await self._asend('GET', url, **kwargs)
+        if entry is not None:
+            if response.status_code == 304:
+                self.cache.revalidated(key, entry, response.headers)
+                await response.aclose()
+                return self._acached_response(entry)
+            self.cache.record_miss()
+        if response.status_code == 200:
+            accepts = self.cache.accepts(response.headers) if kwargs.get('stream') else True
+            if accepts is None:
+                # No usable Content-Length: find out whether the body fits by reading up to the limit
+                accepts, response = await _abuffer_body(response, self.cache.max_entry_bytes)
+            elif accepts and kwargs.get('stream'):
+                await response.aread()
+            if accepts:
+                self.cache.store(key, url, response.content, response.headers)
+        return response
+
+    @staticmethod
+    def _acached_response(entry: CachedResponse) -> httpx.Response:
+        return httpx.Response(200, headers=entry.headers, content=entry.content,
+                              request=httpx.Request('GET', entry.url))
+
+    async def _asend(self, method: str, url: str, stream: bool = False, **kwargs) -> httpx.Response:
+        """Send one request, retrying idempotent methods on 429/5xx with jittered backoff
+
+        With `stream`, the body of the returned response is left unread.
+        """
+        backoff = float(os.getenv('WP_RETRY_BACKOFF', 0.5))
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async()
+            start = time.perf_counter()
+            try:
+                if stream:
+                    request = self.async_client.build_request(method, url, **kwargs)
+                    response = await self.async_client.send(request, stream=True)
+                else:
+                    response = await self.async_client.request(method, url, **kwargs)
+            except httpx.HTTPError:
+                record_wordpress(method, resource_family(url), 'error', time.perf_counter() - start, None)
+                raise
+            record_wordpress(method, resource_family(url), response.status_code, time.perf_counter() - start,
+                             _response_size(response.headers, None if stream else response.content))
+            retryable = method != 'POST' and response.status_code in RETRY_STATUS_CODES
+            if not retryable or attempt >= self.max_retries:
+                return response
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                delay = float(retry_after)
+            else:
+                delay = backoff * (2 ** attempt) * (0.5 + random.random())
+            logger.debug('%s %s returned %d, retrying in %.2fs', method, url, response.status_code, delay)
+            await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aget(self, route: str, **kwargs) -> httpx.Response:
+        return await self.arequest('GET', route, **kwargs)
+
+    async def apost(self, route: str, **kwargs) -> httpx.Response:
+        return await self.arequest('POST', route, **kwargs)
+
+    async def aput(self, route: str, **kwargs) -> httpx.Response:
+        return await self.arequest('PUT', route, **kwargs)
+
+    async def adelete(self, route: str, **kwargs) -> httpx.Response:
+        return await self.arequest('DELETE', route, **kwargs)
+
+    async def _afetch_page(self, route: str, params: Dict[str, Any], page: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Async counterpart of _fetch_page(), decoding uncached bodies item by item as they arrive"""
+        response = await self.aget(route, params={**params, 'page': page}, stream=True)
+        try:
+            if response.status_code != 200:
+                raise WordPressAPIError(f'Failed to fetch page {page} of {route}. Status code: {response.status_code}',
+                                        status_code=response.status_code)
+            items = [item async for item in aiter_json_array(response.aiter_bytes(STREAM_CHUNK_SIZE))]
+            return items, int(response.headers.get('X-WP-TotalPages', 1))
+        finally:
+            await response.aclose()
+
+    async def aiter_collection(self, route: str, params: Optional[Dict[str, Any]] = None,
+                               per_page: int = MAX_PER_PAGE, concurrency: Optional[int] = None,
+                               use_mirror: bool = True,
+                               fields: Optional[List[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Async counterpart of iter_collection()"""
+        if fields:
+            params = {**(params or {}), '_fields': fields_param(fields)}
+        mirrored = self._mirrored(route, params) if use_mirror else None
+        if mirrored is not None:
+            for item in mirrored:
+                yield item
+            return
+        params = {**(params or {}), 'per_page': min(per_page, MAX_PER_PAGE)}
+        concurrency = concurrency or self.page_concurrency
+        items, total_pages = await self._afetch_page(route, params, 1)
+        for item in items:
+            yield item
+        if total_pages <= 1:
+            return
+
+        remaining = iter(range(2, total_pages + 1))
+        pending = deque(asyncio.ensure_future(self._afetch_page(route, params, page))
+                        for _, page in zip(range(concurrency), remaining))
+        try:
+            while pending:
+                items, _ = await pending.popleft()
+                next_page = next(remaining, None)
+                if next_page is not None:
+                    pending.append(asyncio.ensure_future(self._afetch_page(route, params, next_page)))
+                for item in items:
+                    yield item
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def aclose(self):
+        """Release pooled connections of the async client"""
+        if self._async_client is not None:
+            await self._async_client.aclose()